@@ -1,10 +1,18 @@
 import os
-import sqlite3
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_from_directory, Response
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, g
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from main import YOLOv8System, check_lfs_files, STREAM_STATS
+from main import YOLOv8System, check_lfs_files, STATS_HUB
+from stream_broker import StreamBroker
+from frame_encoder import parse_profiles
+from startup import ComponentLoader
+from database import DetectionDatabase
+from artifact_store import ArtifactStore
+from pipeline import ACTIVE_PIPELINES
+from inference_pool import PoolBusy, PoolFailed
+from video_jobs import VideoJobQueue, JobQueueFull
+from motion_gate import parse_roi, load_rois
+from instrumentation import REGISTRY, REQUEST_SECONDS, gauge, log_event
 import sys
 import json
 import time
@@ -21,6 +29,82 @@ RESULTS_FOLDER = os.path.join(BASE_DIR, 'results')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULTS_FOLDER'] = RESULTS_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max upload setup
+# /api/batch-detect: images per forward pass and parallel decode threads
+app.config['BATCH_INFERENCE_SIZE'] = int(os.environ.get('BATCH_INFERENCE_SIZE', 8))
+app.config['BATCH_DECODE_WORKERS'] = int(os.environ.get('BATCH_DECODE_WORKERS', 4))
+# MJPEG streams: run capture / inference / encode as overlapping stages, and how many frames each stage may buffer
+app.config['STREAM_PIPELINED'] = os.environ.get('STREAM_PIPELINED', '1') == '1'
+app.config['STREAM_QUEUE_DEPTH'] = int(os.environ.get('STREAM_QUEUE_DEPTH', 2))
+# Adaptive frame skipping: seconds of video to process per wall-clock second, and the largest allowed stride
+app.config['STREAM_TARGET_RTF'] = float(os.environ.get('STREAM_TARGET_RTF', 1.0))
+app.config['STREAM_MAX_STRIDE'] = int(os.environ.get('STREAM_MAX_STRIDE', 8))
+# MJPEG output ladder, name=max_width:jpeg_quality (width 0 = source size); viewers pick one with ?profile=
+app.config['STREAM_PROFILES'] = parse_profiles(os.environ.get('STREAM_PROFILES', 'full=0:95,hd=1280:80,sd=640:70'))
+app.config['STREAM_DEFAULT_PROFILE'] = os.environ.get('STREAM_DEFAULT_PROFILE', 'full')
+# "auto" uses libjpeg-turbo (PyTurboJPEG) when installed, "0" forces cv2.imencode
+app.config['STREAM_TURBOJPEG'] = os.environ.get('STREAM_TURBOJPEG', 'auto')
+
+# Motion gate: stream frames where less than MOTION_GATE_MIN_CHANGED of the ROI changed reuse the last
+# detections instead of running the model; a forward pass is forced every MOTION_GATE_MAX_SKIP frames
+app.config['MOTION_GATE'] = os.environ.get('MOTION_GATE', '0') == '1'
+app.config['MOTION_GATE_MIN_CHANGED'] = float(os.environ.get('MOTION_GATE_MIN_CHANGED', 0.002))
+app.config['MOTION_GATE_PIXEL_THRESHOLD'] = int(os.environ.get('MOTION_GATE_PIXEL_THRESHOLD', 25))
+app.config['MOTION_GATE_MAX_SKIP'] = int(os.environ.get('MOTION_GATE_MAX_SKIP', 30))
+# ROI polygons in relative coordinates, "x,y x,y x,y; ..." for every stream, or a JSON file of
+# {"<video file name>": "<polygons>", "*": "<default>"} for per-camera masks
+app.config['MOTION_GATE_ROI'] = os.environ.get('MOTION_GATE_ROI', '')
+app.config['MOTION_GATE_ROI_FILE'] = os.environ.get('MOTION_GATE_ROI_FILE')
+
+# Background EasyOCR workers for plates seen in video streams, and how many crops may wait for them
+app.config['OCR_WORKERS'] = int(os.environ.get('OCR_WORKERS', 1))
+app.config['OCR_QUEUE_SIZE'] = int(os.environ.get('OCR_QUEUE_SIZE', 32))
+# Max plate crops whose OCR text is remembered (0 disables the cache)
+app.config['OCR_CACHE_SIZE'] = int(os.environ.get('OCR_CACHE_SIZE', 256))
+
+# /api/stream-stats: how often queue/FPS telemetry may refresh, and the idle keepalive interval
+app.config['SSE_REFRESH_S'] = float(os.environ.get('SSE_REFRESH_S', 1.0))
+app.config['SSE_KEEPALIVE_S'] = float(os.environ.get('SSE_KEEPALIVE_S', 15.0))
+
+# /api/analytics/history/page: default and maximum rows per page
+app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('HISTORY_PAGE_SIZE', 25))
+app.config['HISTORY_MAX_PAGE_SIZE'] = int(os.environ.get('HISTORY_MAX_PAGE_SIZE', 200))
+# SQLite connections shared by all request threads; a request waits for one when all are in use
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 8))
+# Disk budget for results/ (0 = unlimited); the oldest files are evicted first
+app.config['RESULTS_MAX_MB'] = int(os.environ.get('RESULTS_MAX_MB', 0))
+app.config['RESULTS_MAX_AGE_HOURS'] = float(os.environ.get('RESULTS_MAX_AGE_HOURS', 0))
+app.config['ARTIFACT_WRITERS'] = int(os.environ.get('ARTIFACT_WRITERS', 1))
+# Keep a copy of uploaded images in uploads/ (written in the background); clients can opt out with ?persist=0
+app.config['PERSIST_UPLOADS'] = os.environ.get('PERSIST_UPLOADS', '1') == '1'
+# How the model and OCR reader load: "background" (parallel threads, serve health checks meanwhile),
+# "eager" (block at import until loaded) or "lazy" (on first use, no warm-up)
+app.config['STARTUP_MODE'] = os.environ.get('STARTUP_MODE', 'background')
+# Dummy inferences run before the app reports ready (0 = no warm-up)
+app.config['WARMUP_RUNS'] = int(os.environ.get('WARMUP_RUNS', 1))
+# "pytorch", "onnx" (onnxruntime), "openvino", "onnx-int8" or "openvino-int8"; exports are cached in backend/engine_cache/
+app.config['INFERENCE_ENGINE'] = os.environ.get('INFERENCE_ENGINE', 'pytorch')
+app.config['INFERENCE_IMGSZ'] = int(os.environ.get('INFERENCE_IMGSZ', 640))
+# Folder of representative images, only needed the first time an INT8 engine is built
+app.config['QUANT_CALIBRATION_DIR'] = os.environ.get('QUANT_CALIBRATION_DIR')
+# Inference worker processes, each with its own model (0 = run the model in this process)
+app.config['INFERENCE_WORKERS'] = int(os.environ.get('INFERENCE_WORKERS', 0))
+# Frames each worker may have queued, the shared-memory size of one frame slot, and torch threads
+# per worker (0 = cores / workers)
+app.config['INFERENCE_SLOTS_PER_WORKER'] = int(os.environ.get('INFERENCE_SLOTS_PER_WORKER', 2))
+app.config['INFERENCE_SLOT_MB'] = int(os.environ.get('INFERENCE_SLOT_MB', 8))
+app.config['INFERENCE_THREADS_PER_WORKER'] = int(os.environ.get('INFERENCE_THREADS_PER_WORKER', 0))
+# How long /detect and /api/batch-detect wait for a free worker slot before answering 503
+app.config['INFERENCE_SUBMIT_TIMEOUT_S'] = float(os.environ.get('INFERENCE_SUBMIT_TIMEOUT_S', 10.0))
+# Offline video jobs (/api/video-jobs): videos processed at once, and how many may wait for them
+app.config['VIDEO_JOB_WORKERS'] = int(os.environ.get('VIDEO_JOB_WORKERS', 1))
+app.config['VIDEO_JOB_QUEUE_SIZE'] = int(os.environ.get('VIDEO_JOB_QUEUE_SIZE', 8))
+# Long videos are split into chunks processed by this many processes in parallel (1 = no splitting);
+# chunks are at least VIDEO_CHUNK_MIN_S seconds of video
+app.config['VIDEO_CHUNK_WORKERS'] = int(os.environ.get('VIDEO_CHUNK_WORKERS', 1))
+app.config['VIDEO_CHUNK_MIN_S'] = float(os.environ.get('VIDEO_CHUNK_MIN_S', 120))
+
+# Every startup step is timed; the breakdown is logged once everything has loaded
+startup = ComponentLoader()
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -29,23 +113,19 @@ os.makedirs(RESULTS_FOLDER, exist_ok=True)
 # Database Initialization
 DB_PATH = os.path.join(BASE_DIR, 'traffic_data.db')
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS detections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            status_text TEXT NOT NULL,
-            plate_text TEXT,
-            result_url TEXT,
-            plate_url TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_db()
+# Creates the schema and switches the file to WAL; requests share a bounded pool of connections
+with startup.timed("database"):
+    db = DetectionDatabase(DB_PATH, pool_size=app.config['DB_POOL_SIZE'])
+
+# Result images are written in the background; evicted files are unlinked from their DB rows
+with startup.timed("artifacts"):
+    artifacts = ArtifactStore(RESULTS_FOLDER,
+                              max_bytes=app.config['RESULTS_MAX_MB'] * 1024 * 1024,
+                              max_age_s=app.config['RESULTS_MAX_AGE_HOURS'] * 3600,
+                              workers=app.config['ARTIFACT_WRITERS'],
+                              on_evict=db.clear_artifact_urls)
+    # Uploaded originals are decoded from memory; keeping a copy on disk is off the request path too
+    uploads = ArtifactStore(UPLOAD_FOLDER, url_prefix="/uploads", workers=app.config['ARTIFACT_WRITERS'])
 
 # Initialize Detection System
 print("[INFO] Initializing Helmet Detection System...")
@@ -54,8 +134,117 @@ if not check_lfs_files():
     print("[ERROR] Model files are missing or invalid (LFS pointers). Please download real weights.")
     sys.exit(1)
 
-system = YOLOv8System()
-print("[INFO] System Ready.")
+motion_gate = None
+if app.config['MOTION_GATE']:
+    rois = load_rois(app.config['MOTION_GATE_ROI_FILE']) if app.config['MOTION_GATE_ROI_FILE'] else {}
+    if app.config['MOTION_GATE_ROI']:
+        rois.setdefault('*', parse_roi(app.config['MOTION_GATE_ROI']))
+    motion_gate = {
+        'min_changed': app.config['MOTION_GATE_MIN_CHANGED'],
+        'pixel_threshold': app.config['MOTION_GATE_PIXEL_THRESHOLD'],
+        'max_skip': app.config['MOTION_GATE_MAX_SKIP'],
+        'rois': rois,
+    }
+
+system = YOLOv8System(ocr_workers=app.config['OCR_WORKERS'], ocr_queue_size=app.config['OCR_QUEUE_SIZE'],
+                      ocr_cache_size=app.config['OCR_CACHE_SIZE'], artifact_store=artifacts,
+                      jpeg_turbo=app.config['STREAM_TURBOJPEG'], loader=startup,
+                      warmup_runs=0 if app.config['STARTUP_MODE'] == 'lazy' else app.config['WARMUP_RUNS'],
+                      engine=app.config['INFERENCE_ENGINE'], imgsz=app.config['INFERENCE_IMGSZ'],
+                      calibration_dir=app.config['QUANT_CALIBRATION_DIR'],
+                      inference_workers=app.config['INFERENCE_WORKERS'],
+                      pool_options={
+                          'slots_per_worker': app.config['INFERENCE_SLOTS_PER_WORKER'],
+                          'slot_bytes': app.config['INFERENCE_SLOT_MB'] * 1024 * 1024,
+                          'threads_per_worker': app.config['INFERENCE_THREADS_PER_WORKER'],
+                          'submit_timeout': app.config['INFERENCE_SUBMIT_TIMEOUT_S'],
+                      },
+                      motion_gate=motion_gate)
+# One producer per video source, shared by every MJPEG viewer
+broker = StreamBroker()
+# Uploaded videos processed once into an annotated MP4 and a violation ledger
+video_jobs = VideoJobQueue(system, db, workers=app.config['VIDEO_JOB_WORKERS'],
+                           max_pending=app.config['VIDEO_JOB_QUEUE_SIZE'],
+                           chunk_workers=app.config['VIDEO_CHUNK_WORKERS'],
+                           chunk_min_s=app.config['VIDEO_CHUNK_MIN_S'])
+
+if app.config['STARTUP_MODE'] == 'eager':
+    startup.load_all()
+    print("[INFO] System Ready.")
+elif app.config['STARTUP_MODE'] == 'lazy':
+    print("[INFO] System Ready (models load on first use).")
+else:
+    # Requests that need a model before it's loaded simply wait for it
+    startup.start()
+    print("[INFO] Loading models in the background, see /readyz.")
+
+def queue_depths():
+    depths = {("artifact_writes",): artifacts.stats()["pending_writes"]}
+    # Reading the OCR queue must not trigger a lazy load of the reader
+    if startup.is_loaded("ocr"):
+        depths[("ocr",)] = system.plate_detector.ocr_queue_depth()
+    depths[("video_jobs",)] = video_jobs.stats()["pending"]
+    if app.config['INFERENCE_WORKERS'] > 0 and startup.is_loaded("model"):
+        depths[("inference_pool",)] = system.pool.in_flight
+    for pipeline in list(ACTIVE_PIPELINES):
+        for stage, q in list(pipeline.queues.items()) + [("output", pipeline.output)]:
+            depths[(stage,)] = depths.get((stage,), 0) + len(q)
+    return depths
+
+# Read at scrape time
+gauge("helmet_queue_depth", "Items waiting per queue (pipeline queues summed over streams).", ("queue",), fn=queue_depths)
+gauge("helmet_active_streams", "Stream producers currently running.", fn=lambda: len(broker.info()))
+gauge("helmet_stream_viewers", "MJPEG viewers connected.",
+      fn=lambda: sum(c["subscribers"] for c in broker.info().values()))
+gauge("helmet_results_bytes", "Size of the results/ directory.", fn=lambda: artifacts.stats()["bytes"])
+gauge("helmet_ready", "1 once every startup component has loaded.", fn=lambda: int(startup.ready))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Route pattern rather than the path, so file names don't explode the label set
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method,
+                                status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the stage/endpoint histograms, counters and queue gauges."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and no component failed to load."""
+    if startup.failed:
+        return jsonify({'status': 'failed', 'components': startup.status()}), 503
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: every component (and the warm-up) has loaded. Lazy startups are always ready."""
+    ready = startup.ready or (app.config['STARTUP_MODE'] == 'lazy' and not startup.failed)
+    # A pool whose workers all gave up loaded fine once, but can't serve anything now
+    if app.config['INFERENCE_WORKERS'] > 0 and startup.is_loaded("model") and system.pool.failed:
+        ready = False
+    return jsonify({
+        'ready': ready,
+        'mode': app.config['STARTUP_MODE'],
+        'engine': system.engine,
+        'components': startup.status()
+    }), 200 if ready else 503
+
+@app.route('/api/inference-pool')
+def inference_pool_stats():
+    """Worker processes, their frames in flight and free shared-memory slots (empty without a pool)."""
+    if app.config['INFERENCE_WORKERS'] <= 0 or not startup.is_loaded("model"):
+        return jsonify({'workers': app.config['INFERENCE_WORKERS'], 'ready': False})
+    return jsonify(dict(system.pool.stats(), ready=True))
 
 @app.route('/detect', methods=['POST'])
 def detect():
@@ -68,12 +257,13 @@ def detect():
     
     if file:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Decoded straight from the request body instead of a write-then-read through uploads/
+        data = file.read()
+        input_url = save_upload(filename, data)
         
         # Process Image
         try:
-            result = system.process_image(filepath, output_dir=app.config['RESULTS_FOLDER'])
+            result = system.process_image(data, output_dir=app.config['RESULTS_FOLDER'], name=filename)
             
             # Handle variable return values just in case
             if isinstance(result, tuple):
@@ -96,28 +286,19 @@ def detect():
                 output_filename = os.path.basename(output_path)
                 plate_filename = os.path.basename(plate_crop_path) if plate_crop_path else None
                 
-                import time
                 timestamp_val = int(time.time())
                 res_url = f'/results/{output_filename}?v={timestamp_val}'
                 plt_url = f'/results/{plate_filename}?v={timestamp_val}' if plate_filename else None
                 
                 # Save to Database
                 try:
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    cursor.execute('''
-                        INSERT INTO detections (timestamp, status_text, plate_text, result_url, plate_url)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (now_str, status_text, plate_text if plate_text else "No Plate Detected", res_url, plt_url))
-                    conn.commit()
-                    conn.close()
+                    db.insert_detection(status_text, plate_text if plate_text else "No Plate Detected", res_url, plt_url)
                 except Exception as db_e:
-                    print(f"[ERROR] Database save error: {db_e}")
+                    log_event("ERROR", "db_write_failed", key="detect", route="detect", error=db_e)
 
                 return jsonify({
                     'success': True,
-                    'input_url': f'/uploads/{filename}',
+                    'input_url': input_url,
                     'result_url': res_url,
                     'plate_text': plate_text if plate_text else "No Plate Detected",
                     'plate_url': plt_url,
@@ -125,16 +306,33 @@ def detect():
                 })
             else:
                 return jsonify({'error': 'Detection failed to produce output'}), 500
+        except PoolBusy as e:
+            # Every inference worker is saturated; the client should back off and retry
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        except PoolFailed as e:
+            # Not a transient overload, so no Retry-After
+            return jsonify({'error': str(e)}), 503
         except Exception as e:
-            print(f"[ERROR] Logic error: {e}")
+            log_event("ERROR", "detect_failed", error=e)
             return jsonify({'error': str(e)}), 500
 
 @app.route('/results/<filename>')
 def uploaded_file(filename):
+    # The image may still be queued for writing right after the detection returned
+    artifacts.wait_for(filename)
     return send_from_directory(app.config['RESULTS_FOLDER'], filename)
 
+def save_upload(filename, data):
+    """Queues the original upload to be written to uploads/ unless persisting is off. Returns its URL or None."""
+    persist = request.args.get('persist', '1' if app.config['PERSIST_UPLOADS'] else '0') == '1'
+    if not persist:
+        return None
+    uploads.save_bytes(filename, data)
+    return uploads.url_for(filename)
+
 @app.route('/uploads/<filename>')
 def serve_input_file(filename):
+    uploads.wait_for(filename)
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/api/batch-detect', methods=['POST'])
@@ -146,75 +344,71 @@ def batch_detect():
     if not files or all(f.filename == '' for f in files):
         return jsonify({'error': 'No selected files'}), 400
 
-    results = []
-    
+    # Read every upload first so the whole request can go through the model in mini-batches
+    saved = []
     for file in files:
         if file and file.filename != '':
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            try:
-                # Process Image
-                result = system.process_image(filepath, output_dir=app.config['RESULTS_FOLDER'])
+            data = file.read()
+            saved.append((filename, data, save_upload(filename, data)))
+
+    try:
+        batch_outputs = system.process_images([data for _, data, _ in saved],
+                                              output_dir=app.config['RESULTS_FOLDER'],
+                                              batch_size=app.config['BATCH_INFERENCE_SIZE'],
+                                              num_workers=app.config['BATCH_DECODE_WORKERS'],
+                                              names=[filename for filename, _, _ in saved])
+    except PoolBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except PoolFailed as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        log_event("ERROR", "batch_inference_failed", images=len(saved), error=e)
+        batch_outputs = [e] * len(saved)
+
+    results = []
+    db_rows = []
+    
+    for (filename, _, input_url), result in zip(saved, batch_outputs):
+        try:
+            if isinstance(result, Exception):
+                raise result
+
+            output_path, plate_text, plate_crop_path, status_text = result
+
+            if output_path:
+                output_filename = os.path.basename(output_path)
+                plate_filename = os.path.basename(plate_crop_path) if plate_crop_path else None
                 
-                # Handle variable return values just in case
-                if isinstance(result, tuple):
-                    if len(result) == 4:
-                         output_path, plate_text, plate_crop_path, status_text = result
-                    elif len(result) == 3:
-                         output_path, plate_text, plate_crop_path = result
-                         status_text = "Unknown"
-                    elif len(result) == 2:
-                         output_path, plate_text = result
-                         plate_crop_path = None
-                         status_text = "Unknown"
-                else:
-                    output_path = result
-                    plate_text = None
-                    plate_crop_path = None
-                    status_text = "Unknown"
-
-                if output_path:
-                    output_filename = os.path.basename(output_path)
-                    plate_filename = os.path.basename(plate_crop_path) if plate_crop_path else None
-                    
-                    import time
-                    timestamp_val = int(time.time() * 1000) # Use ms for uniqueness in rapid batch
-                    res_url = f'/results/{output_filename}?v={timestamp_val}'
-                    plt_url = f'/results/{plate_filename}?v={timestamp_val}' if plate_filename else None
-                    
-                    # Save to Database
-                    try:
-                        conn = sqlite3.connect(DB_PATH)
-                        cursor = conn.cursor()
-                        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        safe_plate = plate_text if plate_text else "No Plate Detected"
-                        
-                        cursor.execute('''
-                            INSERT INTO detections (timestamp, status_text, plate_text, result_url, plate_url)
-                            VALUES (?, ?, ?, ?, ?)
-                        ''', (now_str, status_text, safe_plate, res_url, plt_url))
-                        conn.commit()
-                        conn.close()
-                    except Exception as db_e:
-                        print(f"[ERROR] Batch db save error: {db_e}")
-
-                    results.append({
-                        'filename': filename,
-                        'success': True,
-                        'input_url': f'/uploads/{filename}',
-                        'result_url': res_url,
-                        'plate_text': safe_plate,
-                        'plate_url': plt_url,
-                        'status_text': status_text
-                    })
-                else:
-                    results.append({'filename': filename, 'success': False, 'error': 'Detection returned no output'})
-            except Exception as e:
-                print(f"[ERROR] Batch logic error on {filename}: {e}")
-                results.append({'filename': filename, 'success': False, 'error': str(e)})
+                timestamp_val = int(time.time() * 1000) # Use ms for uniqueness in rapid batch
+                res_url = f'/results/{output_filename}?v={timestamp_val}'
+                plt_url = f'/results/{plate_filename}?v={timestamp_val}' if plate_filename else None
+                safe_plate = plate_text if plate_text else "No Plate Detected"
                 
+                # Saved to the database in one transaction after the loop
+                db_rows.append((status_text, safe_plate, res_url, plt_url))
+
+                results.append({
+                    'filename': filename,
+                    'success': True,
+                    'input_url': input_url,
+                    'result_url': res_url,
+                    'plate_text': safe_plate,
+                    'plate_url': plt_url,
+                    'status_text': status_text
+                })
+            else:
+                results.append({'filename': filename, 'success': False, 'error': 'Detection returned no output'})
+        except Exception as e:
+            log_event("ERROR", "batch_image_failed", image=filename, error=e)
+            results.append({'filename': filename, 'success': False, 'error': str(e)})
+
+    # Save to Database
+    try:
+        db.insert_detections(db_rows)
+    except Exception as db_e:
+        log_event("ERROR", "db_write_failed", key="batch", route="batch-detect", rows=len(db_rows), error=db_e)
+            
     return jsonify({
         'success': True,
         'processed_count': len(results),
@@ -247,17 +441,9 @@ def upload_video():
         
         # Also log this event to the DB (optional but good for tracking)
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('''
-                INSERT INTO detections (timestamp, status_text, plate_text, result_url, plate_url)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (now_str, "Video Processed", "N/A", stream_url, None))
-            conn.commit()
-            conn.close()
+            db.insert_detection("Video Processed", "N/A", stream_url, None)
         except Exception as db_e:
-            print(f"[ERROR] Video DB save error: {db_e}")
+            log_event("ERROR", "db_write_failed", key="upload-video", route="upload-video", error=db_e)
 
         return jsonify({
             'success': True,
@@ -266,25 +452,171 @@ def upload_video():
             'filename': filename
         })
 
+def video_job_json(job, include_violators=False):
+    data = {
+        'id': job['id'],
+        'filename': job['filename'],
+        'status': job['status'],
+        'frames_done': job['frames_done'],
+        'frames_total': job['frames_total'],
+        'progress': round(job['frames_done'] / job['frames_total'], 3) if job['frames_total'] else None,
+        'elapsed_s': job['elapsed_s'],
+        'processing_fps': round(job['frames_done'] / job['elapsed_s'], 1) if job['elapsed_s'] else None,
+        'output_url': job['output_url'],
+        'violations': job['violations'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'status_url': f"/api/video-jobs/{job['id']}"
+    }
+    if include_violators:
+        data['violators'] = [{
+            'track_id': v['track_id'],
+            'frame': v['frame'],
+            'video_time_s': v['video_time_s'],
+            'plate_text': v['plate_text'],
+            'violator_url': v['violator_url'],
+            'plate_url': v['plate_url']
+        } for v in db.video_violations(job['id'])]
+    return data
+
+@app.route('/api/video-jobs', methods=['POST'])
+def submit_video_job():
+    """
+    Queues a video for offline processing: either a new upload ('video' or 'file') or
+    the `filename` (form or JSON) of a video already uploaded. Answers 202 with the job;
+    poll its status_url for progress, the annotated MP4 and the violators.
+    """
+    file = request.files.get('video') or request.files.get('file')
+    if file is not None and file.filename != '':
+        filename = secure_filename(file.filename)
+        if not filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+            return jsonify({'error': 'Invalid file format. Please upload a video.'}), 400
+        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    else:
+        body = request.get_json(silent=True) or {}
+        filename = secure_filename(request.form.get('filename') or body.get('filename') or '')
+        if not filename:
+            return jsonify({'error': 'No video file or filename'}), 400
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': 'File not found'}), 404
+
+    try:
+        job_id = video_jobs.submit(filepath, filename, input_url=f'/uploads/{filename}')
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+    return jsonify(video_job_json(db.get_video_job(job_id))), 202
+
+@app.route('/api/video-jobs')
+def list_video_jobs():
+    """The 20 most recent video jobs, newest first, plus the queue state."""
+    return jsonify({
+        'queue': video_jobs.stats(),
+        'jobs': [video_job_json(job) for job in db.recent_video_jobs(limit=20)]
+    })
+
+@app.route('/api/video-jobs/<int:job_id>')
+def video_job_status(job_id):
+    """Progress of one job; once it is done, also its violators with their frame and plate text."""
+    job = db.get_video_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(video_job_json(job, include_violators=job['status'] == 'done'))
+
+def stream_profile():
+    """The output profile requested with ?profile=, or None if it isn't part of the ladder."""
+    name = request.args.get('profile', app.config['STREAM_DEFAULT_PROFILE'])
+    return app.config['STREAM_PROFILES'].get(name)
+
+def subscribe_stream(video_path, loop, profile):
+    """
+    All viewers of the same source share one inference loop through the broker, and
+    all viewers of the same output profile share one JPEG encode per frame.
+    """
+    filename = os.path.basename(video_path)
+    default_profile = app.config['STREAM_PROFILES'].get(app.config['STREAM_DEFAULT_PROFILE'])
+
+    def stats_fn():
+        stats = STATS_HUB.get(filename)
+        return stats.summary() if stats else {}
+
+    return broker.subscribe(
+        (video_path, loop),
+        lambda: system.iter_stream_frames(video_path, loop=loop,
+                                          pipelined=app.config['STREAM_PIPELINED'],
+                                          queue_depth=app.config['STREAM_QUEUE_DEPTH'],
+                                          target_rtf=app.config['STREAM_TARGET_RTF'],
+                                          max_stride=app.config['STREAM_MAX_STRIDE'],
+                                          profile=default_profile, shared=True),
+        stats_fn=stats_fn,
+        profile=profile,
+    )
+
 @app.route('/api/stream-video/<filename>')
 def stream_video(filename):
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
     if not os.path.exists(filepath):
         return "File not found", 404
+    profile = stream_profile()
+    if profile is None:
+        return "Unknown stream profile", 400
         
     # Stream the video, but tell the generator to stop when done (loop=False)
-    return Response(system.generate_video_stream(filepath, loop=False),
+    return Response(subscribe_stream(filepath, loop=False, profile=profile),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/api/streams')
+def active_streams():
+    """Running stream producers and how many viewers each one serves."""
+    return jsonify(broker.info())
+
+@app.route('/api/stream-profiles')
+def stream_profiles():
+    """The MJPEG output ladder, the JPEG backend in use and per-profile encode cost."""
+    return jsonify({
+        'default': app.config['STREAM_DEFAULT_PROFILE'],
+        'profiles': [p.to_dict() for p in app.config['STREAM_PROFILES'].values()],
+        'encoder': system.frame_encoder.backend,
+        'encode_stats': system.frame_encoder.stats()
+    })
+
 @app.route('/api/stream-stats/<filename>')
 def stream_stats(filename):
-    """Server-Sent Events endpoint for pushing live tracking metrics"""
+    """
+    Server-Sent Events endpoint for pushing live tracking metrics.
+    Messages are sent when the stats change and carry only the violators added or
+    updated since the previous message (`reset` marks a full snapshot). The event id
+    lets a reconnecting EventSource resume where it left off.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    try:
+        epoch, since_seq = (int(part) for part in last_event_id.split(':'))
+    except ValueError:
+        epoch, since_seq = None, 0
+    refresh_s = app.config['SSE_REFRESH_S']
+
     def generate():
-        while True:
-            # Fetch latest stats built by the background YOLO frame loop
-            stats = STREAM_STATS.get(filename, {"safe": 0, "unsafe": 0, "plates": []})
-            yield f"data: {json.dumps(stats)}\n\n"
-            time.sleep(1) # Broadcast updates 1x per sec to prevent frontend overload
+        nonlocal epoch, since_seq
+        stats = STATS_HUB.attach(filename)
+        try:
+            while True:
+                message = stats.delta(since_seq, epoch)
+                epoch, since_seq = message['epoch'], message['seq']
+                telemetry_version = stats.telemetry_version
+                yield f"id: {epoch}:{since_seq}\ndata: {json.dumps(message)}\n\n"
+
+                # Sleep on the stream's condition until something changes; send a
+                # comment line now and then so proxies keep the idle connection open
+                idle_s = 0.0
+                while not stats.wait(since_seq, epoch, telemetry_version, timeout=refresh_s):
+                    idle_s += refresh_s
+                    if idle_s >= app.config['SSE_KEEPALIVE_S']:
+                        yield ": keepalive\n\n"
+                        idle_s = 0.0
+        finally:
+            STATS_HUB.detach(filename)
 
     return Response(generate(), mimetype='text/event-stream')
 
@@ -293,16 +625,8 @@ def stream_stats(filename):
 @app.route('/api/analytics/stats')
 def api_stats():
     """Return aggregate statistics from the database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM detections")
-    total_scans = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM detections WHERE status_text LIKE '%NO HELMET%'")
-    total_violations = cursor.fetchone()[0]
-    
-    conn.close()
+    total_scans = db.count_scans()
+    total_violations = db.count_violations()
     
     accuracy = 98.5 # Mock high accuracy value
     
@@ -315,12 +639,7 @@ def api_stats():
 @app.route('/api/analytics/history')
 def api_history():
     """Return the 10 most recent detections for the data table."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM detections ORDER BY id DESC LIMIT 10")
-    rows = cursor.fetchall()
+    rows = db.recent_detections(limit=10)
     
     data = []
     for r in rows:
@@ -332,36 +651,67 @@ def api_history():
             'result_url': r['result_url']
         })
         
-    conn.close()
     return jsonify(data)
 
+@app.route('/api/analytics/history/page')
+def api_history_page():
+    """
+    Paginated, filterable history, newest first.
+    Query params: cursor (id from the previous page's next_cursor), page_size,
+    status (violation | clear | exact status text), from / to (YYYY-MM-DD), plate (prefix).
+    """
+    try:
+        page_size = int(request.args.get('page_size', app.config['HISTORY_PAGE_SIZE']))
+        cursor = request.args.get('cursor', type=int)
+    except ValueError:
+        return jsonify({'error': 'page_size and cursor must be integers'}), 400
+    page_size = max(1, min(page_size, app.config['HISTORY_MAX_PAGE_SIZE']))
+
+    rows, next_cursor = db.history_page(
+        limit=page_size,
+        before_id=cursor,
+        status=request.args.get('status') or None,
+        date_from=request.args.get('from') or None,
+        date_to=request.args.get('to') or None,
+        plate_prefix=(request.args.get('plate') or '').strip().upper() or None,
+    )
+
+    items = []
+    for r in rows:
+        items.append({
+            'id': r['id'],
+            'timestamp': r['timestamp'],
+            'status_text': r['status_text'],
+            'plate_text': r['plate_text'],
+            'result_url': r['result_url'],
+            'plate_url': r['plate_url'],
+            'is_violation': bool(r['is_violation'])
+        })
+
+    return jsonify({
+        'items': items,
+        'next_cursor': next_cursor,
+        'page_size': page_size
+    })
+
 @app.route('/api/live-feed')
 def live_feed_stream():
     """Stream simulated live camera feed via MJPEG."""
     video_path = os.path.join(app.static_folder, 'samples', 'sample_traffic.mp4')
     if not os.path.exists(video_path):
         return "Video source not found", 404
+    profile = stream_profile()
+    if profile is None:
+        return "Unknown stream profile", 400
         
-    return Response(system.generate_video_stream(video_path), 
+    return Response(subscribe_stream(video_path, loop=True, profile=profile),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/analytics/chart')
 def api_chart():
     """Return data grouped by date for the Chart.js visual."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     # Group by the DATE part of the timestamp (YYYY-MM-DD)
-    cursor.execute('''
-        SELECT substr(timestamp, 1, 10) as date, 
-               COUNT(*) as total, 
-               SUM(CASE WHEN status_text LIKE '%NO HELMET%' THEN 1 ELSE 0 END) as violations
-        FROM detections 
-        GROUP BY substr(timestamp, 1, 10)
-        ORDER BY date ASC
-        LIMIT 7
-    ''')
-    rows = cursor.fetchall()
-    conn.close()
+    rows = db.daily_counts(limit=7)
     
     dates = []
     totals = []
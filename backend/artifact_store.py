@@ -0,0 +1,196 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+
+from instrumentation import STAGE_SECONDS, log_event
+
+
+class ArtifactStore:
+    """
+    Writes result images (processed frames, plate and violator crops) on background threads.
+
+    Image encoding and disk I/O happen off the inference path. The directory is kept
+    within a size and age budget by deleting the oldest files first; `on_evict(urls)`
+    is called with the public URLs of deleted files so the database can drop
+    references to them.
+    """
+
+    def __init__(self, root, url_prefix="/results", max_bytes=0, max_age_s=0, workers=1,
+                 queue_size=256, jpeg_quality=90, on_evict=None):
+        self.root = os.path.abspath(root)
+        self.url_prefix = url_prefix
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.jpeg_quality = jpeg_quality
+        self.on_evict = on_evict
+        os.makedirs(self.root, exist_ok=True)
+
+        # filename -> (size, mtime), oldest first
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self.evicted = 0
+        self._scan()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        for idx in range(max(1, workers)):
+            t = threading.Thread(target=self._writer_loop, name=f"artifact-writer-{idx}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def path_for(self, filename):
+        return os.path.join(self.root, filename)
+
+    def url_for(self, filename):
+        return f"{self.url_prefix}/{filename}"
+
+    def save_image(self, filename, image, quality=None):
+        """
+        Queues `image` to be encoded (by the extension of `filename`, like cv2.imwrite;
+        `quality` applies to JPEG) and written as `filename`; returns its path right away.
+        The array must not be modified afterwards. If the writers are backed up the
+        write happens inline rather than being dropped, since the DB will point at it.
+        """
+        with self._cond:
+            self._pending[filename] = self._pending.get(filename, 0) + 1
+        job = (filename, image, quality or self.jpeg_quality)
+        try:
+            self._queue.put(job, timeout=1.0)
+        except queue.Full:
+            try:
+                self._write(*job)
+            except Exception as e:
+                log_event("ERROR", "artifact_write_failed", file=filename, error=e)
+        return self.path_for(filename)
+
+    def save_bytes(self, filename, data):
+        """Same as save_image for data that is already encoded (e.g. an uploaded original)."""
+        return self.save_image(filename, bytes(data))
+
+    def add_file(self, filename):
+        """
+        Indexes a file the caller wrote into the store's directory itself (e.g. a video
+        written frame by frame), so it counts towards the budget. Returns its URL.
+        """
+        st = os.stat(self.path_for(filename))
+        with self._cond:
+            old = self._index.pop(filename, None)
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._index[filename] = (st.st_size, st.st_mtime)
+            self._total_bytes += st.st_size
+        self._enforce_budget()
+        return self.url_for(filename)
+
+    def wait_for(self, filename, timeout=5.0):
+        """Blocks until no write of `filename` is pending. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: filename not in self._pending, timeout)
+
+    def flush(self, timeout=30.0):
+        """Blocks until every queued write has finished."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "files": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "pending_writes": sum(self._pending.values()),
+                "evicted": self.evicted,
+            }
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        for mtime, name, size in sorted(entries):
+            self._index[name] = (size, mtime)
+            self._total_bytes += size
+
+    def _writer_loop(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=60.0)
+            except queue.Empty:
+                # Idle: still expire files that aged out
+                self._enforce_budget()
+                continue
+            try:
+                self._write(*job)
+            except Exception as e:
+                log_event("ERROR", "artifact_write_failed", file=job[0], error=e)
+
+    def _write(self, filename, image, quality):
+        started = time.perf_counter()
+        try:
+            if isinstance(image, bytes):
+                data = image
+            else:
+                ext = os.path.splitext(filename)[1].lower() or ".jpg"
+                params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if ext in (".jpg", ".jpeg") else []
+                ok, buffer = cv2.imencode(ext, image, params)
+                if not ok:
+                    raise ValueError(f"{ext} encode failed")
+                data = buffer.tobytes()
+            path = self.path_for(filename)
+            # Write to a temp file and rename, so readers never see a half-written image
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="artifact_write")
+
+            with self._cond:
+                old = self._index.pop(filename, None)
+                if old is not None:
+                    self._total_bytes -= old[0]
+                self._index[filename] = (len(data), time.time())
+                self._total_bytes += len(data)
+        finally:
+            with self._cond:
+                self._pending[filename] -= 1
+                if self._pending[filename] <= 0:
+                    del self._pending[filename]
+                self._cond.notify_all()
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        if not self.max_bytes and not self.max_age_s:
+            return
+        now = time.time()
+        victims = []
+        with self._cond:
+            while self._index:
+                name, (size, mtime) = next(iter(self._index.items()))
+                too_big = self.max_bytes and self._total_bytes > self.max_bytes
+                too_old = self.max_age_s and now - mtime > self.max_age_s
+                if not (too_big or too_old) or name in self._pending:
+                    break
+                self._index.popitem(last=False)
+                self._total_bytes -= size
+                victims.append(name)
+        if not victims:
+            return
+
+        for name in victims:
+            try:
+                os.remove(self.path_for(name))
+            except FileNotFoundError:
+                pass
+        self.evicted += len(victims)
+        if self.on_evict is not None:
+            try:
+                self.on_evict([self.url_for(name) for name in victims])
+            except Exception as e:
+                log_event("ERROR", "artifact_evict_callback_failed", error=e)
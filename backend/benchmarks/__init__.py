@@ -0,0 +1,6 @@
+"""
+Reproducible benchmarks for the detection pipeline.
+
+Run from backend/:  python -m benchmarks run [--output results.json]
+Compare two runs:   python -m benchmarks compare old.json new.json
+"""
@@ -0,0 +1,279 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from benchmarks.scenes import render_scene, write_video, sample_images, sample_video
+from benchmarks.timing import StageTimer, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(BACKEND_DIR, 'static', 'samples')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL) != 0
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def environment():
+    versions = {"python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__}
+    for module in ("torch", "ultralytics", "easyocr", "onnxruntime", "openvino"):
+        try:
+            versions[module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            pass
+    return {"platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count(),
+            "versions": versions}
+
+
+def build_images(args, rng):
+    """(name, jpeg bytes, known plate crops) for every benchmark image, synthetic ones first."""
+    images = []
+    for i in range(args.images):
+        img, plates = render_scene(rng, args.width, args.height, riders=args.riders)
+        ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        crops = [img[y1:y2, x1:x2].copy() for (x1, y1, x2, y2), _ in plates]
+        images.append((f"synthetic_{i}.jpg", buffer.tobytes(), crops))
+    if args.use_samples:
+        for path in sample_images(SAMPLES_DIR):
+            with open(path, "rb") as f:
+                images.append((os.path.basename(path), f.read(), []))
+    return images
+
+
+def bench_stages(system, db, images, repeats):
+    """Times each stage of process_image separately, the way the app chains them."""
+    from main import decode_image, DEFAULT_STREAM_PROFILE
+
+    timer = StageTimer()
+    for _ in range(repeats):
+        for name, data, known_crops in images:
+            with timer.stage("decode"):
+                img = decode_image(data)
+            with timer.stage("inference"):
+                boxes = system.detect(img, timeout=None)
+            with timer.stage("postprocess"):
+                dets = system.postprocessor.process(boxes, img.shape)
+
+            # Plates the model found; synthetic scenes fall back to the rendered plates so OCR is always measured
+            crops = [img[max(0, y1):y2, max(0, x1):x2] for x1, y1, x2, y2 in (dets.xyxy[i].tolist() for i in dets.plate_indices)]
+            crops = [c for c in crops if c.size] or known_crops
+            for crop in crops:
+                with timer.stage("ocr"):
+                    system.plate_detector.recognize_text(crop)
+            # All plates of the image in one call, as process_image reads them
+            if crops:
+                with timer.stage("ocr_batch"):
+                    system.plate_detector.recognize_text_batch(crops)
+
+            with timer.stage("draw"):
+                system.postprocessor.draw(img, dets)
+            with timer.stage("encode"):
+                system.frame_encoder.encode(img, DEFAULT_STREAM_PROFILE)
+            with timer.stage("db_write"):
+                db.insert_detection("NO HELMET (Violation)" if dets.unsafe_count else "With Helmet (Safe)",
+                                    "BENCH", f"/results/processed_{name}", None)
+    return timer.summary()
+
+
+def check_ocr_batch(system, images):
+    """
+    Reads the rendered plates of every image one crop at a time and as one batch, and
+    counts how often the two agree. Batching should only change the speed, not the text.
+    """
+    detector = system.plate_detector
+    crops = [crop for _, _, known_crops in images for crop in known_crops]
+    single = [detector.recognize_text(crop) for crop in crops]
+    batched = [text for text, _ in detector.recognize_text_batch(crops)]
+    mismatches = [{"single": a, "batched": b} for a, b in zip(single, batched) if a != b]
+    return {"crops": len(crops), "agree": len(crops) - len(mismatches), "mismatches": mismatches[:10]}
+
+
+def bench_process_image(system, images, repeats, output_dir):
+    """End to end: process_image from encoded bytes, including the queued artifact writes."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for name, data, _ in images:
+            t0 = time.perf_counter()
+            system.process_image(data, output_dir=output_dir, name=name)
+            latencies.append(time.perf_counter() - t0)
+    system.artifacts.flush()
+    elapsed = time.perf_counter() - started
+    return {"images": len(latencies), "fps": round(len(latencies) / elapsed, 2), "latency": summarize(latencies)}
+
+
+def bench_concurrent(system, images, repeats, output_dir, clients):
+    """process_image called from `clients` threads at once, like concurrent requests to the app."""
+    jobs = [(data, name) for _ in range(repeats) for name, data, _ in images]
+
+    def one(job):
+        t0 = time.perf_counter()
+        system.process_image(job[0], output_dir=output_dir, name=job[1])
+        return time.perf_counter() - t0
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(one, jobs))
+    system.artifacts.flush()
+    elapsed = time.perf_counter() - started
+    return {"clients": clients, "images": len(latencies), "fps": round(len(latencies) / elapsed, 2),
+            "latency": summarize(latencies)}
+
+
+def bench_stream(system, video_path, pipelined):
+    """End to end: every frame of the video through iter_stream_frames, unpaced and without frame skipping."""
+    frames = 0
+    gaps = []
+    started = last = time.perf_counter()
+    for _ in system.iter_stream_frames(video_path, loop=False, pipelined=pipelined, max_stride=1, realtime=False):
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+        frames += 1
+    elapsed = time.perf_counter() - started
+    return {"frames": frames, "fps": round(frames / elapsed, 2) if elapsed else None, "frame_interval": summarize(gaps)}
+
+
+def run(args):
+    from artifact_store import ArtifactStore
+    from database import DetectionDatabase
+    from main import YOLOv8System
+
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory(prefix="helmet-bench-") as tmp:
+        results_dir = os.path.join(tmp, 'results')
+        # OCR cache off, so every recognize_text call pays for a real read
+        system = YOLOv8System(engine=args.engine, imgsz=args.imgsz, ocr_workers=1, ocr_cache_size=0,
+                              artifact_store=ArtifactStore(results_dir), warmup_runs=args.warmup,
+                              inference_workers=args.workers)
+        db = DetectionDatabase(os.path.join(tmp, 'bench.db'))
+        images = build_images(args, rng)
+
+        print(f"[INFO] Benchmarking {len(images)} image(s) x {args.repeats}...")
+        report = {"stages": bench_stages(system, db, images, args.repeats),
+                  "ocr_batch_agreement": check_ocr_batch(system, images),
+                  "process_image": bench_process_image(system, images, args.repeats, results_dir),
+                  "process_image_concurrent": bench_concurrent(system, images, args.repeats, results_dir,
+                                                               args.clients or max(1, args.workers) * 2)}
+
+        video_path = sample_video(SAMPLES_DIR) if args.use_samples else None
+        if video_path is None:
+            video_path = write_video(os.path.join(tmp, 'synthetic.mp4'), rng, frames=args.video_frames,
+                                     width=args.width, height=args.height, riders=args.riders)
+        print(f"[INFO] Benchmarking stream on {os.path.basename(video_path)}...")
+        report["stream_sequential"] = bench_stream(system, video_path, pipelined=False)
+        report["stream_pipelined"] = bench_stream(system, video_path, pipelined=True)
+        report["startup"] = system.components.status()
+        # Violator crops from the stream may still be queued for the temp dir
+        system.artifacts.flush()
+        db.close_all()
+        if system.pool is not None:
+            system.pool.close()
+
+    commit, dirty = git_revision()
+    report["meta"] = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "dirty": dirty,
+        "engine": system.engine,
+        "inference_workers": args.workers,
+        "jpeg_backend": system.frame_encoder.backend,
+        "args": vars(args),
+        "environment": environment(),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'stage':<12} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for name, s in report["stages"].items():
+        print(f"{name:<12} {s['count']:>6} {s['p50_ms']:>9} {s['p90_ms']:>9} {s['p99_ms']:>9}")
+    for key in ("process_image", "process_image_concurrent", "stream_sequential", "stream_pipelined"):
+        print(f"{key:<24} {report[key]['fps']} FPS")
+    agreement = report["ocr_batch_agreement"]
+    print(f"{'ocr_batch_agreement':<24} {agreement['agree']}/{agreement['crops']} crops read the same")
+    for m in agreement["mismatches"]:
+        print(f"[WARNING] Batched OCR read {m['batched']!r} where per-crop OCR read {m['single']!r}")
+
+
+def compare(old_path, new_path):
+    """Prints the p50 latency and FPS change of every stage between two saved runs."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def change(a, b):
+        return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+
+    print(f"old: {old['meta'].get('commit')} ({old['meta']['timestamp']})  new: {new['meta'].get('commit')} ({new['meta']['timestamp']})")
+    print(f"{'stage':<12} {'old p50':>9} {'new p50':>9} {'change':>8}")
+    for name in new["stages"]:
+        if name in old["stages"]:
+            a, b = old["stages"][name]["p50_ms"], new["stages"][name]["p50_ms"]
+            print(f"{name:<12} {a:>9} {b:>9} {change(a, b):>8}")
+    print(f"{'throughput':<24} {'old FPS':>9} {'new FPS':>9} {'change':>8}")
+    for key in ("process_image", "process_image_concurrent", "stream_sequential", "stream_pipelined"):
+        if key in old and key in new:
+            a, b = old[key]["fps"], new[key]["fps"]
+            print(f"{key:<24} {a:>9} {b:>9} {change(a, b):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Detection pipeline benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run the benchmarks and save a JSON report")
+    run_parser.add_argument("--output", help=f"JSON path (default: {RESULTS_DIR}/<time>-<commit>.json)")
+    run_parser.add_argument("--engine", default=os.environ.get('INFERENCE_ENGINE', 'pytorch'))
+    run_parser.add_argument("--imgsz", type=int, default=int(os.environ.get('INFERENCE_IMGSZ', 640)))
+    run_parser.add_argument("--workers", type=int, default=int(os.environ.get('INFERENCE_WORKERS', 0)),
+                            help="inference worker processes (0 = in-process model)")
+    run_parser.add_argument("--clients", type=int, default=0,
+                            help="concurrent process_image callers (default: 2 per worker)")
+    run_parser.add_argument("--images", type=int, default=20, help="synthetic images to render")
+    run_parser.add_argument("--repeats", type=int, default=3)
+    run_parser.add_argument("--video-frames", type=int, default=150)
+    run_parser.add_argument("--width", type=int, default=1280)
+    run_parser.add_argument("--height", type=int, default=720)
+    run_parser.add_argument("--riders", type=int, default=3)
+    run_parser.add_argument("--warmup", type=int, default=2, help="warm-up inferences before measuring")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--use-samples", action="store_true", help="also use the media in static/samples")
+
+    compare_parser = sub.add_parser("compare", help="compare two saved reports")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare(args.old, args.new)
+        return
+
+    report = run(args)
+    print_report(report)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit'] or 'nogit'}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import string
+
+import cv2
+import numpy as np
+
+
+def random_plate(rng):
+    letters = "".join(rng.choice(list(string.ascii_uppercase), 2))
+    digits = "".join(rng.choice(list(string.digits), 4))
+    return f"{letters}{rng.integers(10, 99)}{digits}"
+
+
+def draw_rider(img, x, y, scale, helmet, plate_text):
+    """
+    Draws a crude rider on a bike at (x, y) (bottom centre of the wheels).
+    Returns the plate box (x1, y1, x2, y2) so OCR can be benchmarked on a known crop.
+    """
+    s = scale
+    # Wheels and frame
+    cv2.circle(img, (int(x - 40 * s), int(y - 20 * s)), int(20 * s), (30, 30, 30), int(6 * s))
+    cv2.circle(img, (int(x + 40 * s), int(y - 20 * s)), int(20 * s), (30, 30, 30), int(6 * s))
+    cv2.rectangle(img, (int(x - 45 * s), int(y - 55 * s)), (int(x + 45 * s), int(y - 30 * s)), (40, 40, 160), -1)
+    # Body and head
+    cv2.rectangle(img, (int(x - 15 * s), int(y - 120 * s)), (int(x + 15 * s), int(y - 55 * s)), (60, 110, 60), -1)
+    head = (int(x), int(y - 135 * s))
+    cv2.circle(img, head, int(15 * s), (140, 170, 210), -1)
+    if helmet:
+        cv2.ellipse(img, (head[0], head[1] - int(4 * s)), (int(18 * s), int(15 * s)), 0, 180, 360, (20, 200, 230), -1)
+
+    # Plate under the rear of the bike
+    px1, py1 = int(x - 38 * s), int(y - 28 * s)
+    px2, py2 = int(x + 38 * s), int(y - 6 * s)
+    cv2.rectangle(img, (px1, py1), (px2, py2), (245, 245, 245), -1)
+    cv2.rectangle(img, (px1, py1), (px2, py2), (0, 0, 0), max(1, int(s)))
+    cv2.putText(img, plate_text, (px1 + int(3 * s), py2 - int(5 * s)), cv2.FONT_HERSHEY_SIMPLEX,
+                0.36 * s, (0, 0, 0), max(1, int(s)))
+    return px1, py1, px2, py2
+
+
+def render_scene(rng, width=1280, height=720, riders=3):
+    """
+    Renders a road with `riders` bikes, some without helmets.
+    Returns (image, [(plate_box, plate_text), ...]).
+    """
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (90, 90, 90)
+    img[: height // 3] = (200, 170, 120)
+    # Lane markings and some texture so JPEG and the model have something to chew on
+    for lx in range(0, width, 160):
+        cv2.rectangle(img, (lx, height * 2 // 3), (lx + 80, height * 2 // 3 + 8), (230, 230, 230), -1)
+    img += rng.integers(0, 12, img.shape, dtype=np.uint8)
+
+    plates = []
+    scale = height / 360
+    for i in range(riders):
+        x = int(width * (i + 0.5) / riders + rng.integers(-40, 40))
+        y = int(height * 0.9 - rng.integers(0, height // 8))
+        text = random_plate(rng)
+        box = draw_rider(img, x, y, scale, helmet=bool(rng.random() < 0.5), plate_text=text)
+        plates.append((box, text))
+    return img, plates
+
+
+def write_video(path, rng, frames=120, width=1280, height=720, fps=30, riders=3):
+    """Writes an MP4 of riders drifting across the road; returns the path."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {path}")
+    background, _ = render_scene(rng, width, height, riders=0)
+    scale = height / 360
+    starts = [(int(rng.integers(0, width)), int(height * 0.9 - rng.integers(0, height // 8))) for _ in range(riders)]
+    helmets = [bool(rng.random() < 0.5) for _ in range(riders)]
+    texts = [random_plate(rng) for _ in range(riders)]
+    try:
+        for f in range(frames):
+            frame = background.copy()
+            for (x, y), helmet, text in zip(starts, helmets, texts):
+                draw_rider(frame, (x + f * 6) % width, y, scale, helmet, text)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def sample_images(samples_dir):
+    """Images shipped in static/samples, if any."""
+    if not os.path.isdir(samples_dir):
+        return []
+    names = sorted(n for n in os.listdir(samples_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+    return [os.path.join(samples_dir, n) for n in names]
+
+
+def sample_video(samples_dir):
+    path = os.path.join(samples_dir, 'sample_traffic.mp4')
+    return path if os.path.exists(path) else None
@@ -0,0 +1,41 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class StageTimer:
+    """Collects wall-clock samples per named stage and summarizes them as percentiles (ms)."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def summary(self):
+        return {name: summarize(values) for name, values in self.samples.items()}
+
+
+def summarize(seconds):
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not ms.size:
+        return {"count": 0}
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
@@ -0,0 +1,506 @@
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from instrumentation import STAGE_SECONDS
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS detections (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        status_text TEXT NOT NULL,
+        plate_text TEXT,
+        result_url TEXT,
+        plate_url TEXT,
+        is_violation INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# One row per day, kept in step with detections by every insert (see _bump_daily_stats)
+DAILY_STATS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS daily_stats (
+        day TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        violations INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# Offline video jobs (see video_jobs.py) and the violators each one found
+VIDEO_JOBS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS video_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        input_url TEXT,
+        status TEXT NOT NULL DEFAULT 'queued',
+        frames_done INTEGER NOT NULL DEFAULT 0,
+        frames_total INTEGER,
+        elapsed_s REAL,
+        output_url TEXT,
+        violations INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    )
+'''
+
+VIDEO_VIOLATIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS video_violations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL REFERENCES video_jobs (id),
+        detection_id INTEGER REFERENCES detections (id),
+        track_id INTEGER NOT NULL,
+        frame INTEGER NOT NULL,
+        video_time_s REAL,
+        plate_text TEXT,
+        violator_url TEXT,
+        plate_url TEXT
+    )
+'''
+
+# Columns update_video_job may set
+VIDEO_JOB_FIELDS = ("status", "frames_done", "frames_total", "elapsed_s", "output_url", "violations", "error",
+                    "started_at", "finished_at")
+
+# Every column holding a /results URL, nulled when the artifact store evicts the file
+ARTIFACT_URL_COLUMNS = [
+    ("detections", "result_url"),
+    ("detections", "plate_url"),
+    ("video_violations", "violator_url"),
+    ("video_violations", "plate_url"),
+    ("video_jobs", "output_url"),
+]
+
+# Indexes for the dashboard queries (newest-first history is served by the primary key)
+INDEXES = [
+    # Per-day grouping, used when backfilling daily_stats
+    "CREATE INDEX IF NOT EXISTS idx_detections_day ON detections (substr(timestamp, 1, 10))",
+    # History filters; the trailing id lets keyset pages seek straight to `id < cursor`
+    "CREATE INDEX IF NOT EXISTS idx_detections_violation_id ON detections (is_violation, id)",
+    "CREATE INDEX IF NOT EXISTS idx_detections_status_id ON detections (status_text, id)",
+    "CREATE INDEX IF NOT EXISTS idx_detections_plate ON detections (plate_text)",
+    # Turns date filters into an id range (see _id_range)
+    "CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp)",
+    # Looking up rows by artifact URL when the artifact store evicts files
+    "CREATE INDEX IF NOT EXISTS idx_detections_result_url ON detections (result_url)",
+    "CREATE INDEX IF NOT EXISTS idx_detections_plate_url ON detections (plate_url)",
+    "CREATE INDEX IF NOT EXISTS idx_video_violations_job ON video_violations (job_id, frame)",
+    "CREATE INDEX IF NOT EXISTS idx_video_violations_violator_url ON video_violations (violator_url)",
+    "CREATE INDEX IF NOT EXISTS idx_video_violations_plate_url ON video_violations (plate_url)",
+    "CREATE INDEX IF NOT EXISTS idx_video_jobs_output_url ON video_jobs (output_url)",
+]
+
+INSERT_DETECTION = '''
+    INSERT INTO detections (timestamp, status_text, plate_text, result_url, plate_url, is_violation)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+UPSERT_DAILY_STATS = '''
+    INSERT INTO daily_stats (day, total, violations) VALUES (?, ?, ?)
+    ON CONFLICT(day) DO UPDATE SET
+        total = total + excluded.total,
+        violations = violations + excluded.violations
+'''
+
+
+def now_timestamp():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def is_violation_status(status_text):
+    """Same rule as the old `status_text LIKE '%NO HELMET%'` filter (LIKE is case-insensitive)."""
+    return 1 if status_text and "NO HELMET" in status_text.upper() else 0
+
+
+class DetectionDatabase:
+    """
+    Data-access layer for traffic_data.db.
+
+    Connections come from a shared pool of at most `pool_size` long-lived connections,
+    checked out per call and handed back afterwards, so SQLite's per-connection
+    statement cache keeps the fixed SQL below prepared across requests while the
+    server's one-thread-per-request model doesn't open a connection per thread. The
+    database runs in WAL mode, so dashboard reads don't block detection inserts (and
+    vice versa).
+    """
+
+    def __init__(self, db_path, busy_timeout_s=10.0, cached_statements=64, pool_size=8):
+        self.db_path = db_path
+        self.busy_timeout_s = busy_timeout_s
+        self.cached_statements = cached_statements
+        self.pool_size = max(1, pool_size)
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self.init_schema()
+
+    def _connect(self):
+        # Autocommit mode: transaction() issues BEGIN/COMMIT explicitly
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_s, isolation_level=None,
+                               cached_statements=self.cached_statements, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power cut can lose the last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_s * 1000)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks a connection out of the pool for the duration of the block. Opens a new
+        one while fewer than `pool_size` exist, otherwise waits up to busy_timeout_s
+        for one to be handed back.
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.pool_size:
+                    self._opened += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.busy_timeout_s)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"No free database connection after {self.busy_timeout_s}s")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction: # an exception escaped mid-transaction
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yields a cursor inside one write transaction; commits on success, rolls back on error."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # IMMEDIATE takes the write lock up front, so busy_timeout applies instead of a mid-transaction upgrade failure
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except Exception:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def init_schema(self):
+        with self.transaction() as cursor:
+            cursor.execute(SCHEMA)
+            # Databases created before the is_violation flag existed
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(detections)")}
+            added_flag = "is_violation" not in columns
+            if added_flag:
+                cursor.execute("ALTER TABLE detections ADD COLUMN is_violation INTEGER NOT NULL DEFAULT 0")
+            cursor.execute(DAILY_STATS_SCHEMA)
+            cursor.execute(VIDEO_JOBS_SCHEMA)
+            cursor.execute(VIDEO_VIOLATIONS_SCHEMA)
+            for statement in INDEXES:
+                cursor.execute(statement)
+            # The new column defaults every old row to 0, and an empty rollup would read as 0 scans;
+            # both are rebuilt here, before the first insert makes daily_stats look populated
+            needs_backfill = added_flag or (
+                cursor.execute("SELECT 1 FROM daily_stats LIMIT 1").fetchone() is None
+                and cursor.execute("SELECT 1 FROM detections LIMIT 1").fetchone() is not None)
+            if needs_backfill:
+                days = self._backfill(cursor)
+                print(f"[INFO] Migrated {self.db_path}: rebuilt is_violation and daily_stats for {days} day(s)")
+
+    def backfill(self):
+        """
+        Rebuilds is_violation and the daily_stats rollup from the detections table.
+        init_schema does this by itself when it upgrades an old database; this is for
+        repairing the rollup by hand.
+        """
+        with self.transaction() as cursor:
+            return self._backfill(cursor)
+
+    def _backfill(self, cursor):
+        cursor.execute("UPDATE detections SET is_violation = CASE WHEN status_text LIKE '%NO HELMET%' THEN 1 ELSE 0 END")
+        cursor.execute("DELETE FROM daily_stats")
+        cursor.execute('''
+            INSERT INTO daily_stats (day, total, violations)
+            SELECT substr(timestamp, 1, 10), COUNT(*), SUM(is_violation)
+            FROM detections
+            GROUP BY substr(timestamp, 1, 10)
+        ''')
+        return cursor.execute("SELECT COUNT(*) FROM daily_stats").fetchone()[0]
+
+    def _bump_daily_stats(self, cursor, params):
+        """Adds freshly inserted detection rows to daily_stats, inside the caller's transaction."""
+        totals = Counter()
+        violations = Counter()
+        for row in params:
+            day = row[0][:10]
+            totals[day] += 1
+            violations[day] += row[5]
+        cursor.executemany(UPSERT_DAILY_STATS, [(day, totals[day], violations[day]) for day in totals])
+
+    def close_all(self):
+        """Closes the idle pooled connections. Checked-out ones are left to their callers."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    # --- Writes ---
+
+    def _stamp(self, cursor):
+        """
+        Timestamp for rows inserted in the caller's transaction: now, but never earlier
+        than the newest row. Local time steps back at a DST change; holding the stamp keeps
+        timestamps in id order, which the history's date filters rely on (see _id_range).
+        """
+        latest = cursor.execute("SELECT timestamp FROM detections ORDER BY id DESC LIMIT 1").fetchone()
+        now = now_timestamp()
+        return max(now, latest[0]) if latest is not None else now
+
+    def insert_detection(self, status_text, plate_text, result_url, plate_url):
+        """Inserts one detection row and returns its id."""
+        with STAGE_SECONDS.time(stage="db_write"), self.transaction() as cursor:
+            row = (self._stamp(cursor), status_text, plate_text, result_url, plate_url,
+                   is_violation_status(status_text))
+            cursor.execute(INSERT_DETECTION, row)
+            row_id = cursor.lastrowid
+            self._bump_daily_stats(cursor, [row])
+            return row_id
+
+    def insert_detections(self, rows):
+        """
+        Inserts many detections in a single transaction, all stamped with the same time.
+        `rows` are (status_text, plate_text, result_url, plate_url) tuples. Returns the
+        number of rows written.
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+        with STAGE_SECONDS.time(stage="db_write"), self.transaction() as cursor:
+            stamp = self._stamp(cursor)
+            params = [(stamp,) + row + (is_violation_status(row[0]),) for row in rows]
+            cursor.executemany(INSERT_DETECTION, params)
+            self._bump_daily_stats(cursor, params)
+        return len(params)
+
+    def clear_artifact_urls(self, urls):
+        """
+        Nulls the URL columns (ARTIFACT_URL_COLUMNS) of rows pointing at deleted artifacts.
+        Stored URLs may carry a cache-busting "?v=..." suffix, so each URL matches
+        itself and anything starting with "url?" (as an index-friendly range).
+        """
+        if not urls:
+            return 0
+        changed = 0
+        with self.transaction() as cursor:
+            for url in urls:
+                # '@' is the character after '?', so [url?, url@) is every "url?..." string
+                params = (url, url + "?", url + "@")
+                for table, column in ARTIFACT_URL_COLUMNS:
+                    cursor.execute(
+                        f"UPDATE {table} SET {column} = NULL "
+                        f"WHERE {column} = ? OR ({column} >= ? AND {column} < ?)", params)
+                    changed += cursor.rowcount
+        return changed
+
+    # --- Video jobs ---
+
+    def create_video_job(self, filename, input_url=None):
+        with self.transaction() as cursor:
+            cursor.execute("INSERT INTO video_jobs (filename, input_url, created_at) VALUES (?, ?, ?)",
+                           (filename, input_url, now_timestamp()))
+            return cursor.lastrowid
+
+    def update_video_job(self, job_id, **fields):
+        """Sets the given VIDEO_JOB_FIELDS columns of one job."""
+        unknown = set(fields) - set(VIDEO_JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown video job fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.transaction() as cursor:
+            cursor.execute(f"UPDATE video_jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def complete_video_job(self, job_id, output_url, frames, elapsed_s, violators):
+        """
+        Marks a job done and stores its violators in one transaction. Each violator is
+        also added to detections (so it shows up in the history, plate search and daily
+        stats) and linked to it from video_violations. `violators` are the record dicts
+        returned by YOLOv8System.process_video.
+        """
+        with STAGE_SECONDS.time(stage="db_write"), self.transaction() as cursor:
+            timestamp = self._stamp(cursor)
+            rows = []
+            for v in violators:
+                row = (timestamp, "NO HELMET (Violation)", v["plate_text"], v["violator_image_url"],
+                       v["plate_image_url"], 1)
+                cursor.execute(INSERT_DETECTION, row)
+                rows.append(row)
+                cursor.execute('''
+                    INSERT INTO video_violations (job_id, detection_id, track_id, frame, video_time_s,
+                                                  plate_text, violator_url, plate_url)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (job_id, cursor.lastrowid, v["track_id"], v["frame"], v["video_time_s"], v["plate_text"],
+                      v["violator_image_url"], v["plate_image_url"]))
+            if rows:
+                self._bump_daily_stats(cursor, rows)
+            cursor.execute('''
+                UPDATE video_jobs SET status = 'done', output_url = ?, frames_done = ?, frames_total = ?,
+                                      elapsed_s = ?, violations = ?, finished_at = ?
+                WHERE id = ?
+            ''', (output_url, frames, frames, elapsed_s, len(violators), timestamp, job_id))
+        return len(violators)
+
+    def fail_interrupted_video_jobs(self):
+        """Marks jobs left queued or running by a previous server process as failed. Returns how many."""
+        with self.transaction() as cursor:
+            cursor.execute("UPDATE video_jobs SET status = 'failed', error = 'Interrupted by a server restart', "
+                           "finished_at = ? WHERE status IN ('queued', 'running')", (now_timestamp(),))
+            return cursor.rowcount
+
+    # --- Reads ---
+
+    def _query(self, sql, params=(), one=False):
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+
+    def count_scans(self):
+        # Summing the rollup costs O(days) instead of a full table scan
+        return self._query("SELECT COALESCE(SUM(total), 0) FROM daily_stats", one=True)[0]
+
+    def count_violations(self):
+        return self._query("SELECT COALESCE(SUM(violations), 0) FROM daily_stats", one=True)[0]
+
+    def recent_detections(self, limit=10):
+        return self._query("SELECT * FROM detections ORDER BY id DESC LIMIT ?", (limit,))
+
+    def history_page(self, limit=25, before_id=None, status=None, date_from=None, date_to=None, plate_prefix=None):
+        """
+        One page of detections, newest first, using keyset pagination on id.
+        `status` is "violation", "clear" or an exact status_text; dates are
+        "YYYY-MM-DD" (both inclusive). Returns (rows, next_cursor), where next_cursor
+        is the id to pass as `before_id` for the next page, or None on the last page.
+
+        Status and date filters page by seeking on id. A plate prefix can't: its
+        matches come off the plate index in plate order and are sorted by id on every
+        page, so that filter costs in proportion to how many rows match the prefix.
+        """
+        clauses = []
+        params = []
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(int(before_id))
+        if date_from or date_to:
+            id_range = self._id_range(date_from, date_to)
+            if id_range is None:
+                return [], None
+            clauses.append("id BETWEEN ? AND ?")
+            params.extend(id_range)
+        if status == "violation":
+            clauses.append("is_violation = 1")
+        elif status == "clear":
+            clauses.append("is_violation = 0")
+        elif status:
+            clauses.append("status_text = ?")
+            params.append(status)
+        # With timestamps in id order (see _stamp) the id range alone is exact; the per-row check
+        # only keeps rows from outside the dates from ever showing up, it can't add any the range
+        # missed. The "+" keeps the planner on the id range instead of the timestamp index
+        if date_from:
+            clauses.append("+timestamp >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("+timestamp < ?")
+            params.append(date_to + "~")
+        if plate_prefix:
+            # A range instead of LIKE so the plate index can be used
+            clauses.append("plate_text >= ? AND plate_text < ?")
+            params.extend([plate_prefix, plate_prefix + "\U0010ffff"])
+
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        # Fetch one extra row to know whether another page exists
+        rows = self._query(f"SELECT * FROM detections {where} ORDER BY id DESC LIMIT ?", params + [limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1]["id"]
+        return rows, None
+
+    def _id_range(self, date_from=None, date_to=None):
+        """
+        (first id, last id) of the rows stamped between the two dates, from one seek on
+        each end of the timestamp index, or None if no row falls in between. Relies on
+        timestamps never decreasing with id, which _stamp guarantees for every insert
+        (rows can't be given their own timestamp).
+        """
+        with self.connection() as conn:
+            if date_from:
+                row = conn.execute("SELECT id FROM detections WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1",
+                                   (date_from,)).fetchone()
+                if row is None:
+                    return None
+                first = row[0]
+            else:
+                first = 0
+            if date_to:
+                # Timestamps are "YYYY-MM-DD HH:MM:SS", so everything on date_to sorts below date_to + "~"
+                row = conn.execute("SELECT id FROM detections WHERE timestamp < ? "
+                                   "ORDER BY timestamp DESC, id DESC LIMIT 1", (date_to + "~",)).fetchone()
+                if row is None:
+                    return None
+                last = row[0]
+            else:
+                last = conn.execute("SELECT MAX(id) FROM detections").fetchone()[0] or 0
+        return (first, last) if first <= last else None
+
+    def get_video_job(self, job_id):
+        return self._query("SELECT * FROM video_jobs WHERE id = ?", (job_id,), one=True)
+
+    def recent_video_jobs(self, limit=20):
+        return self._query("SELECT * FROM video_jobs ORDER BY id DESC LIMIT ?", (limit,))
+
+    def video_violations(self, job_id):
+        """The violators of one job in the order they appeared."""
+        return self._query("SELECT * FROM video_violations WHERE job_id = ? ORDER BY frame, id", (job_id,))
+
+    def daily_counts(self, limit=7):
+        """(date, total, violations) rows per day (YYYY-MM-DD), read from the daily_stats rollup."""
+        return self._query('''
+            SELECT day as date, total, violations
+            FROM daily_stats
+            ORDER BY day ASC
+            LIMIT ?
+        ''', (limit,))
+
+
+if __name__ == "__main__":
+    # Usage: python database.py backfill [path/to/traffic_data.db]
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("Usage: python database.py backfill [db_path]")
+        sys.exit(1)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traffic_data.db')
+    days = DetectionDatabase(db_path).backfill()
+    print(f"[INFO] Rebuilt daily_stats for {days} day(s) in {db_path}")
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inference_engine import load_model
+from postprocess import DetectionPostProcessor, ROLE_NO_HELMET, ROLE_HEAD, boxes_to_array
+from quantize import list_images
+from tracker import iou_matrix
+
+# The same confidence process_image runs at; mAP is computed from a low-threshold pass
+DECISION_CONF = 0.25
+MAP_CONF = 0.001
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def load_dataset(dataset_dir):
+    """
+    Reads a YOLO-format dataset: images/ with one labels/<stem>.txt per image holding
+    "class cx cy w h" rows (normalized). Returns [(image_path, image, labels (N, 5) class + xyxy pixels)],
+    decoded once here and shared by every engine that is evaluated.
+    """
+    image_dir = os.path.join(dataset_dir, "images")
+    label_dir = os.path.join(dataset_dir, "labels")
+    samples = []
+    for path in list_images(image_dir):
+        img = cv2.imread(path)
+        if img is None:
+            print(f"[WARNING] Could not read {path}, skipped")
+            continue
+        h, w = img.shape[:2]
+        label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        rows = np.loadtxt(label_path, ndmin=2) if os.path.exists(label_path) else np.zeros((0, 5))
+        rows = rows.reshape(-1, 5)
+        labels = np.zeros((len(rows), 5), dtype=np.float32)
+        labels[:, 0] = rows[:, 0]
+        labels[:, 1] = (rows[:, 1] - rows[:, 3] / 2) * w
+        labels[:, 2] = (rows[:, 2] - rows[:, 4] / 2) * h
+        labels[:, 3] = (rows[:, 1] + rows[:, 3] / 2) * w
+        labels[:, 4] = (rows[:, 2] + rows[:, 4] / 2) * h
+        samples.append((path, img, labels))
+    return samples
+
+
+def match_predictions(pred, labels):
+    """
+    Marks each prediction (N, 6 xyxy/conf/cls) as a true positive at every IoU threshold,
+    matching greedily by confidence to same-class labels. Returns an (N, 10) bool array.
+    """
+    correct = np.zeros((len(pred), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(pred) or not len(labels):
+        return correct
+    iou = iou_matrix(pred[:, :4], labels[:, 1:])
+    iou[pred[:, 5][:, None] != labels[:, 0][None, :]] = 0.0
+    order = np.argsort(-pred[:, 4])
+    for t, threshold in enumerate(IOU_THRESHOLDS):
+        taken = np.zeros(len(labels), dtype=bool)
+        for i in order:
+            candidates = np.where(~taken & (iou[i] >= threshold), iou[i], 0.0)
+            j = int(np.argmax(candidates))
+            if candidates[j] > 0:
+                taken[j] = True
+                correct[i, t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """Area under the precision/recall curve with the all-point interpolation used by VOC/COCO tools."""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    idx = np.where(mrec[1:] != mrec[:-1])[0]
+    return float(np.sum((mrec[idx + 1] - mrec[idx]) * mpre[idx + 1]))
+
+
+def mean_average_precision(correct, conf, pred_cls, label_cls):
+    """Returns (mAP@0.5, mAP@0.5:0.95) over the classes that have labels."""
+    order = np.argsort(-conf)
+    correct, pred_cls = correct[order], pred_cls[order]
+    aps = []
+    for cls in np.unique(label_cls):
+        n_labels = int(np.count_nonzero(label_cls == cls))
+        hits = correct[pred_cls == cls]
+        if not len(hits):
+            aps.append(np.zeros(len(IOU_THRESHOLDS)))
+            continue
+        tp = np.cumsum(hits, axis=0)
+        fp = np.cumsum(~hits, axis=0)
+        recall = tp / n_labels
+        precision = tp / (tp + fp)
+        aps.append([average_precision(recall[:, t], precision[:, t]) for t in range(len(IOU_THRESHOLDS))])
+    if not aps:
+        return 0.0, 0.0
+    aps = np.array(aps)
+    return float(aps[:, 0].mean()), float(aps.mean())
+
+
+def evaluate(engine, samples, model_path, imgsz=640, calibration_dir=None, timing_runs=1):
+    """Runs one engine over the dataset. Returns a dict of accuracy and speed metrics."""
+    model, used = load_model(model_path, engine, imgsz, calibration_dir=calibration_dir)
+    if used != engine:
+        raise RuntimeError(f"{engine} is not available")
+    postprocessor = DetectionPostProcessor(model.names)
+    violation_classes = [int(c) for c in np.flatnonzero(np.isin(postprocessor.role_table, (ROLE_NO_HELMET, ROLE_HEAD)))]
+
+    correct, conf, pred_cls, label_cls = [], [], [], []
+    tp = fp = fn = 0
+    images = [img for _, img, _ in samples]
+    for _, img, labels in samples:
+        pred = boxes_to_array(model(img, conf=MAP_CONF, imgsz=imgsz, verbose=False)[0].boxes)
+        correct.append(match_predictions(pred, labels))
+        conf.append(pred[:, 4])
+        pred_cls.append(pred[:, 5])
+        label_cls.append(labels[:, 0])
+
+        # Image-level verdict through process_image's own filtering rules
+        dets = postprocessor.process(pred[pred[:, 4] >= DECISION_CONF], img.shape)
+        predicted = dets.unsafe_count > 0
+        actual = bool(np.isin(labels[:, 0], violation_classes).any())
+        tp += predicted and actual
+        fp += predicted and not actual
+        fn += actual and not predicted
+
+    map50, map50_95 = mean_average_precision(np.concatenate(correct), np.concatenate(conf),
+                                             np.concatenate(pred_cls), np.concatenate(label_cls))
+
+    # Speed at the production threshold, one image per call like /detect, after a warm-up
+    model(images[0], conf=DECISION_CONF, imgsz=imgsz, verbose=False)
+    started = time.perf_counter()
+    for _ in range(timing_runs):
+        for img in images:
+            model(img, conf=DECISION_CONF, imgsz=imgsz, verbose=False)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "engine": engine,
+        "images": len(samples),
+        "mAP50": round(map50, 4),
+        "mAP50-95": round(map50_95, 4),
+        "violation_precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "violation_recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "images_per_s": round(len(images) * timing_runs / elapsed, 2),
+    }
+
+
+def print_table(reports):
+    columns = ["engine", "images", "mAP50", "mAP50-95", "violation_precision", "violation_recall", "images_per_s"]
+    widths = [max(len(col), *(len(str(r[col])) for r in reports)) for col in columns]
+    print("  ".join(col.ljust(w) for col, w in zip(columns, widths)))
+    for r in reports:
+        print("  ".join(str(r[col]).ljust(w) for col, w in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compares inference engines (e.g. pytorch vs onnx-int8) on a labeled YOLO-format dataset.")
+    parser.add_argument("dataset", help="folder with images/ and labels/")
+    parser.add_argument("--engines", default="pytorch,onnx-int8", help="comma-separated engines to compare")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best.pt'))
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--calibration-dir", help="builds INT8 models that aren't cached yet")
+    parser.add_argument("--timing-runs", type=int, default=1, help="passes over the dataset for images/s")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    samples = load_dataset(args.dataset)
+    if not samples:
+        print(f"[ERROR] No images found in {os.path.join(args.dataset, 'images')}")
+        sys.exit(1)
+    reports = [evaluate(engine.strip(), samples, args.model, args.imgsz, args.calibration_dir, args.timing_runs)
+               for engine in args.engines.split(",")]
+    print_table(reports)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
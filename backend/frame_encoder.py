@@ -0,0 +1,133 @@
+import threading
+import time
+
+import cv2
+
+from instrumentation import STAGE_SECONDS
+
+try:
+    from turbojpeg import TurboJPEG
+except ImportError: # PyTurboJPEG is optional, cv2.imencode is used without it
+    TurboJPEG = None
+
+
+class OutputProfile:
+    """One rung of the MJPEG output ladder: frames wider than `max_width` are downscaled (0 = source size)."""
+
+    def __init__(self, name, max_width=0, quality=90):
+        self.name = name
+        self.max_width = max(0, int(max_width))
+        self.quality = min(max(int(quality), 1), 100)
+
+    @property
+    def key(self):
+        # Profiles with the same settings share their encoded frames
+        return (self.max_width, self.quality)
+
+    def to_dict(self):
+        return {"name": self.name, "max_width": self.max_width, "quality": self.quality}
+
+
+def parse_profiles(spec):
+    """
+    Parses a ladder like "full=0:90,hd=1280:80,sd=640:70" (name=max_width:quality)
+    into an ordered {name: OutputProfile} dict.
+    """
+    profiles = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, settings = item.partition("=")
+        width, _, quality = settings.partition(":")
+        profiles[name.strip()] = OutputProfile(name.strip(), int(width or 0), int(quality or 90))
+    if not profiles:
+        raise ValueError(f"No output profiles in {spec!r}")
+    return profiles
+
+
+class JpegEncoder:
+    """
+    Resizes and JPEG-encodes frames for an OutputProfile.
+    Uses libjpeg-turbo through PyTurboJPEG when it is installed (and `use_turbo` allows
+    it), otherwise cv2.imencode. Keeps per-profile encode timing and output size.
+    """
+
+    def __init__(self, use_turbo="auto"):
+        self.turbo = None
+        if use_turbo in (True, "auto", "1") and TurboJPEG is not None:
+            try:
+                self.turbo = TurboJPEG()
+            except Exception as e: # the wrapper is installed but libturbojpeg isn't
+                print(f"[WARNING] libjpeg-turbo unavailable, using cv2.imencode: {e}")
+        elif use_turbo in (True, "1"):
+            print("[WARNING] PyTurboJPEG is not installed, using cv2.imencode")
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return "turbojpeg" if self.turbo is not None else "opencv"
+
+    def encode(self, frame, profile):
+        """Returns the JPEG bytes of `frame` for `profile`, or None if encoding failed."""
+        started = time.perf_counter()
+        height, width = frame.shape[:2]
+        if profile.max_width and width > profile.max_width:
+            scale = profile.max_width / width
+            frame = cv2.resize(frame, (profile.max_width, max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+        if self.turbo is not None:
+            data = self.turbo.encode(frame, quality=profile.quality)
+        else:
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, profile.quality])
+            data = buffer.tobytes() if ret else None
+
+        if data is not None:
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.observe(elapsed, stage="encode")
+            with self._lock:
+                frames, total_s, total_bytes = self._stats.get(profile.name, (0, 0.0, 0))
+                self._stats[profile.name] = (frames + 1, total_s + elapsed, total_bytes + len(data))
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "frames": frames,
+                    "avg_encode_ms": round(total_s / frames * 1000, 2),
+                    "avg_frame_kb": round(total_bytes / frames / 1024, 1),
+                }
+                for name, (frames, total_s, total_bytes) in self._stats.items()
+            }
+
+
+class SharedFrame:
+    """
+    An annotated frame plus its encodings, published once to every viewer of a stream.
+    Each distinct profile is encoded the first time a viewer asks for it and then
+    reused by the others, so N viewers of the same rung cost one encode per frame.
+    """
+
+    def __init__(self, image, encoder):
+        self.image = image
+        self.encoder = encoder
+        self._encoded = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def encode(self, profile):
+        with self._lock:
+            if profile.key in self._encoded:
+                return self._encoded[profile.key]
+            lock = self._locks.setdefault(profile.key, threading.Lock())
+        # Per-profile lock: different rungs encode in parallel, the same rung only once
+        with lock:
+            with self._lock:
+                if profile.key in self._encoded:
+                    return self._encoded[profile.key]
+            data = self.encoder.encode(self.image, profile)
+            with self._lock:
+                self._encoded[profile.key] = data
+            return data
@@ -0,0 +1,67 @@
+import math
+import time
+
+
+class AdaptiveStride:
+    """
+    Chooses how many source frames to advance per analyzed frame.
+
+    Processing one frame in `t` seconds at stride `s` covers `s / fps` seconds of video,
+    so the real-time factor is `s / (fps * t)`. The scheduler keeps an EMA of `t` and
+    picks the smallest stride that meets `target_rtf`, with a little hysteresis so the
+    stride doesn't flap between two values on noisy timings.
+    """
+
+    def __init__(self, source_fps, target_rtf=1.0, initial_stride=2, min_stride=1, max_stride=8,
+                 smoothing=0.2, hysteresis=0.15):
+        # Cameras that don't report an FPS are assumed to run at 30
+        self.source_fps = source_fps if source_fps and source_fps > 0 else 30.0
+        self.target_rtf = target_rtf
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.stride = min(max(initial_stride, self.min_stride), self.max_stride)
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.avg_processing_s = None
+        self.analyzed = 0
+        self.grabbed = 0
+        self._last_done = None
+        self.achieved_fps = 0.0
+
+    def record(self, processing_s):
+        """Feeds the wall time one analyzed frame took and updates the stride."""
+        if self.avg_processing_s is None:
+            self.avg_processing_s = processing_s
+        else:
+            self.avg_processing_s += self.smoothing * (processing_s - self.avg_processing_s)
+        self.analyzed += 1
+
+        now = time.perf_counter()
+        if self._last_done is not None:
+            inst_fps = 1.0 / max(now - self._last_done, 1e-6)
+            self.achieved_fps += self.smoothing * (inst_fps - self.achieved_fps)
+        self._last_done = now
+
+        required = self.target_rtf * self.source_fps * self.avg_processing_s
+        wanted = min(max(math.ceil(required), self.min_stride), self.max_stride)
+        if wanted > self.stride:
+            self.stride = wanted
+        elif wanted < self.stride and required < (self.stride - 1) * (1.0 - self.hysteresis):
+            # Only step down once the smaller stride is comfortably fast enough
+            self.stride = wanted
+
+    @property
+    def pace_fps(self):
+        """Analyzed frames per second that keeps a file source in real time at the current stride."""
+        return self.source_fps / self.stride
+
+    def stats(self):
+        return {
+            "stride": self.stride,
+            "source_fps": round(self.source_fps, 2),
+            "target_rtf": self.target_rtf,
+            "processing_ms": round(self.avg_processing_s * 1000, 1) if self.avg_processing_s is not None else None,
+            "achieved_fps": round(self.achieved_fps, 2),
+            "analyzed_frames": self.analyzed,
+            "skipped_frames": self.grabbed,
+        }
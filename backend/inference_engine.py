@@ -0,0 +1,172 @@
+import os
+import shutil
+import sys
+
+from ultralytics import YOLO
+
+# Engine name -> ultralytics export format (None = run the .pt weights directly)
+ENGINES = {
+    "pytorch": None,
+    "onnx": "onnx",
+    "openvino": "openvino",
+    # INT8 variants, built once from a calibration image folder (see quantize.py)
+    "onnx-int8": "onnx",
+    "openvino-int8": "openvino",
+}
+
+# Module the engine needs at runtime, checked before spending time on an export
+ENGINE_RUNTIMES = {
+    "onnx": "onnxruntime",
+    "openvino": "openvino",
+    "onnx-int8": "onnxruntime",
+    "openvino-int8": "openvino",
+}
+
+
+def engine_available(engine):
+    runtime = ENGINE_RUNTIMES.get(engine)
+    if runtime is None:
+        return True
+    try:
+        __import__(runtime)
+    except ImportError:
+        return False
+    return True
+
+
+def exported_path(model_path, engine, imgsz=640, cache_dir=None):
+    """Where the converted model for `engine` is cached: <cache_dir>/<stem>_<imgsz>[_int8].onnx or ..._openvino_model/."""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(model_path)), 'engine_cache')
+    suffix = "_int8" if engine.endswith("-int8") else ""
+    if ENGINES[engine] == "onnx":
+        return os.path.join(cache_dir, f"{stem}_{imgsz}{suffix}.onnx")
+    return os.path.join(cache_dir, f"{stem}_{imgsz}{suffix}_openvino_model")
+
+
+def export_model(model_path, engine, imgsz=640, cache_dir=None, calibration_dir=None):
+    """
+    Returns the path of `model_path` converted for `engine`, exporting it on first use.
+    The export is redone when the .pt weights are newer than the cached copy.
+    INT8 engines need `calibration_dir` (a folder of representative images) to be built;
+    delete the cached copy to recalibrate.
+    """
+    target = exported_path(model_path, engine, imgsz, cache_dir)
+    if os.path.exists(target) and (not os.path.exists(model_path)
+                                   or os.path.getmtime(target) >= os.path.getmtime(model_path)):
+        return target
+
+    if engine.endswith("-int8"):
+        if not calibration_dir:
+            raise ValueError(f"No cached {engine} model at {target}. Build it with: "
+                             f"python quantize.py {ENGINES[engine]} <calibration_image_dir>")
+        import quantize
+        if engine == "onnx-int8":
+            # Quantized from the float ONNX export, which is cached as well
+            fp32_path = export_model(model_path, "onnx", imgsz, cache_dir)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            return quantize.quantize_onnx_int8(fp32_path, target, calibration_dir, imgsz)
+        produced = quantize.quantize_openvino_int8(model_path, calibration_dir, imgsz)
+    else:
+        print(f"[INFO] Exporting {model_path} to {engine} (imgsz={imgsz}), this only happens once...")
+        # Dynamic shapes so process_images can still send mini-batches
+        produced = YOLO(model_path).export(format=ENGINES[engine], imgsz=imgsz, dynamic=True, half=False)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    shutil.move(str(produced), target)
+    print(f"[INFO] Cached {engine} model at {target}")
+    return target
+
+
+def load_model(model_path, engine="pytorch", imgsz=640, cache_dir=None, calibration_dir=None):
+    """
+    Loads `model_path` for the given engine. Every engine is wrapped in the same
+    ultralytics YOLO interface, so callers get the same `results.boxes` and run the
+    same post-processing whatever the backend. Falls back to PyTorch when the
+    engine's runtime isn't installed.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown inference engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    if engine != "pytorch" and not engine_available(engine):
+        print(f"[WARNING] {ENGINE_RUNTIMES[engine]} is not installed, falling back to the PyTorch engine")
+        engine = "pytorch"
+    if engine == "pytorch":
+        return YOLO(model_path), engine
+    return YOLO(export_model(model_path, engine, imgsz, cache_dir, calibration_dir), task="detect"), engine
+
+
+def compare_detections(reference, candidate, iou_threshold=0.5):
+    """
+    Compares two FrameDetections of the same image. Returns a list of mismatch
+    descriptions (empty when the verdicts and boxes agree).
+    """
+    from tracker import iou_matrix, greedy_assign
+
+    problems = []
+    for attr in ("safe_count", "unsafe_count"):
+        if getattr(reference, attr) != getattr(candidate, attr):
+            problems.append(f"{attr} {getattr(reference, attr)} != {getattr(candidate, attr)}")
+    if len(reference.plate_indices) != len(candidate.plate_indices):
+        problems.append(f"plates {len(reference.plate_indices)} != {len(candidate.plate_indices)}")
+
+    # Every reference box should have a same-class box in the candidate
+    cost = 1.0 - iou_matrix(reference.xyxy, candidate.xyxy)
+    same_class = reference.cls[:, None] == candidate.cls[None, :]
+    cost[~same_class] = 1.0
+    matched = greedy_assign(cost, 1.0 - iou_threshold)
+    if len(matched) != len(reference.xyxy) or len(matched) != len(candidate.xyxy):
+        problems.append(f"{len(matched)} matching boxes out of {len(reference.xyxy)} / {len(candidate.xyxy)}")
+    return problems
+
+
+def verify(engine, image_paths, model_path, imgsz=640, conf=0.25):
+    """Runs PyTorch and `engine` on the same images and reports where the post-processed results differ."""
+    import cv2
+    from postprocess import DetectionPostProcessor
+
+    reference_model, _ = load_model(model_path, "pytorch", imgsz)
+    candidate_model, used = load_model(model_path, engine, imgsz)
+    if used != engine:
+        print(f"[ERROR] {engine} is not available")
+        return False
+    postprocessor = DetectionPostProcessor(reference_model.names)
+
+    matches = 0
+    for path in image_paths:
+        img = cv2.imread(path)
+        if img is None:
+            # Counted as a failure: an image nobody compared doesn't show the engines agree
+            print(f"[ERROR] Could not read {path}")
+            continue
+        reference = postprocessor.process(reference_model(img, conf=conf, imgsz=imgsz, verbose=False)[0].boxes, img.shape)
+        candidate = postprocessor.process(candidate_model(img, conf=conf, imgsz=imgsz, verbose=False)[0].boxes, img.shape)
+        problems = compare_detections(reference, candidate)
+        if problems:
+            print(f"[MISMATCH] {os.path.basename(path)}: {'; '.join(problems)}")
+        else:
+            matches += 1
+            print(f"[OK] {os.path.basename(path)}: {len(reference.xyxy)} boxes")
+    print(f"[INFO] {engine}: {matches}/{len(image_paths)} images match PyTorch")
+    return bool(image_paths) and matches == len(image_paths)
+
+
+if __name__ == "__main__":
+    # Usage: python inference_engine.py export <engine> [model_path]
+    #        python inference_engine.py verify <engine> <image> [<image> ...]
+    default_model = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best.pt')
+    if len(sys.argv) < 3 or sys.argv[1] not in ("export", "verify") or sys.argv[2] not in ENGINES:
+        print("Usage: python inference_engine.py export <engine> [model_path]\n"
+              "       python inference_engine.py verify <engine> <image> [<image> ...]\n"
+              f"Engines: {', '.join(ENGINES)}")
+        sys.exit(1)
+    imgsz = int(os.environ.get('INFERENCE_IMGSZ', 640))
+    if sys.argv[1] == "export":
+        model_path = sys.argv[3] if len(sys.argv) > 3 else default_model
+        if sys.argv[2] != "pytorch":
+            if not engine_available(sys.argv[2]):
+                print(f"[ERROR] {ENGINE_RUNTIMES[sys.argv[2]]} is not installed")
+                sys.exit(1)
+            export_model(model_path, sys.argv[2], imgsz)
+    else:
+        sys.exit(0 if verify(sys.argv[2], sys.argv[3:], default_model, imgsz) else 1)
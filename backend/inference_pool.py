@@ -0,0 +1,377 @@
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import types
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from instrumentation import STAGE_SECONDS, POOL_REJECTED_TOTAL, POOL_RESTARTS_TOTAL, log_event
+
+# Room for a 1080p BGR frame; larger frames are downscaled to fit (YOLO letterboxes to imgsz anyway)
+DEFAULT_SLOT_BYTES = 8 * 1024 * 1024
+
+
+class PoolBusy(RuntimeError):
+    """Every frame slot stayed taken for the whole submit timeout."""
+
+
+class PoolFailed(RuntimeError):
+    """Every worker gave up loading the model; the pool can't serve frames any more."""
+
+
+# Serializes hidden_main: the swap is process-wide, and overlapping swaps could restore the wrong module
+_main_lock = threading.RLock()
+
+
+@contextmanager
+def hidden_main():
+    """
+    Spawned children re-run the parent's __main__ before calling their target, which for
+    `python app.py` would build a second app (and pool) in every worker. Workers only
+    need the module of their target, so the main module is swapped out while they start.
+    spawn reads __main__ whatever the target is, so this can't be avoided by the target
+    alone; the swap is held under a lock and kept to the process start calls.
+    """
+    with _main_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def _worker_main(index, model_path, engine, imgsz, calibration_dir, threads, conf, slot_names, tasks, results):
+    """
+    Runs in a child process: loads its own copy of the model, then reads frames out of
+    the shared-memory slots named by the tasks and sends back the raw (N, 6) boxes.
+    """
+    # Every worker gets its share of the cores, instead of each runtime sizing its pool to all of them
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from inference_engine import load_model
+
+    try:
+        model, engine = load_model(model_path, engine, imgsz, calibration_dir=calibration_dir)
+        # Warm-up, so the first real frame doesn't pay for predictor setup
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), conf=conf, imgsz=imgsz, verbose=False)
+    except Exception as e:
+        results.put(("failed", index, str(e)))
+        return
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    results.put(("ready", index, model.names, engine))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, shape = task
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+            try:
+                started = time.perf_counter()
+                boxes = model(frame, conf=conf, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+                results.put(("done", index, task_id, boxes, time.perf_counter() - started))
+            except Exception as e:
+                results.put(("error", index, task_id, str(e)))
+            # The view has to go before the segment can be closed
+            del frame
+    finally:
+        for shm in slots:
+            shm.close()
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.tasks = None
+        self.ready = False
+        self.failed = None
+        # Deaths while loading the model since the worker was last ready
+        self.load_failures = 0
+        # task id -> (slot, scale, future) of frames sent to this worker and not answered yet
+        self.in_flight = {}
+        self.completed = 0
+        self.restarts = 0
+
+
+class InferencePool:
+    """
+    Runs the detector in `workers` separate processes, each with its own model, so
+    forward passes of different requests run in parallel instead of taking turns on
+    the GIL. Frames are copied into a fixed set of shared-memory slots and only the
+    slot index goes through the task queue; results come back as small (N, 6) box
+    arrays (xyxy, conf, cls), ready for DetectionPostProcessor.
+
+    There are `slots_per_worker` slots per worker. A frame goes to the live worker
+    with the fewest frames in flight; when every slot is taken, `submit` waits up to
+    `submit_timeout` and then raises PoolBusy, so load beyond what the workers can
+    absorb is refused instead of queued without bound. A worker that dies is
+    restarted and the frames it held fail. One that keeps dying while it loads its
+    model (e.g. killed for memory) is given up on after MAX_LOAD_FAILURES tries.
+    """
+
+    MAX_LOAD_FAILURES = 3
+
+    def __init__(self, model_path, engine="pytorch", imgsz=640, workers=2, slots_per_worker=2,
+                 slot_bytes=DEFAULT_SLOT_BYTES, threads_per_worker=0, calibration_dir=None, conf=0.25,
+                 submit_timeout=10.0):
+        self.model_path = model_path
+        self.engine = engine
+        self.imgsz = imgsz
+        self.conf = conf
+        self.calibration_dir = calibration_dir
+        self.submit_timeout = submit_timeout
+        self.slot_bytes = slot_bytes
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // max(1, workers))
+        self.names = None
+        self._ctx = mp.get_context("spawn") # forking a process that already runs torch threads isn't safe
+        self._workers = [_Worker(i) for i in range(max(1, workers))]
+        self._slot_count = len(self._workers) * max(1, slots_per_worker)
+        self._slots = []
+        self._free = []
+        self._results = None
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        self._collector = None
+        self._closed = False
+
+    def start(self, timeout=300.0):
+        """
+        Creates the slots and workers and blocks until every worker has loaded its model.
+        Raises if a worker fails to load or they aren't all ready within `timeout` seconds.
+        """
+        from inference_engine import ENGINES, engine_available, export_model
+
+        # Converted once here, so the workers don't all export the same model at the same time
+        if ENGINES.get(self.engine) and engine_available(self.engine) and os.path.exists(self.model_path):
+            export_model(self.model_path, self.engine, self.imgsz, calibration_dir=self.calibration_dir)
+
+        self._slots = [shared_memory.SharedMemory(create=True, size=self.slot_bytes) for _ in range(self._slot_count)]
+        self._free = list(range(self._slot_count))
+        self._results = self._ctx.Queue()
+        atexit.register(self.close)
+        for worker in self._workers:
+            self._spawn(worker)
+        self._collector = threading.Thread(target=self._collect, name="inference-pool", daemon=True)
+        self._collector.start()
+
+        with self._cond:
+            done = self._cond.wait_for(lambda: all(w.ready or w.failed for w in self._workers), timeout)
+            failed = [w for w in self._workers if w.failed]
+        if not done:
+            self.close()
+            raise TimeoutError(f"Inference workers still loading after {timeout}s")
+        if failed:
+            self.close()
+            raise RuntimeError(f"Inference worker {failed[0].index} failed to load: {failed[0].failed}")
+        print(f"[INFO] Inference pool ready: {len(self._workers)} {self.engine} workers x "
+              f"{self.threads_per_worker} threads, {self._slot_count} frame slots")
+        return self
+
+    def _spawn(self, worker):
+        worker.tasks = self._ctx.Queue()
+        worker.ready = False
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, self.model_path, self.engine, self.imgsz, self.calibration_dir,
+                  self.threads_per_worker, self.conf, [shm.name for shm in self._slots], worker.tasks, self._results),
+            name=f"inference-worker-{worker.index}",
+            daemon=True,
+        )
+        with hidden_main():
+            worker.process.start()
+
+    @property
+    def failed(self):
+        """True once every worker has been given up on."""
+        return all(w.failed for w in self._workers)
+
+    def submit(self, image, timeout=-1):
+        """
+        Queues one BGR frame and returns a Future of its boxes. Waits for a free slot for
+        `timeout` seconds (default: the pool's submit_timeout, None: forever) before
+        raising PoolBusy. Raises PoolFailed right away (also while waiting) once no worker
+        is left. The frame is copied, so the caller may reuse it right away.
+        """
+        if timeout == -1:
+            timeout = self.submit_timeout
+        future = Future()
+        with self._cond:
+            available = self._cond.wait_for(
+                lambda: self._closed or self.failed or (self._free and any(w.ready for w in self._workers)), timeout)
+            if self._closed:
+                raise RuntimeError("Inference pool is closed")
+            if self.failed:
+                raise PoolFailed("Every inference worker failed to load the model")
+            if not available:
+                POOL_REJECTED_TOTAL.inc()
+                raise PoolBusy(f"All {self._slot_count} inference slots are busy")
+            slot = self._free.pop()
+            worker = min((w for w in self._workers if w.ready), key=lambda w: len(w.in_flight))
+            task_id = next(self._ids)
+            scale = 1.0
+            if image.nbytes > self.slot_bytes:
+                scale = (self.slot_bytes / image.nbytes) ** 0.5
+            worker.in_flight[task_id] = (slot, scale, future)
+
+        if scale < 1.0:
+            height, width = image.shape[:2]
+            image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        np.ndarray(image.shape, dtype=np.uint8, buffer=self._slots[slot].buf)[...] = image
+        worker.tasks.put((task_id, slot, image.shape))
+        return future
+
+    def infer(self, image, timeout=-1):
+        """Boxes of one frame, blocking. See submit for `timeout`."""
+        return self.submit(image, timeout).result()
+
+    def _collect(self):
+        last_check = time.monotonic()
+        while not self._closed:
+            # Checked on a timer too, a busy result queue must not hide a dead worker
+            if time.monotonic() - last_check > 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            kind, worker = message[0], self._workers[message[1]]
+
+            if kind == "ready":
+                with self._cond:
+                    self.names, self.engine = message[2], message[3]
+                    worker.ready = True
+                    worker.load_failures = 0
+                    self._cond.notify_all()
+            elif kind == "failed":
+                self._mark_failed(worker, message[2])
+            else:
+                task_id = message[2]
+                with self._cond:
+                    entry = worker.in_flight.pop(task_id, None)
+                    if entry is None:
+                        continue
+                    slot, scale, future = entry
+                    self._free.append(slot)
+                    worker.completed += 1
+                    self._cond.notify_all()
+                if kind == "done":
+                    boxes, seconds = message[3], message[4]
+                    STAGE_SECONDS.observe(seconds, stage="inference")
+                    if scale < 1.0:
+                        boxes[:, :4] /= scale # back to the caller's frame size
+                    future.set_result(boxes)
+                else:
+                    future.set_exception(RuntimeError(f"Inference failed: {message[3]}"))
+
+    def _check_workers(self):
+        """Restarts workers that died, failing the frames they were holding."""
+        for worker in self._workers:
+            if self._closed or worker.process is None or worker.process.is_alive() or worker.failed:
+                continue
+            if not worker.ready:
+                # Died while loading, before it could report "ready" or "failed"
+                worker.load_failures += 1
+                log_event("ERROR", "inference_worker_died_loading", key=worker.index, worker=worker.index,
+                          exitcode=worker.process.exitcode, attempt=worker.load_failures)
+                if worker.load_failures >= self.MAX_LOAD_FAILURES:
+                    self._mark_failed(worker, f"exited with code {worker.process.exitcode} while loading the model")
+                else:
+                    worker.restarts += 1
+                    POOL_RESTARTS_TOTAL.inc()
+                    self._spawn(worker)
+                continue
+            with self._cond:
+                worker.ready = False
+                lost = list(worker.in_flight.values())
+                worker.in_flight.clear()
+                for slot, _, _ in lost:
+                    self._free.append(slot)
+                self._cond.notify_all()
+            for _, _, future in lost:
+                future.set_exception(RuntimeError(f"Inference worker {worker.index} died"))
+            worker.restarts += 1
+            POOL_RESTARTS_TOTAL.inc()
+            log_event("ERROR", "inference_worker_died", key=worker.index, worker=worker.index,
+                      exitcode=worker.process.exitcode, lost_frames=len(lost))
+            self._spawn(worker)
+
+    def _mark_failed(self, worker, reason):
+        """Gives up on a worker: fails the frames it still held and wakes every waiting submit."""
+        with self._cond:
+            worker.failed = reason
+            lost = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            for slot, _, _ in lost:
+                self._free.append(slot)
+            pool_failed = self.failed
+            self._cond.notify_all()
+        for _, _, future in lost:
+            future.set_exception(PoolFailed(f"Inference worker {worker.index} failed: {reason}"))
+        if pool_failed:
+            log_event("ERROR", "inference_pool_failed", workers=len(self._workers), reason=reason, interval_s=None)
+
+    @property
+    def in_flight(self):
+        with self._cond:
+            return sum(len(w.in_flight) for w in self._workers)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "engine": self.engine,
+                "slots": self._slot_count,
+                "free_slots": len(self._free),
+                "threads_per_worker": self.threads_per_worker,
+                "failed": self.failed,
+                "workers": [{"ready": w.ready, "failed": w.failed, "in_flight": len(w.in_flight),
+                             "completed": w.completed, "restarts": w.restarts} for w in self._workers],
+            }
+
+    def close(self):
+        """Stops the workers and frees the shared memory. Safe to call more than once."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            lost = [entry for w in self._workers for entry in w.in_flight.values()]
+            for w in self._workers:
+                w.in_flight.clear()
+            self._cond.notify_all()
+        for _, _, future in lost:
+            future.set_exception(RuntimeError("Inference pool is closed"))
+        for worker in self._workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
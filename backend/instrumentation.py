@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a fast NumPy step up to a slow CPU inference or OCR read
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Base of the metric types: a name, help text and a value per label combination."""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount <= 0:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With `fn`, the value is read at scrape time instead:
+    `fn()` returns a number, or a {label values tuple: number} dict for labelled gauges.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), fn=None):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.fn is None:
+            return super()._samples()
+        try:
+            values = self.fn()
+        except Exception as e:
+            log_event("ERROR", "metric_collect_failed", key=self.name, metric=self.name, error=e)
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[idx] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Adds `metric`, or returns the one already registered under its name."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def gauge(name, help_text, labels=(), fn=None):
+    return REGISTRY.register(Gauge(name, help_text, labels, fn))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+# --- Pipeline metrics ---
+
+STAGE_SECONDS = histogram("helmet_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_SECONDS = histogram("helmet_http_request_seconds",
+                            "HTTP handler time (until the first byte for streaming responses).",
+                            ("endpoint", "method", "status"))
+IMAGES_TOTAL = counter("helmet_images_processed_total", "Images and stream frames run through the model.", ("source",))
+DETECTIONS_TOTAL = counter("helmet_detections_total", "Detections kept after filtering, by role.", ("role",))
+VIOLATIONS_TOTAL = counter("helmet_violations_total",
+                           "Images with a violation, or distinct violators recorded on streams.", ("source",))
+OCR_CALLS_TOTAL = counter("helmet_ocr_calls_total", "Plate crops sent to OCR (single or batched), including cache hits.")
+OCR_CACHE_HITS_TOTAL = counter("helmet_ocr_cache_hits_total", "Plate crops answered by the OCR cache.")
+OCR_DROPPED_TOTAL = counter("helmet_ocr_dropped_total", "Plate crops not queued because the OCR queue was full.")
+FRAMES_DROPPED_TOTAL = counter("helmet_frames_dropped_total",
+                               "Frames dropped by latest-frame-wins pipeline queues.", ("queue",))
+FRAMES_SKIPPED_TOTAL = counter("helmet_frames_skipped_total", "Source frames skipped by the adaptive stride.")
+FRAMES_GATED_TOTAL = counter("helmet_frames_gated_total",
+                             "Decoded stream frames that reused the last detections because nothing moved.")
+POOL_REJECTED_TOTAL = counter("helmet_inference_pool_rejected_total",
+                              "Frames refused because every inference worker slot stayed busy.")
+POOL_RESTARTS_TOTAL = counter("helmet_inference_pool_restarts_total", "Inference worker processes restarted after dying.")
+
+
+# --- Rate-limited structured logging ---
+
+LOG_JSON = os.environ.get('LOG_FORMAT', 'text') == 'json'
+_log_state = {}
+_log_lock = threading.Lock()
+
+
+def log_event(level, event, key=None, interval_s=10.0, **fields):
+    """
+    Logs `event` with its fields as `[LEVEL] event k=v ...` (or one JSON object per line
+    with LOG_FORMAT=json). Each (event, key) pair is printed at most once per
+    `interval_s`; repeats in between are counted and reported with the next line, so
+    per-frame events can't flood stdout. `interval_s=None` prints every call, for
+    once-per-request events where throttling would hide one request's result behind another's.
+    """
+    suppressed = 0
+    if interval_s is not None:
+        now = time.monotonic()
+        with _log_lock:
+            last, suppressed = _log_state.get((event, key), (None, 0))
+            if last is not None and now - last < interval_s:
+                _log_state[(event, key)] = (last, suppressed + 1)
+                return
+            _log_state[(event, key)] = (now, 0)
+    if suppressed:
+        fields["suppressed"] = suppressed
+    if LOG_JSON:
+        print(json.dumps(dict({"ts": round(time.time(), 3), "level": level, "event": event}, **fields), default=str))
+    else:
+        print(f"[{level}] {event} " + " ".join(f"{k}={v}" for k, v in fields.items()))
@@ -2,11 +2,107 @@ import cv2
 import numpy as np
 import easyocr
 import imutils
+import queue
+import threading
+import time
+from ocr_cache import PlateOCRCache
+from instrumentation import STAGE_SECONDS, OCR_CALLS_TOTAL, OCR_CACHE_HITS_TOTAL, OCR_DROPPED_TOTAL, log_event
+
+def parse_ocr_result(result, min_prob=0.2):
+    """Joins the EasyOCR pieces read with more than `min_prob` into one string. Returns (text, mean confidence)."""
+    kept = [(t, prob) for (bbox, t, prob) in result if prob > min_prob]
+    text = " ".join(t for t, _ in kept).strip().upper()
+    confidence = sum(prob for _, prob in kept) / len(kept) if kept else 0.0
+    return text, round(float(confidence), 3)
+
+def scale_crop(plate_image, height):
+    """Upscales (or shrinks) a plate crop to `height` pixels keeping its aspect ratio, the OCR input size."""
+    h, w = plate_image.shape[:2]
+    width = max(1, round(w * height / h))
+    return cv2.resize(plate_image, (width, height), interpolation=cv2.INTER_CUBIC)
 
 class LicensePlateDetector:
-    def __init__(self, use_gpu=False):
+    # Crops are scaled to this height before OCR, single or batched, so both read the same
+    # pixels; about what the old 2x upscale gave a typical plate
+    OCR_HEIGHT = 64
+    # Crops whose scaled widths are within this ratio share one readtext_batched call, so padding stays small
+    BATCH_WIDTH_RATIO = 1.25
+
+    def __init__(self, use_gpu=False, ocr_workers=0, ocr_queue_size=32, cache_size=256):
+        self.use_gpu = use_gpu
         # Initialize EasyOCR reader
         self.reader = easyocr.Reader(['en'], gpu=use_gpu, verbose=False)
+        # The shared reader is used from request threads and the first OCR worker
+        self._reader_lock = threading.Lock()
+
+        # Near-identical crops (e.g. a stationary bike) reuse their earlier OCR result
+        self.ocr_cache = PlateOCRCache(cache_size) if cache_size > 0 else None
+
+        # Asynchronous OCR pool (see submit_ocr)
+        self._ocr_queue = None
+        self._ocr_threads = []
+        self.ocr_dropped = 0
+        if ocr_workers > 0:
+            self.start_ocr_workers(ocr_workers, ocr_queue_size)
+
+    def start_ocr_workers(self, num_workers=1, queue_size=32):
+        """
+        Starts background OCR workers fed by a bounded queue.
+        The first worker shares self.reader; each extra worker loads its own EasyOCR
+        reader (roughly 100MB each) so they can recognize in parallel.
+        """
+        if self._ocr_queue is not None:
+            return
+        self._ocr_queue = queue.Queue(maxsize=queue_size)
+        for idx in range(num_workers):
+            t = threading.Thread(target=self._ocr_worker_loop, args=(idx,), name=f"ocr-worker-{idx}", daemon=True)
+            t.start()
+            self._ocr_threads.append(t)
+        print(f"[INFO] Started {num_workers} OCR worker(s), queue size {queue_size}")
+
+    def stop_ocr_workers(self):
+        if self._ocr_queue is None:
+            return
+        for _ in self._ocr_threads:
+            self._ocr_queue.put(None)
+        for t in self._ocr_threads:
+            t.join(timeout=5.0)
+        self._ocr_queue = None
+        self._ocr_threads = []
+
+    def submit_ocr(self, plate_image, callback, track_id=None):
+        """
+        Queues a plate crop for OCR; `callback(text)` runs on a worker thread once it's read.
+        Returns False (and drops the crop) when no workers run or the queue is full,
+        so callers on the video path never wait for EasyOCR.
+        """
+        if self._ocr_queue is None or plate_image is None or plate_image.size == 0:
+            return False
+        try:
+            self._ocr_queue.put_nowait((plate_image, callback, track_id))
+        except queue.Full:
+            self.ocr_dropped += 1
+            OCR_DROPPED_TOTAL.inc()
+            return False
+        return True
+
+    def ocr_queue_depth(self):
+        return self._ocr_queue.qsize() if self._ocr_queue is not None else 0
+
+    def _ocr_worker_loop(self, idx):
+        reader = None
+        if idx > 0:
+            reader = easyocr.Reader(['en'], gpu=self.use_gpu, verbose=False)
+        while True:
+            job = self._ocr_queue.get()
+            if job is None:
+                break
+            plate_image, callback, track_id = job
+            try:
+                text = self.recognize_text(plate_image, reader=reader, track_id=track_id)
+                callback(text)
+            except Exception as e:
+                log_event("ERROR", "ocr_worker_failed", key=idx, worker=idx, error=e)
 
     def detect_plate(self, image):
         """
@@ -67,17 +163,27 @@ class LicensePlateDetector:
         img = cv2.subtract(imgGrayscalePlusTopHat, imgBlackHat)
         return img
 
-    def recognize_text(self, plate_image):
+    def recognize_text(self, plate_image, reader=None, track_id=None):
         """
         Performs OCR on the cropped plate image.
+        `reader` lets OCR workers use their own EasyOCR instance instead of the shared one.
+        Results are cached by a perceptual hash of the crop, scoped to `track_id` when given.
         """
         if plate_image is None or plate_image.size == 0:
             return ""
+        OCR_CALLS_TOTAL.inc()
+
+        cache_key = None
+        if self.ocr_cache is not None:
+            cache_key = self.ocr_cache.make_key(plate_image, track_id)
+            cached = self.ocr_cache.get(cache_key)
+            if cached is not None:
+                OCR_CACHE_HITS_TOTAL.inc()
+                return cached[0]
 
         # Enhance image for OCR
-        # 1. Resize: Upscale to make characters larger/clearer
-        scale = 2.0
-        plate_image = cv2.resize(plate_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        # 1. Resize: Upscale to make characters larger/clearer (same rule as recognize_text_batch)
+        plate_image = scale_crop(plate_image, self.OCR_HEIGHT)
         
         # 2. Contrast: Maximize contrast (optional, but often helps)
         # plate_image = self.maximize_contrast(plate_image) 
@@ -87,12 +193,92 @@ class LicensePlateDetector:
         # plate_image_gray = cv2.cvtColor(plate_image, cv2.COLOR_BGR2GRAY) if len(plate_image.shape) == 3 else plate_image
         # _, plate_image = cv2.threshold(plate_image_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
 
-        result = self.reader.readtext(plate_image)
-        
-        text = ""
-        for (bbox, t, prob) in result:
-             # Basic filter for confidence (optional) or length
-             if prob > 0.2:
-                 text += t + " "
+        if reader is not None:
+            with STAGE_SECONDS.time(stage="ocr"):
+                result = reader.readtext(plate_image)
+        else:
+            # Timed inside the lock, so waiting for the shared reader doesn't count as OCR time
+            with self._reader_lock, STAGE_SECONDS.time(stage="ocr"):
+                result = self.reader.readtext(plate_image)
         
-        return text.strip().upper()
+        # Basic filter for confidence (optional) or length
+        text, confidence = parse_ocr_result(result)
+        if cache_key is not None:
+            self.ocr_cache.put(cache_key, (text, confidence))
+        return text
+
+    def recognize_text_batch(self, plate_images, reader=None, track_ids=None, height=None):
+        """
+        OCR for several plate crops in one EasyOCR call (e.g. every plate of an image or
+        of a batch request), instead of paying the recognizer overhead per crop.
+        Crops are scaled like recognize_text does (to `height`, OCR_HEIGHT by default).
+        readtext_batched needs equally sized images, so they are grouped by width
+        (BATCH_WIDTH_RATIO) and padded to the widest of their group with their median
+        color; repeating the edge would smear the plate frame into stripes read as I or 1.
+
+        Returns a (text, confidence) pair per crop, in order; confidence is the mean
+        probability of the kept text pieces. Cached crops skip the OCR.
+        """
+        height = height or self.OCR_HEIGHT
+        track_ids = track_ids or [None] * len(plate_images)
+        results = [("", 0.0)] * len(plate_images)
+
+        todo = [] # (index, cache key) of the crops that need a read
+        for idx, (plate_image, track_id) in enumerate(zip(plate_images, track_ids)):
+            if plate_image is None or plate_image.size == 0:
+                continue
+            OCR_CALLS_TOTAL.inc()
+            cache_key = None
+            if self.ocr_cache is not None:
+                cache_key = self.ocr_cache.make_key(plate_image, track_id)
+                cached = self.ocr_cache.get(cache_key)
+                if cached is not None:
+                    OCR_CACHE_HITS_TOTAL.inc()
+                    results[idx] = cached
+                    continue
+            todo.append((idx, cache_key))
+        if not todo:
+            return results
+
+        scaled = {}
+        for idx, _ in todo:
+            scaled[idx] = scale_crop(plate_images[idx], height)
+
+        groups = []
+        for entry in sorted(todo, key=lambda e: scaled[e[0]].shape[1]):
+            width = scaled[entry[0]].shape[1]
+            if groups and width <= groups[-1][0] * self.BATCH_WIDTH_RATIO:
+                groups[-1][1].append(entry)
+            else:
+                groups.append((width, [entry]))
+
+        for _, entries in groups:
+            max_width = max(scaled[idx].shape[1] for idx, _ in entries)
+            batch = []
+            for idx, _ in entries:
+                img = scaled[idx]
+                fill = np.median(img.reshape(-1, img.shape[2] if img.ndim == 3 else 1), axis=0)
+                batch.append(cv2.copyMakeBorder(img, 0, 0, 0, max_width - img.shape[1], cv2.BORDER_CONSTANT,
+                                                value=[float(v) for v in fill]))
+
+            if reader is not None:
+                started = time.perf_counter()
+                readings = reader.readtext_batched(batch)
+            else:
+                # Timed inside the lock, so waiting for the shared reader doesn't count as OCR time
+                with self._reader_lock:
+                    started = time.perf_counter()
+                    readings = self.reader.readtext_batched(batch)
+            # Per-crop share, so the histogram stays comparable with recognize_text
+            per_crop = (time.perf_counter() - started) / len(batch)
+            for _ in batch:
+                STAGE_SECONDS.observe(per_crop, stage="ocr")
+
+            for (idx, cache_key), result in zip(entries, readings):
+                results[idx] = parse_ocr_result(result)
+                if cache_key is not None:
+                    self.ocr_cache.put(cache_key, results[idx])
+        return results
+
+    def ocr_cache_stats(self):
+        return self.ocr_cache.stats() if self.ocr_cache is not None else None
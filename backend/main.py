@@ -1,172 +1,470 @@
 import cv2
 import numpy as np
 import os
-from ultralytics import YOLO
+import time
+from concurrent.futures import ThreadPoolExecutor
 from license_plate import LicensePlateDetector
-import PIL.Image
+from postprocess import DetectionPostProcessor
+from pipeline import FramePipeline
+from stream_broker import mjpeg_part
+from tracker import MultiObjectTracker, match_plates_to_riders
+from frame_scheduler import AdaptiveStride
+from motion_gate import build_gate
+from stats_hub import StatsHub, StreamStats
+from artifact_store import ArtifactStore
+from frame_encoder import JpegEncoder, OutputProfile, SharedFrame
+from startup import ComponentLoader
+from inference_engine import load_model
+from inference_pool import InferencePool
+from instrumentation import (STAGE_SECONDS, IMAGES_TOTAL, DETECTIONS_TOTAL, VIOLATIONS_TOTAL, FRAMES_SKIPPED_TOTAL,
+                             log_event)
 
-# Global dictionary to track live stats per video filename for SSE
-STREAM_STATS = {}
+# Live stats per video filename, pushed to SSE subscribers as deltas
+STATS_HUB = StatsHub()
+
+# Full resolution at OpenCV's default quality, i.e. what the streams sent before the output ladder
+DEFAULT_STREAM_PROFILE = OutputProfile("full", max_width=0, quality=95)
+
+def decode_image(source):
+    """
+    Returns a BGR image from a file path, encoded bytes (e.g. an upload read from the
+    request) or an already decoded ndarray. None if it can't be decoded.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # Decode straight from memory, no round trip through the disk
+        buffer = np.frombuffer(source, dtype=np.uint8)
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR) if buffer.size else None
+    return cv2.imread(source)
+
+# Tried in order: H.264 plays in browsers, mp4v can be written by every OpenCV build
+VIDEO_CODECS = ("avc1", "mp4v")
+
+def open_video_writer(path, fps, size):
+    for codec in VIDEO_CODECS:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+        if writer.isOpened():
+            return writer
+        writer.release()
+    raise RuntimeError(f"Could not open a video writer for {path}")
+
+def count_detections(dets, source):
+    IMAGES_TOTAL.inc(source=source)
+    DETECTIONS_TOTAL.inc(dets.safe_count, role="helmet")
+    DETECTIONS_TOTAL.inc(dets.unsafe_count, role="no_helmet")
+    DETECTIONS_TOTAL.inc(len(dets.plate_indices), role="plate")
 
 class YOLOv8System:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, ocr_workers=1, ocr_queue_size=32, ocr_cache_size=256, artifact_store=None,
+                 jpeg_turbo="auto", loader=None, warmup_runs=1, engine="pytorch", imgsz=640,
+                 calibration_dir=None, inference_workers=0, pool_options=None, motion_gate=None):
+        """
+        The model and the OCR reader are registered with `loader` (a ComponentLoader) and
+        loaded when the caller starts it, or lazily on first use. Without a loader they
+        are loaded in parallel before the constructor returns.
+        With `inference_workers` > 0 the model runs in that many worker processes (an
+        InferencePool, configured with `pool_options`) instead of in this process.
+        `motion_gate` (MotionGate options, None = off) skips inference on stream frames
+        where nothing moved.
+        """
         if model_path is None:
             model_path = os.path.join(os.path.dirname(__file__), 'best.pt')
+        self.model_path = model_path
+        # "pytorch", "onnx", "openvino" or an "-int8" variant; converted models are exported once and cached
+        self.engine = engine
+        # Only needed to build an INT8 model that isn't cached yet
+        self.calibration_dir = calibration_dir
+        self.imgsz = imgsz
+        self.warmup_runs = warmup_runs
+        self.inference_workers = inference_workers
+        self.pool_options = pool_options or {}
+        self.motion_gate = motion_gate
+        self.components = loader or ComponentLoader()
+        self.components.add("model", self._load_model)
+        # Stream plates are read by a background OCR pool so EasyOCR never stalls frame delivery
+        self.components.add("ocr", lambda: LicensePlateDetector(ocr_workers=ocr_workers, ocr_queue_size=ocr_queue_size,
+                                                                 cache_size=ocr_cache_size))
+        if warmup_runs > 0:
+            self.components.add("warmup", self._warm_up, requires=("model", "ocr"))
+
+        # Result images are encoded and written by background threads, off the inference path
+        self.artifacts = artifact_store or ArtifactStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'))
+        # Stream frames are resized/encoded per output profile, with libjpeg-turbo when available
+        self.frame_encoder = JpegEncoder(use_turbo=jpeg_turbo)
+
+        if loader is None:
+            self.components.load_all()
+
+    @property
+    def model(self):
+        """The YOLO model, or the InferencePool when inference runs in worker processes."""
+        return self.components.get("model")[0]
+
+    @property
+    def pool(self):
+        return self.model if self.inference_workers > 0 else None
+
+    @property
+    def postprocessor(self):
+        return self.components.get("model")[1]
+
+    @property
+    def class_names(self):
+        return self.model.names
+
+    @property
+    def plate_detector(self):
+        return self.components.get("ocr")
+
+    def _load_model(self):
         # Load YOLOv8 model
-        print(f"[INFO] Loading YOLOv8 Model from {model_path}...")
+        print(f"[INFO] Loading YOLOv8 Model from {self.model_path} ({self.engine} engine)...")
+        model_path = self.model_path
         if not os.path.exists(model_path):
             print(f"[WARNING] Model not found at {model_path}. Downloading standard yolov8n.pt for demo.")
-            self.model = YOLO('yolov8n.pt') 
+            model_path = 'yolov8n.pt'
+        if self.inference_workers > 0:
+            model = InferencePool(model_path, self.engine, self.imgsz, workers=self.inference_workers,
+                                  calibration_dir=self.calibration_dir, **self.pool_options).start()
+            self.engine = model.engine
         else:
-            self.model = YOLO(model_path)
-            
-        print("[INFO] Initializing License Plate Detector...")
-        self.plate_detector = LicensePlateDetector()
-        
-        # Load class names
-        self.class_names = self.model.names
+            model, self.engine = load_model(model_path, self.engine, self.imgsz, calibration_dir=self.calibration_dir)
+        # Resolve each class to plate / helmet / no-helmet / head once, instead of per box
+        return model, DetectionPostProcessor(model.names)
+
+    def detect(self, image, timeout=-1):
+        """
+        Runs the detector on one BGR image and returns its raw boxes for the post-processor.
+        With a worker pool, `timeout` is how long to wait for a free slot (see InferencePool.submit).
+        """
+        if self.inference_workers > 0:
+            # The worker times its own forward pass; waiting for a slot isn't inference time
+            return self.model.infer(image, timeout)
+        with STAGE_SECONDS.time(stage="inference"):
+            return self.model(image, conf=0.25, imgsz=self.imgsz, verbose=False)[0].boxes
 
-    def process_image(self, image_path, output_dir="results"):
-        img = cv2.imread(image_path)
+    def _warm_up(self):
+        """
+        Runs the model and the OCR reader on dummy input, so the framework's lazy setup
+        (predictor creation, layer fusing, CUDA/cuDNN init) isn't paid by the first request.
+        """
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(self.warmup_runs):
+            # With a pool this also checks the shared-memory round trip; the workers warmed up their models
+            self.detect(dummy)
+        self.plate_detector.recognize_text(np.zeros((32, 96, 3), dtype=np.uint8))
+
+    def process_image(self, image, output_dir="results", name=None):
+        """
+        `image` is a path, encoded image bytes or a BGR ndarray. `name` is the file name the
+        outputs are derived from; it defaults to the path's base name. An ndarray is drawn on in place.
+        """
+        name = name or (os.path.basename(image) if isinstance(image, str) else "image.jpg")
+        with STAGE_SECONDS.time(stage="decode"):
+            img = decode_image(image)
         if img is None:
-            print(f"[ERROR] Could not read image: {image_path}")
+            log_event("ERROR", "image_unreadable", name=name, interval_s=None)
             return None, None, None
 
         # Run Inference
         # conf=0.25 is a good default
-        results = self.model(img, conf=0.25)[0]
+        boxes = self.detect(img)
 
-        detected_texts = []
-        final_plate_path = None
-        
-        # We need to map class IDs to names
-        # Standard YOLOv8 training usually assigns indices automatically.
-        # We should check class names.
-        # Track overall status
-        violation_detected = False
-        helmet_detected = False
-        
-        for box in results.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            cls_id = int(box.cls[0])
-            label = self.class_names[cls_id]
-            
-            # Draw bounding box logic
-            color = (0, 255, 0) # Green default
-            
-            # Check for specific classes. 
-            # Note: Checking strings is safer than IDs since user datasets vary.
-            lbl_lower = label.lower()
-            
-            # Check for specific classes. 
-            # Note: Checking strings is safer than IDs since user datasets vary.
-            lbl_lower = label.lower()
-            
-            is_violation = False
-            
-            if "plate" in lbl_lower or "license" in lbl_lower:
-                # License Plate Logic
-                if conf > 0.2: 
-                    color = (255, 0, 0) # Blue for plate
-                    
-                    # Crop plate
-                    plate_crop = img[y1:y2, x1:x2]
-                    
-                    if plate_crop.size > 0:
-                        # OCR
-                        text = self.plate_detector.recognize_text(plate_crop)
-                        if text and len(text) > 3:
-                            detected_texts.append(text)
-                            print(f"[PLATE] Recognized: {text}")
-                        
-                        # Save crop (overwrite last one for display)
-                        os.makedirs(output_dir, exist_ok=True)
-                        plate_filename = f"plate_{os.path.basename(image_path)}"
-                        final_plate_path = os.path.join(output_dir, plate_filename)
-                        cv2.imwrite(final_plate_path, plate_crop)
-
-            elif "helmet" in lbl_lower:
-                # Check for negative prefixes
-                if "no" in lbl_lower or "without" in lbl_lower or "missing" in lbl_lower or "not" in lbl_lower:
-                     # "No Helmet" is a specific class, usually reliable
-                     is_violation = True
-                     violation_detected = True
-                     print(f"[VIOLATION] No Helmet detected! ({conf:.2f})")
-                     # STRICT FILTER: Only accept if confidence is HIGH (>0.7), and bounding box represents a head size
-                     h, w_img = img.shape[:2]
-                     box_w = x2 - x1
-                     box_h = y2 - y1
-                     aspect_ratio = box_w / box_h if box_h > 0 else 0
-                     h_ratio = box_h / h if h > 0 else 0
-
-                     if conf > 0.65 and 0.5 < aspect_ratio < 2.0 and h_ratio < 0.6:
-                         helmet_detected = True
-                     else:
-                         print(f"[IGNORED] Weak/False Helmet detection ({conf:.2f}, ar={aspect_ratio:.2f}, h={h_ratio:.2f})")
-                         continue # skip drawing this false positive bounding box
-
-            elif "head" in lbl_lower:
-                # If the class is "Head", it usually means NO helmet
-                if "helmet" not in lbl_lower:
-                    is_violation = True
-                    violation_detected = True
-                    print(f"[VIOLATION] Head detected (likely no helmet)! ({conf:.2f})")
-
-            # Apply violation color
-            if is_violation:
-                color = (0, 0, 255) # Red
-                label = "NO HELMET" # Force label update for clarity
-
-            # Draw Box & Label
-            cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(img, f"{label} {conf:.2f}", (x1, y1 - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-        # Save Result Image
-        os.makedirs(output_dir, exist_ok=True)
-        filename = os.path.basename(image_path)
-        output_path = os.path.join(output_dir, "processed_" + filename)
-        cv2.imwrite(output_path, img)
+        return self._annotate_image(img, boxes, name, output_dir)
 
-        full_text = " | ".join(detected_texts) if detected_texts else "No Text Detected"
-        
-        # Determine final status string
-        if violation_detected:
-            status_text = "NO HELMET (Violation)"
-        elif helmet_detected:
-            status_text = "With Helmet (Safe)"
-        else:
-            status_text = "No Rider/Helmet Detected"
+    def process_images(self, images, output_dir="results", batch_size=8, num_workers=4, names=None):
+        """
+        Batched version of process_image for many images at once (paths, bytes or arrays).
+        Images are decoded in parallel and fed to the model in mini-batches of
+        `batch_size`. Returns one process_image-style tuple per input, in order.
+        """
+        outputs = [(None, None, None, None)] * len(images)
+        if not images:
+            return outputs
+        if names is None:
+            names = [os.path.basename(src) if isinstance(src, str) else f"image_{i}.jpg" for i, src in enumerate(images)]
+
+        def timed_decode(source):
+            with STAGE_SECONDS.time(stage="decode"):
+                return decode_image(source)
+
+        # imread/imdecode release the GIL, so a thread pool decodes images concurrently
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as pool:
+            images = list(pool.map(timed_decode, images))
+
+        valid = []
+        for idx, img in enumerate(images):
+            if img is None:
+                log_event("ERROR", "image_unreadable", name=names[idx], interval_s=None)
+            else:
+                valid.append(idx)
+
+        batch_size = max(1, batch_size)
+        chunks = [valid[start:start + batch_size] for start in range(0, len(valid), batch_size)]
+        if self.inference_workers > 0:
+            # Every image goes to whichever worker is free; the mini-batches only group the annotation
+            pending = [[self.model.submit(images[i]) for i in chunk] for chunk in chunks]
+
+        for n, chunk in enumerate(chunks):
+            if self.inference_workers > 0:
+                boxes = [future.result() for future in pending[n]]
+            else:
+                started = time.perf_counter()
+                batch_results = self.model([images[i] for i in chunk], conf=0.25, imgsz=self.imgsz, verbose=False)
+                # Per-image share of the batch, so the histogram stays comparable with process_image
+                per_image = (time.perf_counter() - started) / len(chunk)
+                for _ in chunk:
+                    STAGE_SECONDS.observe(per_image, stage="inference")
+                boxes = [results.boxes for results in batch_results]
 
-        return output_path, full_text, final_plate_path, status_text
+            # The plates of the whole mini-batch are read in one OCR call
+            annotated = self._annotate_images([(images[i], b, names[i]) for i, b in zip(chunk, boxes)], output_dir)
+            for idx, output in zip(chunk, annotated):
+                outputs[idx] = output
+                images[idx] = None # release the decoded frame as soon as it's written
 
-    def generate_video_stream(self, video_path, loop=True):
+        return outputs
+
+    def _annotate_image(self, img, boxes, name, output_dir):
+        """Draws detections on `img`, saves the outputs and builds the status tuple."""
+        return self._annotate_images([(img, boxes, name)], output_dir)[0]
+
+    def _annotate_images(self, items, output_dir):
+        """
+        _annotate_image for several (img, boxes, name) items, with the plate crops of all
+        of them read by a single recognize_text_batch call.
+        """
+        # Classify and filter every box in one pass over the raw results array
+        all_dets = []
+        crops = []
+        for img, boxes, name in items:
+            with STAGE_SECONDS.time(stage="postprocess"):
+                dets = self.postprocessor.process(boxes, img.shape)
+            count_detections(dets, "image")
+            all_dets.append(dets)
+
+            # Crops are taken before drawing so the boxes don't bleed into them (copied for the async save)
+            image_crops = []
+            for i in dets.plate_indices:
+                x1, y1, x2, y2 = dets.xyxy[i].tolist()
+                plate_crop = img[max(0, y1):y2, max(0, x1):x2]
+                if plate_crop.size > 0:
+                    image_crops.append(plate_crop.copy())
+            crops.append(image_crops)
+
+        # OCR
+        readings = iter(self.plate_detector.recognize_text_batch([c for image_crops in crops for c in image_crops]))
+
+        outputs = []
+        for (img, _, name), dets, image_crops in zip(items, all_dets, crops):
+            detected_texts = []
+            final_plate_path = None
+            for plate_crop in image_crops:
+                text, _ = next(readings)
+                if text and len(text) > 3:
+                    detected_texts.append(text)
+                    log_event("PLATE", "plate_recognized", text=text, image=name, interval_s=None)
+
+                # Save crop (overwrite last one for display)
+                plate_filename = f"plate_{name}"
+                final_plate_path = self._save_result(output_dir, plate_filename, plate_crop)
+
+            violation_detected = dets.unsafe_count > 0
+            helmet_detected = dets.safe_count > 0
+            if violation_detected:
+                VIOLATIONS_TOTAL.inc(source="image")
+                log_event("VIOLATION", "no_helmet", riders=dets.unsafe_count, image=name, interval_s=None)
+
+            with STAGE_SECONDS.time(stage="draw"):
+                self.postprocessor.draw(img, dets)
+
+            # Save Result Image
+            output_path = self._save_result(output_dir, "processed_" + name, img)
+
+            full_text = " | ".join(detected_texts) if detected_texts else "No Text Detected"
+
+            # Determine final status string
+            if violation_detected:
+                status_text = "NO HELMET (Violation)"
+            elif helmet_detected:
+                status_text = "With Helmet (Safe)"
+            else:
+                status_text = "No Rider/Helmet Detected"
+
+            outputs.append((output_path, full_text, final_plate_path, status_text))
+        return outputs
+
+    def _save_result(self, output_dir, filename, image):
+        """Saves through the artifact store when `output_dir` is its root, else writes synchronously."""
+        if os.path.abspath(output_dir) == self.artifacts.root:
+            return self.artifacts.save_image(filename, image)
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, filename)
+        cv2.imwrite(path, image)
+        return path
+
+    def generate_video_stream(self, video_path, loop=True, pipelined=False, queue_depth=2, target_rtf=1.0, max_stride=8,
+                              profile=None):
         """Generator function to yield annotated frames from a video stream for MJPEG."""
+        for frame_bytes in self.iter_stream_frames(video_path, loop=loop, pipelined=pipelined, queue_depth=queue_depth,
+                                                   target_rtf=target_rtf, max_stride=max_stride, profile=profile):
+            # Yield frame in multipart format
+            yield mjpeg_part(frame_bytes)
+
+    def iter_stream_frames(self, video_path, loop=True, pipelined=False, queue_depth=2, target_rtf=1.0, max_stride=8,
+                           profile=None, shared=False, realtime=True):
+        """
+        Yields the annotated frames of a video as JPEG bytes encoded for `profile`.
+        With `shared=True` it yields SharedFrames instead, which viewers encode lazily for
+        their own profile (`profile` is then pre-encoded, as the most common one).
+        With `pipelined=True`, capture, inference and JPEG encode run on separate threads
+        joined by bounded latest-frame-wins queues, so decode and encode overlap the
+        forward pass and a slow model lowers the output FPS instead of adding latency.
+        The inference stride adapts to the measured frame time to hold `target_rtf`.
+        `realtime=False` stops pacing file sources, e.g. to measure raw throughput.
+        """
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
-            print(f"[ERROR] Could not open video: {video_path}")
+            log_event("ERROR", "video_unreadable", path=video_path)
             return
 
-        frame_count = 0
         filename = os.path.basename(video_path)
-        
-        # Initialize the global tracking structure for this video
-        STREAM_STATS[filename] = {
-            "safe": 0,
-            "unsafe": 0,
-            "plates": [],
-            "violators": []
+        # (Re)start the live stats for this video; SSE clients already waiting stay attached
+        session = StreamSession(filename, STATS_HUB.open(filename))
+        epoch = session.stats.epoch
+        session.scheduler = AdaptiveStride(cap.get(cv2.CAP_PROP_FPS), target_rtf=target_rtf, max_stride=max_stride)
+        session.gate = build_gate(self.motion_gate, filename)
+        frames = self._read_stream_frames(cap, loop, session.scheduler)
+        profile = profile or DEFAULT_STREAM_PROFILE
+        encode = lambda frame: self._encode_stream_frame(frame, profile, shared)
+
+        if not pipelined:
+            try:
+                for frame_count, frame in frames:
+                    started = time.perf_counter()
+                    frame_bytes = encode(self._analyze_stream_frame(session, frame_count, frame))
+                    session.scheduler.record(time.perf_counter() - started)
+                    session.stats.set_telemetry(scheduler=session.scheduler.stats())
+                    if frame_bytes is not None:
+                        yield frame_bytes
+            finally:
+                cap.release()
+                STATS_HUB.close(filename, epoch)
+            return
+
+        def timed_analyze(item):
+            # Inference is the slowest stage, so its time drives the stride
+            started = time.perf_counter()
+            frame = self._analyze_stream_frame(session, *item)
+            session.scheduler.record(time.perf_counter() - started)
+            session.stats.set_telemetry(scheduler=session.scheduler.stats())
+            return frame
+
+        pipeline = FramePipeline(
+            read_fn=lambda: next(frames, None),
+            infer_fn=timed_analyze,
+            encode_fn=encode,
+            queue_depth=queue_depth,
+            # Read only as fast as the current stride needs to keep a file source real-time
+            pace_fps=(lambda: session.scheduler.pace_fps) if realtime else None,
+            name=session.filename,
+        ).start()
+        def release():
+            cap.release()
+            STATS_HUB.close(filename, epoch)
+
+        try:
+            for frame_bytes in pipeline:
+                session.stats.set_telemetry(pipeline=pipeline.stats())
+                yield frame_bytes
+        finally:
+            # The capture and stats are released only once no stage can still be using them
+            pipeline.stop(cleanup=release)
+
+    def process_video(self, video_path, output_name, name=None, on_progress=None, progress_every=25,
+                      frame_range=None, lead_in=0):
+        """
+        Runs every frame of a video through detection and tracking as fast as possible
+        (no real-time pacing, no frame skipping) and writes the annotated frames to
+        `output_name`, an MP4 in the artifact store. Violator plates are read right away
+        instead of through the OCR queue, so none are skipped. `on_progress(frames_done,
+        frames_total)` is called every `progress_every` frames.
+        With `frame_range=(start, end)` only frames start..end-1 (0-based) are processed
+        and written. The `lead_in` frames before `start` are analyzed but not written, so
+        riders crossing into the range are already tracked; violators recorded during the
+        lead-in are left out (see video_chunks.py).
+        Returns a summary with the output URL and the violator records.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video {os.path.basename(video_path)}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 25.0
+        frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+
+        start, end = frame_range or (0, None)
+        first = max(0, start - lead_in)
+        if first:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+        if end is not None:
+            frames_total = end - start
+
+        name = name or os.path.basename(video_path)
+        # Not registered with STATS_HUB: nobody watches a job live, and the ledger must keep every violator
+        session = StreamSession(name, StreamStats(name, max_violators=None), sync_ocr=True)
+        # frame_count is 1-based, like on streams
+        session.record_from = start + 1
+        output_path = self.artifacts.path_for(output_name)
+        writer = None
+        frame_count = first
+        written = 0
+        started = time.perf_counter()
+        try:
+            while end is None or frame_count < end:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                if writer is None:
+                    writer = open_video_writer(output_path, fps, (frame.shape[1], frame.shape[0]))
+                frame = self._analyze_stream_frame(session, frame_count, frame)
+                if frame_count <= start:
+                    continue
+                writer.write(frame)
+                written += 1
+                if on_progress is not None and written % progress_every == 0:
+                    on_progress(written, frames_total)
+
+            # Riders still in view at the end get their best crop too
+            for track in session.tracker.flush():
+                self._finalize_violator(track)
+        finally:
+            cap.release()
+            if writer is not None:
+                writer.release()
+        if writer is None:
+            raise ValueError(f"No frames could be read from {os.path.basename(video_path)}")
+        if on_progress is not None:
+            on_progress(written, written)
+
+        violators = []
+        for record in session.stats.violators:
+            violators.append(dict(record, frame=record["timestamp"], video_time_s=round(record["timestamp"] / fps, 2)))
+        return {
+            "output_url": self.artifacts.add_file(output_name),
+            "frames": written,
+            "fps": fps,
+            "elapsed_s": time.perf_counter() - started,
+            "violators": violators,
         }
-        
-        # Keep track of locally generated crops to avoid duplicates
-        tracked_violators = 0
-        
-        # Debounce tracking map: { "violator_idx": {"x": int, "y": int, "last_seen_frame": int} }
-        active_trackers = []
-        TRACKING_THRESHOLD_PX = 100 # How far a box can move and still be considered the "same person"
-        DEBOUNCE_FRAMES = 60 # wait this many frames before capturing the "same" violator area again
 
+    def _read_stream_frames(self, cap, loop, scheduler):
+        """
+        Yields (frame_count, frame) for every frame the stream should analyze.
+        Frames between analyzed ones are advanced with cap.grab(), which skips the decode.
+        """
+        frame_count = 0
         while True:
             ret, frame = cap.read()
             if not ret:
@@ -179,160 +477,187 @@ class YOLOv8System:
                     break
                 
             frame_count += 1
-            # Skip frames to simulate real-time processing speed if needed, or process every frame
-            # Process every 2nd frame for better performance on CPU
-            if frame_count % 2 != 0:
-                continue
-
-            # Run Inference on the frame
-            results = self.model(frame, conf=0.25, verbose=False)[0]
-
-            safe_count = 0
-            unsafe_count = 0
-            plates = []
-            
-            # Temporary storage to pair up a violator and a plate in the exact same frame
-            current_frame_violator_crop = None
-            current_frame_plate_crop = None
-            current_frame_plate_text = "No Plate Detected"
-
-            for box in results.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = float(box.conf[0])
-                cls_id = int(box.cls[0])
-                label = self.class_names[cls_id]
-                
-                color = (0, 255, 0) # Green default
-                lbl_lower = label.lower()
-                is_violation = False
-                
-                if "plate" in lbl_lower or "license" in lbl_lower:
-                    if conf > 0.2: color = (255, 0, 0)
-                elif "helmet" in lbl_lower:
-                    if "no" in lbl_lower or "without" in lbl_lower or "missing" in lbl_lower or "not" in lbl_lower:
-                         is_violation = True
-                    else:
-                         h_img = frame.shape[0]
-                         box_w = x2 - x1
-                         box_h = y2 - y1
-                         aspect_ratio = box_w / box_h if box_h > 0 else 0
-                         h_ratio = box_h / h_img if h_img > 0 else 0
-                         
-                         if conf > 0.65 and 0.5 < aspect_ratio < 2.0 and h_ratio < 0.6:
-                             safe_count += 1
-                         else:
-                             continue # Skip False Positive logic
-                elif "head" in lbl_lower:
-                    if "helmet" not in lbl_lower:
-                        is_violation = True
-
-                if is_violation:
-                    color = (0, 0, 255) # Red
-                    label = "NO HELMET"
-                    unsafe_count += 1
-                    # Extract the violator crop
-                    try:
-                        current_frame_violator_crop = frame[max(0, y1-20):y2+20, max(0, x1-20):x2+20].copy()
-                    except:
-                        pass
-                        
-                elif "helmet" in lbl_lower:
-                    safe_count += 1
-                elif "plate" in lbl_lower or "license" in lbl_lower:
-                    # Attempt quick OCR for the specific frame or just track detection
-                    try:
-                        plate_crop = frame[max(0, y1):y2, max(0, x1):x2] # Removed .copy() reference bug 
-                        if plate_crop.size != 0:
-                            current_frame_plate_crop = plate_crop.copy()
-                            pil_img = PIL.Image.fromarray(cv2.cvtColor(plate_crop, cv2.COLOR_BGR2RGB))
-                            text = self.plate_detector.extract_text(pil_img)
-                            if text: 
-                                plates.append(text)
-                                current_frame_plate_text = text
-                    except:
-                        pass # Ignore individual frame OCR failures for speed
-
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(frame, f"{label} {conf:.2f}", (x1, y1 - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                            
-            # Check Debounce & Tracking to see if this is a NEW violator or an existing one
-            is_new_violator = False
-            if current_frame_violator_crop is not None:
-                # Find center of this box
-                center_x = x1 + (x2 - x1) // 2
-                center_y = y1 + (y2 - y1) // 2
-                
-                matched = False
-                for t in active_trackers:
-                    # If the center is within 100px of an existing tracked violator
-                    if abs(t["x"] - center_x) < TRACKING_THRESHOLD_PX and abs(t["y"] - center_y) < TRACKING_THRESHOLD_PX:
-                        matched = True
-                        t["x"] = center_x
-                        t["y"] = center_y
-                        
-                        # Only re-capture if it's been a long time (e.g. they left and another came to the exact same spot)
-                        if (frame_count - t["last_seen_frame"]) > DEBOUNCE_FRAMES:
-                            is_new_violator = True
-                            t["last_seen_frame"] = frame_count
-                        else:
-                            # Just update the timer so they stay "active" while in frame
-                            t["last_seen_frame"] = frame_count
-                        break
-                        
-                if not matched:
-                    # Brand new person
-                    is_new_violator = True
-                    active_trackers.append({
-                        "x": center_x,
-                        "y": center_y,
-                        "last_seen_frame": frame_count
-                    })
-
-            # If we caught a NEW violator in this frame, save the crops and update the ledger
-            if is_new_violator:
-                results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
-                os.makedirs(results_dir, exist_ok=True)
-                
-                violator_fname = f"v_{filename}_f{frame_count}_{tracked_violators}.jpg"
-                violator_path = os.path.join(results_dir, violator_fname)
-                cv2.imwrite(violator_path, current_frame_violator_crop)
-                
-                plate_url = None
-                if current_frame_plate_crop is not None:
-                    plate_fname = f"p_{filename}_f{frame_count}_{tracked_violators}.jpg"
-                    plate_path = os.path.join(results_dir, plate_fname)
-                    cv2.imwrite(plate_path, current_frame_plate_crop)
-                    plate_url = f"/results/{plate_fname}"
-                
-                # Append to SSE structure
-                STREAM_STATS[filename]["violators"].append({
-                    "timestamp": frame_count,
-                    "violator_image_url": f"/results/{violator_fname}",
-                    "plate_image_url": plate_url,
-                    "plate_text": current_frame_plate_text,
-                    "status_text": "NO HELMET"
-                })
-                tracked_violators += 1
-                            
-            # Clean up old trackers that left the frame long ago
-            active_trackers = [t for t in active_trackers if (frame_count - t["last_seen_frame"]) < DEBOUNCE_FRAMES]
-                            
-            # Update global stats for SSE
-            STREAM_STATS[filename]["safe"] = safe_count
-            STREAM_STATS[filename]["unsafe"] = unsafe_count
-            if plates:
-                 STREAM_STATS[filename]["plates"] = plates
-
-            # Encode frame to JPEG
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if not ret:
-                continue
-                
-            frame_bytes = buffer.tobytes()
-            # Yield frame in multipart format
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            yield frame_count, frame
+
+            # Skip ahead by the scheduler's current stride without decoding
+            for _ in range(scheduler.stride - 1):
+                if not cap.grab():
+                    break # end of file is handled by the next read
+                frame_count += 1
+                scheduler.grabbed += 1
+                FRAMES_SKIPPED_TOTAL.inc()
+
+    def _analyze_stream_frame(self, session, frame_count, frame):
+        """Runs inference, tracking and drawing for one stream frame. Returns the annotated frame."""
+        gate = session.gate
+        if gate is not None and not gate.check(frame) and session.last_dets is not None:
+            # Nothing moved since the last analyzed frame: show its boxes again and skip the model
+            with STAGE_SECONDS.time(stage="draw"):
+                self.postprocessor.draw(frame, session.last_dets)
+            session.stats.set_telemetry(motion_gate=gate.stats())
+            return frame
+
+        started = time.perf_counter()
+        # Run Inference on the frame; streams wait for a worker slot, the adaptive stride absorbs the delay
+        boxes = self.detect(frame, timeout=None)
+
+        # Classify, filter and count every box of the frame at once
+        with STAGE_SECONDS.time(stage="postprocess"):
+            dets = self.postprocessor.process(boxes, frame.shape)
+        count_detections(dets, "stream")
+        if gate is not None:
+            gate.record_inference(time.perf_counter() - started)
+            session.last_dets = dets
+            session.stats.set_telemetry(motion_gate=gate.stats())
+
+        # Every violator gets a stable track id, so simultaneous riders stay separate
+        violation_indices = dets.violation_indices
+        violator_boxes = dets.xyxy[violation_indices]
+        with STAGE_SECONDS.time(stage="tracking"):
+            track_ids = session.tracker.update(violator_boxes, frame_count)
+        plate_indices = dets.plate_indices
+        plate_for_violator = match_plates_to_riders(violator_boxes, dets.xyxy[plate_indices])
+
+        # Crops are taken before drawing so the boxes don't bleed into them
+        for k, det_idx in enumerate(violation_indices):
+            track = session.tracker.get(track_ids[k])
+            x1, y1, x2, y2 = dets.xyxy[det_idx].tolist()
+            score = float(max(0, x2 - x1) * max(0, y2 - y1) * dets.conf[det_idx])
+            if score > track.best_score:
+                track.offer_crop(frame[max(0, y1-20):y2+20, max(0, x1-20):x2+20].copy(), score)
+
+            new_plate = False
+            if plate_for_violator[k] >= 0:
+                px1, py1, px2, py2 = dets.xyxy[plate_indices[plate_for_violator[k]]].tolist()
+                plate_crop = frame[max(0, py1):py2, max(0, px1):px2]
+                # Keep the largest view of the plate; each improvement earns another OCR vote
+                if plate_crop.size != 0 and (track.plate_crop is None or plate_crop.size > track.plate_crop.size):
+                    track.plate_crop = plate_crop.copy()
+                    new_plate = True
+
+            if "record" not in track.data:
+                if track.best_crop is not None:
+                    self._record_violator(session, track, frame_count)
+            elif new_plate and track.data["record"] is not None:
+                self._attach_violator_plate(session, track, frame_count)
+
+        # Tracks that left the frame long ago: keep the best view we got of them
+        for track in session.tracker.pop_expired():
+            self._finalize_violator(track)
+
+        with STAGE_SECONDS.time(stage="draw"):
+            self.postprocessor.draw(frame, dets)
+
+        # Update global stats for SSE (subscribers are only woken when the counts change)
+        session.stats.update(safe=dets.safe_count, unsafe=dets.unsafe_count)
+        session.stats.set_telemetry(tracks=len(session.tracker),
+                                    ocr_pending=self.plate_detector.ocr_queue_depth(),
+                                    ocr_cache=self.plate_detector.ocr_cache_stats())
+
+        return frame
+
+    def _record_violator(self, session, track, frame_count):
+        """Saves the crops of a newly tracked violator and adds it to the SSE ledger."""
+        if frame_count < session.record_from:
+            # Seen during a video chunk's lead-in: the previous chunk owns this rider
+            track.data["record"] = None
+            return
+        violator_fname = f"v_{session.filename}_t{track.id}_f{frame_count}.jpg"
+        self.artifacts.save_image(violator_fname, track.best_crop)
+        
+        # Append to SSE structure
+        record = {
+            "timestamp": frame_count,
+            "track_id": track.id,
+            "violator_image_url": self.artifacts.url_for(violator_fname),
+            "plate_image_url": None,
+            "plate_text": "No Plate Detected",
+            "status_text": "NO HELMET"
+        }
+        track.data["record"] = record
+        track.data["violator_fname"] = violator_fname
+        track.data["recorded_score"] = track.best_score
+        track.data["ocr_attempts"] = 0
+        session.stats.add_violator(record)
+        session.tracked_violators += 1
+        VIOLATIONS_TOTAL.inc(source="stream")
+
+        if track.plate_crop is not None:
+            self._attach_violator_plate(session, track, frame_count)
+
+    def _attach_violator_plate(self, session, track, frame_count):
+        """Saves the track's current plate crop and queues it for a (voting) OCR read."""
+        if track.data["ocr_attempts"] >= StreamSession.MAX_OCR_ATTEMPTS:
+            return
+        track.data["ocr_attempts"] += 1
+        record = track.data["record"]
+
+        plate_fname = f"p_{session.filename}_t{track.id}.jpg"
+        self.artifacts.save_image(plate_fname, track.plate_crop)
+        session.stats.update_violator(record, plate_image_url=f"{self.artifacts.url_for(plate_fname)}?v={frame_count}")
+
+        if session.sync_ocr:
+            # Offline jobs have no frame deadline, so the plate is read now rather than risking a drop
+            text = self.plate_detector.recognize_text(track.plate_crop, track_id=f"{session.filename}:{track.id}")
+            self._on_plate_read(session, track, text)
+            return
+
+        # The OCR pool fills in plate_text later, off the video hot path
+        queued = self.plate_detector.submit_ocr(track.plate_crop,
+                                                lambda text: self._on_plate_read(session, track, text),
+                                                track_id=f"{session.filename}:{track.id}")
+        if track.plate_text is None:
+            session.stats.update_violator(record, plate_text="Reading Plate..." if queued else "OCR Skipped (busy)")
+
+    def _finalize_violator(self, track):
+        """Replaces the saved violator crop if a better view came along after it was recorded."""
+        if track.data.get("record") is None or track.best_score <= track.data["recorded_score"]:
+            return
+        self.artifacts.save_image(track.data["violator_fname"], track.best_crop)
+
+    def _on_plate_read(self, session, track, text):
+        """Runs on an OCR worker thread when a violator's plate crop has been read."""
+        track.vote_plate(text)
+        session.stats.update_violator(track.data["record"], plate_text=track.plate_text or "No Plate Detected")
+        if text:
+            # Most recent plates, newest last, for the stats panel
+            plates = session.stats.counters["plates"]
+            session.stats.update(plates=(plates + [text])[-StreamSession.MAX_RECENT_PLATES:])
+
+    def _encode_stream_frame(self, frame, profile, shared=False):
+        if not shared:
+            return self.frame_encoder.encode(frame, profile)
+        shared_frame = SharedFrame(frame, self.frame_encoder)
+        shared_frame.encode(profile)
+        return shared_frame
+
+
+class StreamSession:
+    """Per-stream state shared by the frames of one generate_video_stream call."""
+
+    TRACKING_THRESHOLD_PX = 100 # How far a box can move and still be considered the "same person"
+    DEBOUNCE_FRAMES = 60 # frames a track survives unseen before a rider in the same spot counts as new
+    MAX_RECENT_PLATES = 10
+    MAX_OCR_ATTEMPTS = 3 # OCR votes collected per tracked violator
+
+    def __init__(self, filename, stats, sync_ocr=False):
+        self.filename = filename
+        # StreamStats from STATS_HUB: counters, telemetry and the violator ring buffer
+        self.stats = stats
+        # Read violator plates inline instead of through the OCR worker queue
+        self.sync_ocr = sync_ocr
+        # Violators first seen before this frame aren't recorded (a video chunk's lead-in)
+        self.record_from = 0
+        # MotionGate of the stream (None = every frame is analyzed) and the detections it reuses
+        self.gate = None
+        self.last_dets = None
+        # Adaptive inference stride, set up once the source FPS is known
+        self.scheduler = None
+        # Number of distinct violators recorded so far
+        self.tracked_violators = 0
+        # Violators are debounced by track: one ledger entry per track id
+        self.tracker = MultiObjectTracker(max_center_distance=self.TRACKING_THRESHOLD_PX,
+                                          max_age=self.DEBOUNCE_FRAMES)
 
 def check_lfs_files():
     # Placeholder for compatibility if app.py calls it
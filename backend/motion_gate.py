@@ -0,0 +1,130 @@
+import json
+import time
+
+import cv2
+import numpy as np
+
+from instrumentation import STAGE_SECONDS, FRAMES_GATED_TOTAL
+
+
+def parse_roi(spec):
+    """
+    Parses ROI polygons written as "x,y x,y x,y; x,y x,y x,y" in coordinates relative to
+    the frame (0..1), e.g. "0,0.4 1,0.4 1,1 0,1" for the lower 60%. Returns a list of
+    (N, 2) float32 arrays, or None for an empty spec.
+    """
+    polygons = []
+    for part in (spec or "").split(";"):
+        points = [tuple(float(v) for v in p.split(",")) for p in part.split()]
+        if not points:
+            continue
+        if len(points) < 3 or any(len(p) != 2 for p in points):
+            raise ValueError(f"ROI polygon needs at least 3 x,y points: {part.strip()!r}")
+        polygons.append(np.array(points, dtype=np.float32))
+    return polygons or None
+
+
+def load_rois(path):
+    """Reads a JSON file of {"<video file name>": "<roi spec>", "*": "<default>"} into parsed polygons."""
+    with open(path) as f:
+        return {name: parse_roi(spec) for name, spec in json.load(f).items()}
+
+
+class MotionGate:
+    """
+    Decides whether a stream frame needs a forward pass at all.
+
+    Frames are shrunk to `width` pixels, grayscaled and blurred, then compared with the
+    last frame that did go through the model (not the previous frame, so slow changes
+    still add up). When less than `min_changed` of the ROI's pixels moved by more than
+    `pixel_threshold` gray levels, the frame is skipped and the last detections are
+    reused. A forward pass is forced after `max_skip` skipped frames, so a stopped rider
+    or a lighting drift never leaves stale boxes up for long. Keep `max_skip` below the
+    tracker's debounce window, or tracks expire while the gate is closed.
+    """
+
+    def __init__(self, width=160, pixel_threshold=25, min_changed=0.002, max_skip=30, roi=None):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.max_skip = max_skip
+        # Relative polygons; rasterized once the downscaled frame size is known
+        self.roi = roi
+        self._mask = None
+        self._reference = None
+        self._since_inference = 0
+
+        self.inferred = 0
+        self.skipped = 0
+        self.last_score = None
+        self._gate_s = 0.0
+        self._inference_s = 0.0
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        small_h = max(1, round(height * self.width / width))
+        small = cv2.resize(frame, (self.width, small_h), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self.roi is not None and (self._mask is None or self._mask.shape != small.shape):
+            self._mask = np.zeros(small.shape, dtype=np.uint8)
+            scale = np.array([self.width, small_h], dtype=np.float32)
+            cv2.fillPoly(self._mask, [np.round(p * scale).astype(np.int32) for p in self.roi], 1)
+            self._mask = self._mask.astype(bool)
+        return small
+
+    def check(self, frame):
+        """True if `frame` should be run through the model. Updates the reference frame when it is."""
+        started = time.perf_counter()
+        small = self._prepare(frame)
+        if self._reference is None or self._reference.shape != small.shape or self._since_inference >= self.max_skip:
+            run = True
+        else:
+            moved = cv2.absdiff(small, self._reference) > self.pixel_threshold
+            if self._mask is not None:
+                roi_pixels = np.count_nonzero(self._mask)
+                self.last_score = np.count_nonzero(moved & self._mask) / roi_pixels if roi_pixels else 0.0
+            else:
+                self.last_score = np.count_nonzero(moved) / moved.size
+            run = self.last_score >= self.min_changed
+
+        if run:
+            self._reference = small
+            self._since_inference = 0
+            self.inferred += 1
+        else:
+            self._since_inference += 1
+            self.skipped += 1
+            FRAMES_GATED_TOTAL.inc()
+        elapsed = time.perf_counter() - started
+        self._gate_s += elapsed
+        STAGE_SECONDS.observe(elapsed, stage="motion_gate")
+        return run
+
+    def record_inference(self, seconds):
+        """Time the model (and post-processing) took on an inferred frame, to estimate what skipping saved."""
+        self._inference_s += seconds
+
+    def stats(self):
+        checked = self.inferred + self.skipped
+        avg_inference_s = self._inference_s / self.inferred if self.inferred else 0.0
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / checked, 3) if checked else 0.0,
+            "last_score": round(float(self.last_score), 4) if self.last_score is not None else None,
+            "avg_gate_ms": round(self._gate_s / checked * 1000, 3) if checked else 0.0,
+            # Skipped forward passes at the average measured cost, minus what the gate itself cost
+            "est_saved_s": round(self.skipped * avg_inference_s - self._gate_s, 2),
+        }
+
+
+def build_gate(options, source_name):
+    """
+    A MotionGate for one stream, or None when gating is off (`options` is None).
+    `options` are MotionGate keyword arguments plus "rois": {file name or "*": polygons}.
+    """
+    if options is None:
+        return None
+    options = dict(options)
+    rois = options.pop("rois", None) or {}
+    return MotionGate(roi=rois.get(source_name, rois.get("*")), **options)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def plate_hash(plate_image, hash_width=16, hash_height=8):
+    """
+    Difference hash (dHash) of a plate crop as a hex string.
+    The crop is normalized (grayscale, fixed size, equalized) first, so the same plate
+    seen again with slight lighting or jitter changes maps to the same key.
+    """
+    gray = cv2.cvtColor(plate_image, cv2.COLOR_BGR2GRAY) if plate_image.ndim == 3 else plate_image
+    small = cv2.resize(gray, (hash_width + 1, hash_height), interpolation=cv2.INTER_AREA)
+    small = cv2.equalizeHist(small)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits.flatten()).tobytes().hex()
+
+
+class PlateOCRCache:
+    """Bounded LRU cache of OCR results, (text, confidence) pairs, keyed by plate hash (and optionally a track id)."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, plate_image, track_id=None):
+        key = plate_hash(plate_image)
+        if track_id is not None:
+            key = f"{track_id}:{key}"
+        return key
+
+    def get(self, key):
+        """Returns the cached result or None. A hit moves the entry to the most-recent end."""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,188 @@
+import threading
+import time
+import weakref
+from collections import deque
+
+from instrumentation import FRAMES_DROPPED_TOTAL, log_event
+
+# Running pipelines, for queue-depth gauges
+ACTIVE_PIPELINES = weakref.WeakSet()
+
+
+class LatestQueue:
+    """
+    Small bounded queue where a full put drops the OLDEST item (latest-frame-wins).
+    A slow consumer therefore sees fewer, fresher frames instead of a growing backlog.
+    """
+
+    def __init__(self, maxsize=2, name=None):
+        self.maxsize = max(1, maxsize)
+        self.name = name
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                if self.name:
+                    FRAMES_DROPPED_TOTAL.inc(queue=self.name)
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Returns the next item, or None once the queue is closed and drained (or on timeout)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        # Wakes up every waiter; remaining items can still be drained
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FramePipeline:
+    """
+    Runs capture -> inference -> encode on three threads joined by LatestQueues.
+    `read_fn()` returns the next item or None at end of stream, `infer_fn(item)` and
+    `encode_fn(item)` transform it (returning None drops the item). Iterate the
+    pipeline to receive encoded output. `pace_fps` may be a number or a callable
+    returning the current rate, for sources whose read rate changes over time.
+    """
+
+    STAGES = ("capture", "inference", "encode")
+
+    def __init__(self, read_fn, infer_fn, encode_fn, queue_depth=2, pace_fps=None, name="stream"):
+        self.read_fn = read_fn
+        self.infer_fn = infer_fn
+        self.encode_fn = encode_fn
+        self.pace_fps = pace_fps
+        self.name = name
+        # Input queue of the inference and encode stages, plus the output queue the consumer reads from
+        self.queues = {stage: LatestQueue(queue_depth, name=stage) for stage in self.STAGES[1:]}
+        self.output = LatestQueue(queue_depth, name="output")
+        self.captured = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        targets = [
+            ("capture", self._capture_loop),
+            ("inference", lambda: self._stage_loop(self.queues["inference"], self.infer_fn, self.queues["encode"])),
+            ("encode", lambda: self._stage_loop(self.queues["encode"], self.encode_fn, self.output)),
+        ]
+        for stage, target in targets:
+            t = threading.Thread(target=self._guard(stage, target), name=f"{self.name}-{stage}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        ACTIVE_PIPELINES.add(self)
+        return self
+
+    def stop(self, timeout=2.0, cleanup=None):
+        """
+        Stops every stage and waits up to `timeout` for their threads. `cleanup()` (e.g.
+        releasing the capture read_fn uses) runs once no stage is running any more:
+        right away when they all ended in time, otherwise on a helper thread that waits
+        for the stragglers, so a stage stuck in a long read or forward pass never sees
+        its resources released under it. Returns True if every stage had ended.
+        """
+        self._stop.set()
+        ACTIVE_PIPELINES.discard(self)
+        for q in list(self.queues.values()) + [self.output]:
+            q.close()
+        others = [t for t in self._threads if t is not threading.current_thread()]
+        for t in others:
+            t.join(timeout=timeout)
+        running = [t for t in others if t.is_alive()]
+        for t in running:
+            log_event("WARNING", "pipeline_stage_slow_stop", key=(self.name, t.name), stream=self.name,
+                      thread=t.name, timeout_s=timeout)
+        if cleanup is None:
+            return not running
+        if not running:
+            cleanup()
+            return True
+
+        def deferred():
+            for t in running:
+                t.join()
+            cleanup()
+        threading.Thread(target=deferred, name=f"{self.name}-cleanup", daemon=True).start()
+        return False
+
+    def stats(self):
+        """Current depth and dropped-frame count per stage queue."""
+        stats = {"capture": {"frames": self.captured}}
+        for stage, q in self.queues.items():
+            stats[stage] = {"depth": len(q), "dropped": q.dropped}
+        stats["output"] = {"depth": len(self.output), "dropped": self.output.dropped}
+        return stats
+
+    def __iter__(self):
+        while not self._stop.is_set():
+            item = self.output.get(timeout=0.5)
+            if item is None:
+                if self.output.closed:
+                    break
+                continue
+            yield item
+
+    def _guard(self, stage, target):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                log_event("ERROR", "pipeline_stage_failed", key=(self.name, stage), stream=self.name, stage=stage, error=e)
+                self.stop()
+        return run
+
+    def _capture_loop(self):
+        next_due = time.perf_counter()
+        out = self.queues["inference"]
+        while not self._stop.is_set():
+            item = self.read_fn()
+            if item is None:
+                break
+            self.captured += 1
+            out.put(item)
+            pace_fps = self.pace_fps() if callable(self.pace_fps) else self.pace_fps
+            interval = 1.0 / pace_fps if pace_fps else 0.0
+            if interval:
+                # Pace file sources to their native FPS so they behave like a live camera
+                next_due += interval
+                delay = next_due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_due = time.perf_counter()
+        out.close()
+
+    def _stage_loop(self, inbox, fn, outbox):
+        # Once stopped, frames still queued are dropped instead of paying for more forward passes
+        while not self._stop.is_set():
+            item = inbox.get(timeout=0.5)
+            if item is None:
+                if inbox.closed or self._stop.is_set():
+                    break
+                continue
+            result = fn(item)
+            if result is not None:
+                outbox.put(result)
+        outbox.close()
@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+
+# Role of each model class, resolved once from the label text at load time
+ROLE_OTHER = 0
+ROLE_PLATE = 1
+ROLE_HELMET = 2
+ROLE_NO_HELMET = 3
+ROLE_HEAD = 4
+
+NEGATIVE_WORDS = ("no", "without", "missing", "not")
+
+COLOR_DEFAULT = (0, 255, 0) # Green
+COLOR_PLATE = (255, 0, 0) # Blue
+COLOR_VIOLATION = (0, 0, 255) # Red
+
+
+def classify_label(label):
+    """Maps a class label to a role using the same substring rules as the old per-box loop."""
+    lbl_lower = label.lower()
+    if "plate" in lbl_lower or "license" in lbl_lower:
+        return ROLE_PLATE
+    if "helmet" in lbl_lower:
+        # Checking strings is safer than IDs since user datasets vary
+        if any(word in lbl_lower for word in NEGATIVE_WORDS):
+            return ROLE_NO_HELMET
+        return ROLE_HELMET
+    if "head" in lbl_lower:
+        # A bare "Head" class usually means no helmet
+        return ROLE_HEAD
+    return ROLE_OTHER
+
+
+def build_role_table(class_names):
+    """Returns a lookup array indexed by class id. Accepts the YOLO names dict or a plain list."""
+    if isinstance(class_names, dict):
+        items = class_names.items()
+    else:
+        items = enumerate(class_names)
+    items = list(items)
+    size = max((int(k) for k, _ in items), default=-1) + 1
+    table = np.full(size, ROLE_OTHER, dtype=np.int8)
+    for cls_id, label in items:
+        table[int(cls_id)] = classify_label(label)
+    return table
+
+
+def boxes_to_array(boxes):
+    """Converts `results.boxes` (or its `.data`, or an (N, 6) array) into one (N, 6) float32 array in a single transfer."""
+    # (ndarray.data is a raw buffer, so plain arrays are taken as they are)
+    data = boxes if isinstance(boxes, np.ndarray) else getattr(boxes, "data", boxes)
+    if hasattr(data, "cpu"):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32)
+    if data.size == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    # Tracked results carry an extra id column before conf/cls; keep xyxy, conf, cls
+    if data.shape[1] > 6:
+        data = data[:, [0, 1, 2, 3, -2, -1]]
+    return data
+
+
+class FrameDetections:
+    """Detections of one frame that survived filtering, stored as parallel arrays."""
+
+    def __init__(self, xyxy, conf, cls, role, plate_conf):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+        self.role = role
+        self.is_violation = (role == ROLE_NO_HELMET) | (role == ROLE_HEAD)
+        self.is_safe = role == ROLE_HELMET
+        # Low confidence plates are still drawn, but not cropped or read
+        self.is_plate = (role == ROLE_PLATE) & (conf > plate_conf)
+
+    def __len__(self):
+        return len(self.conf)
+
+    @property
+    def safe_count(self):
+        return int(np.count_nonzero(self.is_safe))
+
+    @property
+    def unsafe_count(self):
+        return int(np.count_nonzero(self.is_violation))
+
+    @property
+    def plate_indices(self):
+        return np.flatnonzero(self.is_plate)
+
+    @property
+    def violation_indices(self):
+        return np.flatnonzero(self.is_violation)
+
+
+class DetectionPostProcessor:
+    def __init__(self, class_names, plate_conf=0.2, helmet_conf=0.65,
+                 min_aspect=0.5, max_aspect=2.0, max_height_ratio=0.6):
+        self.class_names = class_names
+        self.role_table = build_role_table(class_names)
+        self.plate_conf = plate_conf
+        # STRICT FILTER for helmets: high confidence and a box shaped like a head
+        self.helmet_conf = helmet_conf
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.max_height_ratio = max_height_ratio
+
+    def process(self, boxes, frame_shape):
+        """Classifies and filters every box of a frame at once. Returns a FrameDetections."""
+        data = boxes_to_array(boxes)
+        xyxy = data[:, :4].astype(np.int32)
+        conf = data[:, 4]
+        cls = data[:, 5].astype(np.int32)
+
+        # Classes the model knows but the table doesn't (e.g. swapped weights) fall back to "other"
+        role = np.full(len(cls), ROLE_OTHER, dtype=np.int8)
+        known = (cls >= 0) & (cls < len(self.role_table))
+        role[known] = self.role_table[cls[known]]
+
+        box_w = (xyxy[:, 2] - xyxy[:, 0]).astype(np.float32)
+        box_h = (xyxy[:, 3] - xyxy[:, 1]).astype(np.float32)
+        aspect_ratio = np.divide(box_w, box_h, out=np.zeros_like(box_w), where=box_h > 0)
+        img_h = frame_shape[0]
+        h_ratio = box_h / img_h if img_h > 0 else np.zeros_like(box_h)
+
+        plausible_helmet = ((conf > self.helmet_conf)
+                            & (aspect_ratio > self.min_aspect) & (aspect_ratio < self.max_aspect)
+                            & (h_ratio < self.max_height_ratio))
+        keep = (role != ROLE_HELMET) | plausible_helmet
+
+        return FrameDetections(xyxy[keep], conf[keep], cls[keep], role[keep], self.plate_conf)
+
+    def label_for(self, dets, i):
+        if dets.is_violation[i]:
+            return "NO HELMET" # Force label update for clarity
+        return self.class_names[int(dets.cls[i])]
+
+    def draw(self, frame, dets):
+        """Draws boxes and labels for all kept detections onto `frame` in place."""
+        for i in range(len(dets)):
+            x1, y1, x2, y2 = dets.xyxy[i].tolist()
+            if dets.is_violation[i]:
+                color = COLOR_VIOLATION
+            elif dets.is_plate[i]:
+                color = COLOR_PLATE
+            else:
+                color = COLOR_DEFAULT
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, f"{self.label_for(dets, i)} {dets.conf[i]:.2f}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        return frame
@@ -0,0 +1,119 @@
+import os
+import re
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def list_images(folder, limit=None):
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+def letterbox(img, imgsz=640):
+    """Resizes keeping the aspect ratio and pads to imgsz x imgsz with gray, like ultralytics' preprocessing."""
+    h, w = img.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+class CalibrationImages:
+    """
+    onnxruntime CalibrationDataReader over an image folder: yields the model input
+    exactly as inference sees it (letterboxed, RGB, CHW, 0-1 floats).
+    """
+
+    def __init__(self, folder, input_name, imgsz=640, limit=200):
+        self.paths = list_images(folder, limit)
+        if not self.paths:
+            raise ValueError(f"No calibration images in {folder}")
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._iter = iter(self.paths)
+
+    def get_next(self):
+        for path in self._iter:
+            img = cv2.imread(path)
+            if img is None:
+                continue
+            blob = letterbox(img, self.imgsz)[:, :, ::-1].transpose(2, 0, 1)
+            return {self.input_name: np.ascontiguousarray(blob, dtype=np.float32)[None] / 255.0}
+        return None
+
+    def rewind(self):
+        self._iter = iter(self.paths)
+
+
+def detect_head_nodes(onnx_model):
+    """
+    Names of the nodes in the Detect head (the highest `/model.N/` block). Box decoding
+    (DFL, anchors, concat of box + class scores) loses too much in INT8, so it stays float.
+    """
+    blocks = {}
+    for node in onnx_model.graph.node:
+        match = re.match(r"/model\.(\d+)/", node.name)
+        if match:
+            blocks.setdefault(int(match.group(1)), []).append(node.name)
+    return blocks[max(blocks)] if blocks else []
+
+
+def quantize_onnx_int8(fp32_path, int8_path, calibration_dir, imgsz=640, limit=200):
+    """Static QDQ INT8 quantization with onnxruntime, calibrated on `calibration_dir`."""
+    import onnx
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+
+    model = onnx.load(fp32_path)
+    input_name = model.graph.input[0].name
+    reader = CalibrationImages(calibration_dir, input_name, imgsz, limit)
+    print(f"[INFO] Calibrating INT8 ONNX model on {len(reader.paths)} image(s)...")
+    quantize_static(
+        fp32_path, int8_path, reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=detect_head_nodes(model),
+    )
+    return int8_path
+
+
+def quantize_openvino_int8(model_path, calibration_dir, imgsz=640):
+    """
+    INT8 OpenVINO export through ultralytics (NNCF post-training quantization).
+    ultralytics calibrates from a dataset yaml, so a throwaway one points at the folder.
+    Dynamic shapes like the float export, so process_images can still send mini-batches.
+    Returns the directory ultralytics produced; the caller moves it into the cache.
+    """
+    model = YOLO(model_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_yaml = os.path.join(tmp, "calibration.yaml")
+        folder = os.path.abspath(calibration_dir)
+        with open(data_yaml, "w") as f:
+            f.write(f"path: {folder}\ntrain: {folder}\nval: {folder}\nnames:\n")
+            for cls_id, name in model.names.items():
+                f.write(f"  {cls_id}: {name!r}\n")
+        print(f"[INFO] Calibrating INT8 OpenVINO model on {calibration_dir}...")
+        return model.export(format="openvino", int8=True, data=data_yaml, imgsz=imgsz, dynamic=True)
+
+
+if __name__ == "__main__":
+    # Usage: python quantize.py <onnx|openvino> <calibration_image_dir> [model_path]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("onnx", "openvino"):
+        print("Usage: python quantize.py <onnx|openvino> <calibration_image_dir> [model_path]")
+        sys.exit(1)
+    from inference_engine import export_model
+    model_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best.pt')
+    imgsz = int(os.environ.get('INFERENCE_IMGSZ', 640))
+    path = export_model(model_path, f"{sys.argv[1]}-int8", imgsz, calibration_dir=sys.argv[2])
+    print(f"[INFO] INT8 model ready: {path}. Run it with INFERENCE_ENGINE={sys.argv[1]}-int8")
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Component:
+    """One thing that has to be loaded before the app can serve, e.g. the YOLO model."""
+
+    def __init__(self, name, load_fn, requires=()):
+        self.name = name
+        self.load_fn = load_fn
+        self.requires = tuple(requires)
+        self.state = "pending"  # pending -> loading -> ready | failed
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.done = threading.Event()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "error": self.error,
+        }
+
+
+class ComponentLoader:
+    """
+    Loads named components either in parallel on background threads (`start`) or
+    lazily the first time they are needed (`get`). A component is only loaded once;
+    callers that need it while it is loading wait for it. When everything has
+    loaded, the per-component timings are logged.
+    """
+
+    def __init__(self, name="startup"):
+        self.name = name
+        self._components = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = time.perf_counter()
+        self._logged = False
+
+    def add(self, name, load_fn, requires=()):
+        """Registers `load_fn()`, whose return value `get(name)` hands out. `requires` load first."""
+        self._components[name] = Component(name, load_fn, requires)
+
+    @contextmanager
+    def timed(self, name):
+        """Times a step done synchronously by the caller, so it shows up in the breakdown."""
+        component = Component(name, None)
+        self._components[name] = component
+        component.state = "loading"
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            component.state, component.error = "failed", str(e)
+            raise
+        else:
+            component.state = "ready"
+        finally:
+            component.seconds = time.perf_counter() - started
+            component.done.set()
+
+    def start(self, names=None):
+        """Starts loading every pending component (or just `names`) on its own thread. Returns immediately."""
+        for name in names or list(self._components):
+            component = self._components[name]
+            if component.state == "pending":
+                threading.Thread(target=self._load, args=(component,), name=f"{self.name}-{name}", daemon=True).start()
+        return self
+
+    def load_all(self, names=None):
+        """Loads components in parallel and blocks until they are all done."""
+        self.start(names)
+        for name in names or list(self._components):
+            self.get(name)
+        return self
+
+    def get(self, name, timeout=None):
+        """Returns the loaded component, loading it on this thread if nobody has started yet."""
+        component = self._components[name]
+        if component.state == "pending":
+            self._load(component)
+        if not component.done.wait(timeout):
+            raise TimeoutError(f"{name} is still loading")
+        if component.state == "failed":
+            raise RuntimeError(f"{name} failed to load: {component.error}")
+        return component.value
+
+    def is_loaded(self, name):
+        return self._components[name].state == "ready"
+
+    @property
+    def ready(self):
+        return all(c.state == "ready" for c in self._components.values())
+
+    @property
+    def failed(self):
+        return any(c.state == "failed" for c in self._components.values())
+
+    def status(self):
+        return {name: c.status() for name, c in self._components.items()}
+
+    def _load(self, component):
+        with self._lock:
+            if component.state != "pending":
+                return
+            component.state = "loading"
+        started = time.perf_counter()
+        try:
+            for dep in component.requires:
+                self.get(dep)
+            # Time spent waiting for dependencies isn't this component's cost
+            started = time.perf_counter()
+            component.value = component.load_fn()
+            component.state = "ready"
+            print(f"[INFO] Loaded {component.name} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            component.error = str(e)
+            component.state = "failed"
+            print(f"[ERROR] Loading {component.name} failed: {e}")
+        finally:
+            component.seconds = time.perf_counter() - started
+            component.done.set()
+        self._log_when_done()
+
+    def _log_when_done(self):
+        with self._lock:
+            if self._logged or not all(c.done.is_set() for c in self._components.values()):
+                return
+            self._logged = True
+        total = time.perf_counter() - self._created
+        parts = ", ".join(f"{c.name} {c.seconds:.2f}s" + (" (failed)" if c.state == "failed" else "")
+                          for c in self._components.values())
+        print(f"[INFO] {self.name.capitalize()} finished in {total:.2f}s: {parts}")
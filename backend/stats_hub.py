@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+
+
+class StreamStats:
+    """
+    Live stats of one stream.
+
+    Every meaningful change bumps `seq` and wakes the waiting SSE clients, which then
+    only receive what changed since the last seq they saw. Violator records live in a
+    fixed-size ring buffer, so a looping live feed can't grow memory without bound.
+    Telemetry (queue depths, FPS, ...) is stored without waking anyone; it rides along
+    with the next message or the periodic refresh.
+    """
+
+    def __init__(self, name, max_violators=200):
+        self.name = name
+        self.max_violators = max_violators
+        self._cond = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        with self._cond:
+            self.seq = 0
+            # Bumped on every reset so clients holding an old seq know to start over
+            self.epoch = getattr(self, "epoch", 0) + 1
+            self.counters = {"safe": 0, "unsafe": 0, "plates": []}
+            self.telemetry = {}
+            self.telemetry_version = 0
+            self.violators = deque(maxlen=self.max_violators)
+            # Latest seq of any record pushed out of the ring buffer
+            self.evicted_seq = 0
+            self._next_violator_id = 1
+            self.started_at = time.time()
+            self.ended_at = None
+            self._cond.notify_all()
+
+    def _bump(self):
+        self.seq += 1
+        self._cond.notify_all()
+        return self.seq
+
+    def update(self, **counters):
+        """Sets counters (safe, unsafe, plates, ...); subscribers are only woken if a value changed."""
+        with self._cond:
+            changed = {k: v for k, v in counters.items() if self.counters.get(k) != v}
+            if changed:
+                self.counters.update(changed)
+                self._bump()
+
+    def set_telemetry(self, **fields):
+        with self._cond:
+            self.telemetry.update(fields)
+            self.telemetry_version += 1
+
+    def add_violator(self, record):
+        """Appends a violator record (the dict is kept and may be updated later). Returns it."""
+        with self._cond:
+            record["id"] = self._next_violator_id
+            self._next_violator_id += 1
+            record["seq"] = self._bump()
+            if len(self.violators) == self.violators.maxlen:
+                self.evicted_seq = max(self.evicted_seq, self.violators[0]["seq"])
+            self.violators.append(record)
+            return record
+
+    def update_violator(self, record, **fields):
+        """Updates a stored record (e.g. plate_text once OCR is done) and re-sends it as a delta."""
+        with self._cond:
+            record.update(fields)
+            record["seq"] = self._bump()
+
+    def end(self, epoch=None):
+        """Marks the stream ended, unless `epoch` is given and the stats were reset since."""
+        with self._cond:
+            if epoch is not None and epoch != self.epoch:
+                return False
+            self.ended_at = time.time()
+            self._bump()
+            return True
+
+    @property
+    def ended(self):
+        return self.ended_at is not None
+
+    def summary(self):
+        """Counters and telemetry without the violator list, cheap enough to take every frame."""
+        with self._cond:
+            return dict(self.counters, **self.telemetry)
+
+    def delta(self, since_seq=0, epoch=None):
+        """
+        Everything a client that has seen `since_seq` (in `epoch`) is missing.
+        `reset` is True when the client must drop its state and use this message as a full snapshot.
+        """
+        with self._cond:
+            # A restarted stream or a client that fell behind the ring buffer gets a full snapshot
+            reset = epoch != self.epoch or since_seq > self.seq or since_seq < self.evicted_seq
+            if reset:
+                since_seq = 0
+            message = dict(self.counters, **self.telemetry)
+            message["seq"] = self.seq
+            message["epoch"] = self.epoch
+            message["reset"] = bool(reset)
+            message["ended"] = self.ended
+            message["violators"] = [dict(v) for v in self.violators if v["seq"] > since_seq]
+            return message
+
+    def wait(self, since_seq, epoch, telemetry_version, timeout):
+        """Blocks until something newer than `since_seq` exists, the stream restarts or `timeout` passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > since_seq or self.epoch != epoch, timeout)
+            return self.seq > since_seq or self.epoch != epoch or self.telemetry_version != telemetry_version
+
+
+class StatsHub:
+    """
+    Registry of StreamStats by stream name. Streams that ended are evicted after
+    `retention_s`, giving late clients time to fetch the final results.
+    """
+
+    def __init__(self, max_violators=200, retention_s=300):
+        self.max_violators = max_violators
+        self.retention_s = retention_s
+        self._streams = {}
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def open(self, name):
+        """Called by the producer when a stream (re)starts. Existing subscribers stay attached."""
+        with self._lock:
+            stats = self._streams.get(name)
+            if stats is None:
+                stats = StreamStats(name, self.max_violators)
+                self._streams[name] = stats
+            else:
+                stats.reset()
+        self.evict()
+        return stats
+
+    def close(self, name, epoch=None):
+        """
+        Called by the producer when its stream stops. With `epoch` (the stats' epoch the
+        producer started in) a producer that lost a race to its replacement can't end
+        the replacement's stream.
+        """
+        with self._lock:
+            stats = self._streams.get(name)
+        if stats is not None:
+            stats.end(epoch)
+
+    def get(self, name):
+        with self._lock:
+            return self._streams.get(name)
+
+    def attach(self, name):
+        """Subscriber side: returns the stream's stats, creating a waiting placeholder if it hasn't started."""
+        with self._lock:
+            stats = self._streams.get(name)
+            if stats is None:
+                stats = StreamStats(name, self.max_violators)
+                # A placeholder counts as ended, so it is evicted if the stream never starts
+                stats.ended_at = time.time()
+                self._streams[name] = stats
+            self._waiters[name] = self._waiters.get(name, 0) + 1
+            return stats
+
+    def detach(self, name):
+        with self._lock:
+            self._waiters[name] = self._waiters.get(name, 1) - 1
+            if self._waiters[name] <= 0:
+                del self._waiters[name]
+        self.evict()
+
+    def evict(self):
+        """Drops streams that ended more than retention_s ago and have no subscribers."""
+        now = time.time()
+        with self._lock:
+            for name, stats in list(self._streams.items()):
+                if stats.ended and now - stats.ended_at > self.retention_s and name not in self._waiters:
+                    del self._streams[name]
+
+    def __len__(self):
+        return len(self._streams)
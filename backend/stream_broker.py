@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import Counter
+
+from frame_encoder import SharedFrame
+from instrumentation import log_event
+
+
+def mjpeg_part(frame_bytes):
+    """Wraps one JPEG in the multipart/x-mixed-replace framing used by the MJPEG endpoints."""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+
+class StreamChannel:
+    """
+    One running source: a producer thread publishes the newest frame and
+    subscribers pick it up. Only the latest frame is kept, so a slow subscriber
+    skips frames instead of holding up the producer or the other viewers.
+    Frames are JPEG bytes, or SharedFrames that each viewer encodes for its output
+    profile (once per profile per frame, shared by the viewers of that profile).
+    """
+
+    def __init__(self, key, source_fn, stats_fn=None):
+        self.key = key
+        self.source_fn = source_fn
+        self.stats_fn = stats_fn
+        self.subscribers = 0
+        self.profiles = Counter()
+        self.seq = 0
+        self.frame = None
+        self.stats = {}
+        self.started_at = time.time()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"broker-{key}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        """Waits for the producer thread to finish its cleanup. Returns False on timeout."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, frame_bytes):
+        stats = self.stats_fn() if self.stats_fn else {}
+        with self._cond:
+            self.seq += 1
+            self.frame = frame_bytes
+            self.stats = stats
+            self._cond.notify_all()
+
+    def wait_next(self, last_seq, timeout=1.0):
+        """Blocks until a frame newer than `last_seq` exists. Returns (seq, frame) or None."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > last_seq or self._closed, timeout)
+            if self.seq > last_seq:
+                return self.seq, self.frame
+            return None
+
+    def info(self):
+        return {
+            "subscribers": self.subscribers,
+            "profiles": {name: count for name, count in self.profiles.items() if count > 0},
+            "frames_published": self.seq,
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+    def _run(self):
+        source = None
+        try:
+            source = self.source_fn()
+            for frame_bytes in source:
+                if self._stop.is_set():
+                    break
+                self.publish(frame_bytes)
+        except Exception as e:
+            log_event("ERROR", "stream_producer_failed", key=self.key, stream=self.key, error=e)
+        finally:
+            # Closing the generator runs its cleanup (stops pipelines, releases the capture)
+            if source is not None and hasattr(source, "close"):
+                source.close()
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+
+
+class StreamBroker:
+    """
+    Fans out one inference loop per source to any number of MJPEG viewers.
+    The producer starts with the first subscriber and is stopped when the last one leaves.
+    A viewer arriving while a stopped producer is still winding down waits for it to
+    finish (up to `stop_timeout_s`) before a new one starts, so the two never run
+    their startup and cleanup for the same source at once.
+    """
+
+    def __init__(self, stop_timeout_s=5.0):
+        self.stop_timeout_s = stop_timeout_s
+        self._channels = {}
+        # key -> stopped channel whose producer thread may still be running
+        self._stopping = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, source_fn, stats_fn=None, profile=None):
+        """
+        Generator of multipart MJPEG parts for `key`. `source_fn()` must return an
+        iterator of JPEG bytes or SharedFrames and is only called if no producer is
+        running for `key`. SharedFrames are sent encoded for this viewer's `profile`.
+        """
+        channel = self._attach(key, source_fn, stats_fn, profile)
+        try:
+            last_seq = 0
+            while True:
+                item = channel.wait_next(last_seq)
+                if item is None:
+                    if channel.closed:
+                        break
+                    continue
+                last_seq, frame = item
+                # Encoded on this viewer's thread; the other viewers of the profile reuse it
+                frame_bytes = frame.encode(profile) if isinstance(frame, SharedFrame) else frame
+                if frame_bytes is not None:
+                    yield mjpeg_part(frame_bytes)
+        finally:
+            self._detach(key, channel, profile)
+
+    def latest_stats(self, key):
+        with self._lock:
+            channel = self._channels.get(key)
+        return channel.stats if channel else None
+
+    def info(self):
+        with self._lock:
+            return {str(key): channel.info() for key, channel in self._channels.items()}
+
+    def _attach(self, key, source_fn, stats_fn, profile=None):
+        while True:
+            with self._lock:
+                channel = self._channels.get(key)
+                if channel is None or channel.closed:
+                    old = self._stopping.get(key)
+                    if old is not None and not old.closed:
+                        channel = None
+                    else:
+                        self._stopping.pop(key, None)
+                        channel = StreamChannel(key, source_fn, stats_fn).start()
+                        self._channels[key] = channel
+                if channel is not None:
+                    channel.subscribers += 1
+                    if profile is not None:
+                        channel.profiles[profile.name] += 1
+                    return channel
+            # The old producer is still cleaning up; waited for outside the lock so other streams aren't held up
+            if not old.join(self.stop_timeout_s):
+                log_event("WARNING", "stream_producer_slow_stop", key=key, stream=key,
+                          timeout_s=self.stop_timeout_s)
+                with self._lock:
+                    # Start the replacement anyway; StatsHub.close is epoch-checked, so the old one can't end it
+                    if self._stopping.get(key) is old:
+                        del self._stopping[key]
+
+    def _detach(self, key, channel, profile=None):
+        with self._lock:
+            channel.subscribers -= 1
+            if profile is not None:
+                channel.profiles[profile.name] -= 1
+            if channel.subscribers <= 0:
+                # Last viewer left: stop the producer so the model stops burning CPU
+                channel.stop()
+                if self._channels.get(key) is channel:
+                    del self._channels[key]
+                    self._stopping[key] = channel
@@ -0,0 +1,176 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+import inference_engine
+from inference_engine import compare_detections, export_model, exported_path, load_model
+from postprocess import DetectionPostProcessor
+
+NAMES = {0: "helmet", 1: "no helmet", 2: "license plate"}
+FRAME = (480, 640, 3)
+
+
+def detections(*rows):
+    """FrameDetections from (x1, y1, x2, y2, conf, cls) rows, through the real post-processing."""
+    return DetectionPostProcessor(NAMES).process(np.array(rows, dtype=np.float32).reshape(-1, 6), FRAME)
+
+
+class FakeYOLO:
+    """Stands in for ultralytics.YOLO: records how it was built and writes a dummy file on export."""
+
+    exports = []
+
+    def __init__(self, path, task=None):
+        self.path = path
+        self.task = task
+
+    def export(self, format, imgsz, **kwargs):
+        produced = os.path.splitext(self.path)[0] + ".onnx"
+        with open(produced, "w") as f:
+            f.write("exported")
+        FakeYOLO.exports.append((self.path, format, imgsz, kwargs))
+        return produced
+
+
+@pytest.fixture
+def fake_yolo(monkeypatch):
+    FakeYOLO.exports = []
+    monkeypatch.setattr(inference_engine, "YOLO", FakeYOLO)
+    monkeypatch.setattr(inference_engine, "engine_available", lambda engine: True)
+    return FakeYOLO
+
+
+@pytest.fixture
+def weights(tmp_path):
+    path = tmp_path / "best.pt"
+    path.write_text("weights")
+    return str(path)
+
+
+# --- compare_detections ---
+
+def test_identical_detections_match():
+    rows = [(100, 100, 160, 160, 0.9, 0), (300, 100, 360, 160, 0.8, 1), (300, 300, 400, 340, 0.7, 2)]
+    assert compare_detections(detections(*rows), detections(*rows)) == []
+
+
+def test_small_box_jitter_still_matches():
+    reference = detections((300, 100, 360, 160, 0.8, 1))
+    candidate = detections((302, 101, 361, 162, 0.75, 1))
+    assert compare_detections(reference, candidate) == []
+
+
+def test_different_verdict_is_reported():
+    reference = detections((300, 100, 360, 160, 0.8, 1))
+    candidate = detections((300, 100, 360, 160, 0.8, 0))
+    problems = compare_detections(reference, candidate)
+    assert any(p.startswith("unsafe_count") for p in problems)
+    assert any("matching boxes" in p for p in problems)
+
+
+def test_moved_box_is_reported():
+    reference = detections((300, 100, 360, 160, 0.8, 1))
+    candidate = detections((400, 200, 460, 260, 0.8, 1))
+    assert compare_detections(reference, candidate) == ["0 matching boxes out of 1 / 1"]
+
+
+def test_missing_plate_is_reported():
+    reference = detections((300, 300, 400, 340, 0.7, 2))
+    candidate = detections()
+    problems = compare_detections(reference, candidate)
+    assert "plates 1 != 0" in problems
+
+
+def test_empty_frames_match():
+    assert compare_detections(detections(), detections()) == []
+
+
+# --- exported_path / export_model ---
+
+def test_exported_path_names(weights):
+    cache = os.path.join(os.path.dirname(weights), "engine_cache")
+    assert exported_path(weights, "onnx", 640) == os.path.join(cache, "best_640.onnx")
+    assert exported_path(weights, "onnx-int8", 320) == os.path.join(cache, "best_320_int8.onnx")
+    assert exported_path(weights, "openvino", 640) == os.path.join(cache, "best_640_openvino_model")
+    assert exported_path(weights, "openvino-int8", 640, cache_dir="/c") == "/c/best_640_int8_openvino_model"
+
+
+def test_export_is_cached(fake_yolo, weights):
+    first = export_model(weights, "onnx", 640)
+    second = export_model(weights, "onnx", 640)
+    assert first == second == exported_path(weights, "onnx", 640)
+    assert os.path.exists(first)
+    assert len(fake_yolo.exports) == 1
+    assert fake_yolo.exports[0][3]["dynamic"] is True
+
+
+def test_newer_weights_invalidate_the_cache(fake_yolo, weights):
+    target = export_model(weights, "onnx", 640)
+    cached_at = os.path.getmtime(target)
+    os.utime(weights, (cached_at + 10, cached_at + 10))
+    export_model(weights, "onnx", 640)
+    assert len(fake_yolo.exports) == 2
+
+
+def test_int8_without_cache_or_calibration_raises(fake_yolo, weights):
+    with pytest.raises(ValueError, match="quantize.py"):
+        export_model(weights, "onnx-int8", 640)
+    assert fake_yolo.exports == []
+
+
+# --- load_model ---
+
+def test_missing_runtime_falls_back_to_pytorch(fake_yolo, monkeypatch, weights):
+    monkeypatch.setattr(inference_engine, "engine_available", lambda engine: False)
+    model, engine = load_model(weights, "onnx", 640)
+    assert engine == "pytorch"
+    assert model.path == weights
+    assert fake_yolo.exports == []
+
+
+def test_available_runtime_loads_the_export(fake_yolo, weights):
+    model, engine = load_model(weights, "openvino", 640)
+    assert engine == "openvino"
+    assert model.path == exported_path(weights, "openvino", 640)
+    assert model.task == "detect"
+
+
+def test_unknown_engine_is_rejected(weights):
+    with pytest.raises(ValueError, match="Unknown inference engine"):
+        load_model(weights, "tensorrt", 640)
+
+
+# --- Parity with PyTorch on real images (skipped unless the runtime is installed) ---
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(BACKEND_DIR, "best.pt")
+SAMPLES = [os.path.join(BACKEND_DIR, "static", "samples", name) for name in ("helmet.webp", "violation.webp")]
+RUNTIMES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+@pytest.fixture(scope="module")
+def reference():
+    """PyTorch detections of every sample, post-processed like process_image does."""
+    import cv2
+    model, _ = load_model(MODEL_PATH, "pytorch", 640)
+    postprocessor = DetectionPostProcessor(model.names)
+    images = [cv2.imread(path) for path in SAMPLES]
+    assert all(img is not None for img in images)
+    dets = [postprocessor.process(model(img, conf=0.25, imgsz=640, verbose=False)[0].boxes, img.shape)
+            for img in images]
+    return images, postprocessor, dets
+
+
+@pytest.mark.parametrize("engine", sorted(RUNTIMES))
+def test_engine_matches_pytorch(engine, reference, tmp_path_factory):
+    pytest.importorskip(RUNTIMES[engine])
+    images, postprocessor, expected = reference
+    model, used = load_model(MODEL_PATH, engine, 640, cache_dir=str(tmp_path_factory.mktemp(engine)))
+    assert used == engine
+    for path, img, reference_dets in zip(SAMPLES, images, expected):
+        candidate = postprocessor.process(model(img, conf=0.25, imgsz=640, verbose=False)[0].boxes, img.shape)
+        assert compare_detections(reference_dets, candidate) == [], os.path.basename(path)
@@ -0,0 +1,80 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("easyocr")
+
+from benchmarks.scenes import render_scene
+from license_plate import LicensePlateDetector, scale_crop
+
+
+@pytest.fixture(scope="module")
+def detector():
+    # Cache off, so both paths really read every crop
+    return LicensePlateDetector(cache_size=0)
+
+
+@pytest.fixture(scope="module")
+def plate_crops():
+    """The rendered plates of a few benchmark scenes, the crops the benchmark reads."""
+    rng = np.random.default_rng(0)
+    crops = []
+    for _ in range(3):
+        img, plates = render_scene(rng, riders=3)
+        crops.extend(img[y1:y2, x1:x2].copy() for (x1, y1, x2, y2), _ in plates)
+    return crops
+
+
+class RecordingReader:
+    """Stands in for an EasyOCR reader and keeps the images it was given."""
+
+    def __init__(self):
+        self.single = []
+        self.batches = []
+
+    def readtext(self, image):
+        self.single.append(image)
+        return []
+
+    def readtext_batched(self, images):
+        self.batches.append(images)
+        return [[] for _ in images]
+
+
+def test_both_paths_feed_the_same_pixels(detector, plate_crops):
+    reader = RecordingReader()
+    # Crops of different widths, so some get padded
+    crops = plate_crops + [crop[:, : crop.shape[1] * 2 // 3] for crop in plate_crops]
+    for crop in crops:
+        detector.recognize_text(crop, reader=reader)
+    detector.recognize_text_batch(crops, reader=reader)
+
+    batched = [img for batch in reader.batches for img in batch]
+    assert len(batched) == len(crops)
+    for single in reader.single:
+        height, width = single.shape[:2]
+        assert height == LicensePlateDetector.OCR_HEIGHT
+        # Each single-path input appears unchanged at the left of a batched image
+        assert any(img.shape[0] == height and img.shape[1] >= width and np.array_equal(img[:, :width], single)
+                   for img in batched)
+    for batch in reader.batches:
+        widths = {img.shape[1] for img in batch}
+        assert len(widths) == 1
+
+
+def test_padding_is_plain_background(detector, plate_crops):
+    reader = RecordingReader()
+    narrow = plate_crops[0][:, : plate_crops[0].shape[1] * 9 // 10]
+    detector.recognize_text_batch([plate_crops[0], narrow], reader=reader)
+    scaled = scale_crop(narrow, LicensePlateDetector.OCR_HEIGHT)
+    padded = next(img for batch in reader.batches for img in batch if not np.array_equal(img, scale_crop(
+        plate_crops[0], LicensePlateDetector.OCR_HEIGHT)))
+    padding = padded[:, scaled.shape[1]:].reshape(-1, 3)
+    # One constant color (the crop's median), not a smeared copy of its last column
+    assert len(padding) and (padding == padding[0]).all()
+
+
+def test_batched_reads_agree_with_single_reads(detector, plate_crops):
+    single = [detector.recognize_text(crop) for crop in plate_crops]
+    batched = [text for text, _ in detector.recognize_text_batch(plate_crops)]
+    assert batched == single
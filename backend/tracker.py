@@ -0,0 +1,219 @@
+from collections import Counter
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError: # scipy is optional, greedy assignment is used without it
+    linear_sum_assignment = None
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of two (N, 4) / (M, 4) xyxy arrays, returned as (N, M)."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def centers(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def centroid_distance_matrix(boxes_a, boxes_b):
+    ca, cb = centers(boxes_a), centers(boxes_b)
+    return np.linalg.norm(ca[:, None, :] - cb[None, :, :], axis=2)
+
+
+def greedy_assign(cost, max_cost):
+    """
+    Repeatedly takes the cheapest remaining (row, col) pair below `max_cost`.
+    One NumPy argmin per match, so the Python loop runs at most min(N, M) times.
+    """
+    cost = np.array(cost, dtype=np.float32)
+    matches = []
+    if cost.size == 0:
+        return matches
+    for _ in range(min(cost.shape)):
+        flat = int(np.argmin(cost))
+        r, c = divmod(flat, cost.shape[1])
+        if cost[r, c] > max_cost:
+            break
+        matches.append((r, c))
+        cost[r, :] = np.inf
+        cost[:, c] = np.inf
+    return matches
+
+
+def optimal_assign(cost, max_cost):
+    """Hungarian assignment via scipy, falling back to greedy when scipy isn't installed."""
+    if linear_sum_assignment is None:
+        return greedy_assign(cost, max_cost)
+    cost = np.asarray(cost, dtype=np.float32)
+    if cost.size == 0:
+        return []
+    # Forbid pairs over the gate with a large finite cost (scipy rejects all-inf rows)
+    gated = np.where(cost > max_cost, max_cost * 10 + 1e6, cost)
+    rows, cols = linear_sum_assignment(gated)
+    return [(int(r), int(c)) for r, c in zip(rows, cols) if cost[r, c] <= max_cost]
+
+
+class Track:
+    """One tracked object plus the per-track state the stream keeps for it."""
+
+    def __init__(self, track_id, box, frame_idx):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.first_seen = frame_idx
+        self.last_seen = frame_idx
+        self.hits = 1
+        # Best view of the object so far, scored by the caller (e.g. area * confidence)
+        self.best_crop = None
+        self.best_score = -1.0
+        self.plate_crop = None
+        self.ocr_votes = Counter()
+        # Free-form state for the caller, e.g. the violator record this track produced
+        self.data = {}
+
+    def offer_crop(self, crop, score):
+        """Keeps `crop` if it beats the best one seen so far. Returns True when it was kept."""
+        if crop is None or crop.size == 0 or score <= self.best_score:
+            return False
+        self.best_crop = crop
+        self.best_score = score
+        return True
+
+    def vote_plate(self, text):
+        if text:
+            self.ocr_votes[text] += 1
+
+    @property
+    def plate_text(self):
+        """Most voted OCR reading for this track, or None."""
+        if not self.ocr_votes:
+            return None
+        return self.ocr_votes.most_common(1)[0][0]
+
+
+class MultiObjectTracker:
+    """
+    Tracks boxes across frames with IoU association, plus a centroid-distance pass for
+    boxes that moved too far to overlap (e.g. fast bikes with frame skipping).
+    Cost matrices are computed with NumPy; assignment is Hungarian when scipy is
+    available and greedy otherwise.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_distance=100, max_age=60, assignment="auto"):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_age = max_age
+        if assignment == "greedy" or (assignment == "auto" and linear_sum_assignment is None):
+            self._assign = greedy_assign
+        else:
+            self._assign = optimal_assign
+        self.tracks = {}
+        self._next_id = 1
+        self._expired = []
+
+    def update(self, boxes, frame_idx):
+        """
+        Associates this frame's (N, 4) xyxy boxes with live tracks.
+        Returns an (N,) int array of track ids, creating tracks for unmatched boxes.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        ids = np.zeros(len(boxes), dtype=np.int64)
+        track_list = list(self.tracks.values())
+        unmatched_dets = np.arange(len(boxes))
+        unmatched_trks = np.arange(len(track_list))
+
+        if len(boxes) and track_list:
+            track_boxes = np.stack([t.box for t in track_list])
+
+            # Pass 1: overlap (all detections and tracks are candidates, so indices are global)
+            cost = 1.0 - iou_matrix(boxes, track_boxes)
+            matches = self._assign(cost, 1.0 - self.iou_threshold)
+            unmatched_dets, unmatched_trks = self._apply(matches, unmatched_dets, unmatched_trks,
+                                                         boxes, track_list, ids, frame_idx)
+
+            # Pass 2: centroid distance for whatever is left
+            if len(unmatched_dets) and len(unmatched_trks):
+                dist = centroid_distance_matrix(boxes[unmatched_dets], track_boxes[unmatched_trks])
+                local = self._assign(dist, self.max_center_distance)
+                matches = [(unmatched_dets[r], unmatched_trks[c]) for r, c in local]
+                unmatched_dets, unmatched_trks = self._apply(matches, unmatched_dets, unmatched_trks,
+                                                             boxes, track_list, ids, frame_idx)
+
+        for d in unmatched_dets:
+            track = Track(self._next_id, boxes[d], frame_idx)
+            self.tracks[track.id] = track
+            ids[d] = track.id
+            self._next_id += 1
+
+        # Drop tracks that haven't been seen for max_age frames
+        for track_id, track in list(self.tracks.items()):
+            if frame_idx - track.last_seen > self.max_age:
+                self._expired.append(self.tracks.pop(track_id))
+        return ids
+
+    def _apply(self, matches, unmatched_dets, unmatched_trks, boxes, track_list, ids, frame_idx):
+        """Updates matched tracks; `matches` holds global (detection, track) indices."""
+        if not matches:
+            return unmatched_dets, unmatched_trks
+        det_idx = np.array([r for r, _ in matches])
+        trk_idx = np.array([c for _, c in matches])
+        for d, t in zip(det_idx, trk_idx):
+            track = track_list[t]
+            track.box = boxes[d]
+            track.last_seen = frame_idx
+            track.hits += 1
+            ids[d] = track.id
+        return (np.setdiff1d(unmatched_dets, det_idx, assume_unique=True),
+                np.setdiff1d(unmatched_trks, trk_idx, assume_unique=True))
+
+    def get(self, track_id):
+        return self.tracks.get(int(track_id))
+
+    def pop_expired(self):
+        """Tracks removed since the last call, so callers can finalize their state."""
+        expired, self._expired = self._expired, []
+        return expired
+
+    def flush(self):
+        """Ends every live track (e.g. when the video is over) and returns all tracks not popped yet."""
+        self._expired.extend(self.tracks.values())
+        self.tracks = {}
+        return self.pop_expired()
+
+    def __len__(self):
+        return len(self.tracks)
+
+
+def match_plates_to_riders(rider_boxes, plate_boxes, max_distance_factor=6.0):
+    """
+    Pairs each rider (head) box with the nearest plate box below it.
+    Returns an (N,) array of plate indices, -1 where no plate is close enough.
+    The gate scales with the rider box height so it works at any distance from the camera.
+    """
+    rider_boxes = np.asarray(rider_boxes, dtype=np.float32).reshape(-1, 4)
+    plate_boxes = np.asarray(plate_boxes, dtype=np.float32).reshape(-1, 4)
+    result = np.full(len(rider_boxes), -1, dtype=np.int64)
+    if not len(rider_boxes) or not len(plate_boxes):
+        return result
+    dist = centroid_distance_matrix(rider_boxes, plate_boxes)
+    rider_c, plate_c = centers(rider_boxes), centers(plate_boxes)
+    # Plates sit below the rider's head
+    below = plate_c[None, :, 1] > rider_c[:, None, 1]
+    heights = np.maximum(rider_boxes[:, 3] - rider_boxes[:, 1], 1.0)
+    dist = np.where(below & (dist < heights[:, None] * max_distance_factor), dist, np.inf)
+    best = np.argmin(dist, axis=1)
+    has_plate = np.isfinite(dist[np.arange(len(rider_boxes)), best])
+    result[has_plate] = best[has_plate]
+    return result
@@ -0,0 +1,204 @@
+import multiprocessing as mp
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from main import StreamSession, open_video_writer
+from inference_pool import hidden_main
+from instrumentation import log_event
+
+# Each chunk re-analyzes this many frames before its range, the time a track survives unseen.
+# A rider still tracked at the boundary is therefore already known to the next chunk.
+LEAD_IN_FRAMES = StreamSession.DEBOUNCE_FRAMES
+
+# Every chunk's tracker numbers its tracks from 1; merged ids are offset by chunk index * this
+TRACK_ID_STRIDE = 1_000_000
+
+# Set in every chunk worker process by _init_worker
+_system = None
+_progress = None
+
+
+def plan_chunks(frames_total, chunks):
+    """Splits [0, frames_total) into `chunks` contiguous (start, end) frame ranges of near-equal length."""
+    chunks = max(1, min(chunks, frames_total))
+    bounds = [frames_total * i // chunks for i in range(chunks + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(chunks)]
+
+
+def _init_worker(system_options, results_root, progress, threads):
+    """Builds one YOLOv8System per worker process, reused for every chunk it gets."""
+    global _system, _progress
+    from artifact_store import ArtifactStore
+    from main import YOLOv8System
+
+    # The chunks share the cores instead of every process sizing its thread pool to all of them
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    # Budget enforcement stays with the app's store, which indexes the files after the merge
+    _system = YOLOv8System(artifact_store=ArtifactStore(results_root), ocr_workers=0, warmup_runs=0,
+                           **system_options)
+    _progress = progress
+
+
+def _process_chunk(index, video_path, part_name, name, frame_range):
+    def on_progress(frames_done, _):
+        _progress.put((index, frames_done))
+
+    result = _system.process_video(video_path, part_name, name=name, on_progress=on_progress,
+                                   frame_range=frame_range, lead_in=LEAD_IN_FRAMES if frame_range[0] else 0)
+    # The crops are written by background threads, which die with the process
+    _system.artifacts.flush()
+    return result
+
+
+def concat_videos(part_paths, output_path):
+    """
+    Joins MP4 parts with identical size/codec into one file. Uses ffmpeg's concat
+    demuxer (no re-encode) when ffmpeg is installed, otherwise re-encodes with OpenCV.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            for path in part_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+            list_path = f.name
+        try:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                            "-c", "copy", output_path], check=True)
+            return
+        except subprocess.CalledProcessError as e:
+            log_event("WARNING", "ffmpeg_concat_failed", error=e)
+        finally:
+            os.remove(list_path)
+
+    writer = None
+    try:
+        for path in part_paths:
+            cap = cv2.VideoCapture(path)
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    if writer is None:
+                        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+                        writer = open_video_writer(output_path, fps, (frame.shape[1], frame.shape[0]))
+                    writer.write(frame)
+            finally:
+                cap.release()
+    finally:
+        if writer is not None:
+            writer.release()
+
+
+def process_video_chunked(system, video_path, output_name, name=None, workers=2, min_chunk_s=120, on_progress=None):
+    """
+    Same result as system.process_video, computed by splitting the video into up to
+    `workers` frame ranges of at least `min_chunk_s` seconds, processed in parallel
+    worker processes (each with its own model and OCR reader), then merged. Videos too
+    short for two chunks are processed in this process.
+
+    Chunk k starts LEAD_IN_FRAMES early, so riders crossing its start are tracked the
+    same way the previous chunk tracks them. A violator first recorded during that
+    lead-in belongs to the previous chunk and is dropped, so every rider is recorded
+    exactly once. The annotated parts are joined into `output_name`. Track ids are
+    offset by chunk (TRACK_ID_STRIDE), so each one still names a single rider of the video.
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    fps = cap.get(cv2.CAP_PROP_FPS) if cap.isOpened() else 0
+    cap.release()
+    chunks = min(workers, int(frames_total / ((fps or 25.0) * min_chunk_s))) if min_chunk_s > 0 else workers
+    if chunks < 2:
+        return system.process_video(video_path, output_name, name=name, on_progress=on_progress)
+
+    name = name or os.path.basename(video_path)
+    stem = os.path.splitext(output_name)[0]
+    ranges = plan_chunks(frames_total, chunks)
+    # The frame count is only an estimate for some containers, so the last chunk reads to the end
+    ranges[-1] = (ranges[-1][0], None)
+    parts = [f"{stem}.part{i}.mp4" for i in range(len(ranges))]
+    system_options = {
+        "model_path": system.model_path,
+        "engine": system.engine,
+        "imgsz": system.imgsz,
+        "calibration_dir": system.calibration_dir,
+        "ocr_cache_size": 0,
+    }
+
+    ctx = mp.get_context("spawn")
+    progress = ctx.Queue()
+    done = [0] * len(ranges)
+    finished = threading.Event()
+
+    def report_progress():
+        while not finished.is_set():
+            try:
+                index, frames_done = progress.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            done[index] = frames_done
+            if on_progress is not None:
+                on_progress(sum(done), frames_total)
+
+    reporter = threading.Thread(target=report_progress, name="video-chunk-progress", daemon=True)
+    reporter.start()
+    started = time.perf_counter()
+    try:
+        threads = max(1, (os.cpu_count() or 1) // len(ranges))
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=ctx, initializer=_init_worker,
+                                 initargs=(system_options, system.artifacts.root, progress, threads)) as pool:
+            # The worker processes are started by submit
+            with hidden_main():
+                futures = [pool.submit(_process_chunk, i, video_path, parts[i], f"{name}_c{i}", frame_range)
+                           for i, frame_range in enumerate(ranges)]
+            results = [f.result() for f in futures]
+    finally:
+        finished.set()
+        reporter.join()
+
+    part_paths = [system.artifacts.path_for(p) for p in parts]
+    try:
+        concat_videos(part_paths, system.artifacts.path_for(output_name))
+    finally:
+        for path in part_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    violators = []
+    for index, result in enumerate(results):
+        for record in result["violators"]:
+            record["track_id"] += index * TRACK_ID_STRIDE
+        violators.extend(result["violators"])
+        # The workers wrote the crops; the app's store indexes them so they count towards its budget
+        for record in result["violators"]:
+            for url in (record["violator_image_url"], record["plate_image_url"]):
+                if url:
+                    filename = os.path.basename(url.split("?")[0])
+                    if os.path.exists(system.artifacts.path_for(filename)):
+                        system.artifacts.add_file(filename)
+    frames = sum(result["frames"] for result in results)
+    if on_progress is not None:
+        on_progress(frames, frames)
+    return {
+        "output_url": system.artifacts.add_file(output_name),
+        "frames": frames,
+        "fps": results[0]["fps"],
+        "elapsed_s": time.perf_counter() - started,
+        "chunks": [{"start": r[0], "frames": res["frames"], "violators": len(res["violators"]),
+                    "elapsed_s": round(res["elapsed_s"], 2)} for r, res in zip(ranges, results)],
+        "violators": sorted(violators, key=lambda v: v["frame"]),
+    }
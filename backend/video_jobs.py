@@ -0,0 +1,116 @@
+import os
+import queue
+import threading
+import time
+
+from database import now_timestamp
+from instrumentation import log_event
+from video_chunks import process_video_chunked
+
+
+class JobQueueFull(RuntimeError):
+    """The job queue already holds `max_pending` videos waiting for a worker."""
+
+
+class VideoJobQueue:
+    """
+    Processes uploaded videos in the background with YOLOv8System.process_video.
+
+    Each job produces an annotated MP4 in the results store and writes its violators
+    to the database; its status and progress live in the video_jobs table, so they
+    survive the request that submitted it. At most `max_pending` jobs wait for one of
+    the `workers` threads; `submit` refuses more instead of queueing without bound.
+    With `chunk_workers` > 1, videos longer than two `chunk_min_s` chunks are split
+    and processed by that many processes in parallel (see video_chunks.py).
+    """
+
+    def __init__(self, system, db, workers=1, max_pending=8, progress_interval_s=1.0, chunk_workers=1,
+                 chunk_min_s=120):
+        self.system = system
+        self.db = db
+        self.max_pending = max_pending
+        self.chunk_workers = chunk_workers
+        self.chunk_min_s = chunk_min_s
+        self.progress_interval_s = progress_interval_s
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+        # Jobs a previous process left behind can't be resumed, their partial output is useless
+        interrupted = db.fail_interrupted_video_jobs()
+        if interrupted:
+            print(f"[WARNING] Marked {interrupted} interrupted video job(s) as failed")
+
+        self._threads = []
+        for idx in range(max(1, workers)):
+            t = threading.Thread(target=self._worker_loop, name=f"video-job-{idx}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, video_path, filename, input_url=None):
+        """Queues a video and returns its job id. Raises JobQueueFull when too many jobs are waiting."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} video jobs are already waiting")
+            self._pending += 1
+        try:
+            job_id = self.db.create_video_job(filename, input_url)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._queue.put((job_id, video_path, filename))
+        return job_id
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._pending, "running": self._running, "max_pending": self.max_pending,
+                    "workers": len(self._threads)}
+
+    def _worker_loop(self):
+        while True:
+            job_id, video_path, filename = self._queue.get()
+            with self._lock:
+                self._pending -= 1
+                self._running += 1
+            try:
+                self._run(job_id, video_path, filename)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _run(self, job_id, video_path, filename):
+        self.db.update_video_job(job_id, status="running", started_at=now_timestamp())
+        started = time.perf_counter()
+        last_update = 0.0
+
+        def on_progress(frames_done, frames_total):
+            # Written at most once per interval, the job runs far faster than anyone polls it
+            nonlocal last_update
+            now = time.perf_counter()
+            if now - last_update >= self.progress_interval_s:
+                last_update = now
+                self.db.update_video_job(job_id, frames_done=frames_done, frames_total=frames_total,
+                                         elapsed_s=round(now - started, 2))
+
+        try:
+            stem = os.path.splitext(filename)[0]
+            output_name, name = f"job{job_id}_{stem}.mp4", f"job{job_id}_{filename}"
+            if self.chunk_workers > 1:
+                result = process_video_chunked(self.system, video_path, output_name, name=name,
+                                               workers=self.chunk_workers, min_chunk_s=self.chunk_min_s,
+                                               on_progress=on_progress)
+            else:
+                result = self.system.process_video(video_path, output_name, name=name, on_progress=on_progress)
+            elapsed = time.perf_counter() - started
+            self.db.complete_video_job(job_id, result["output_url"], result["frames"], round(elapsed, 2),
+                                       result["violators"])
+            log_event("INFO", "video_job_done", job=job_id, file=filename, frames=result["frames"],
+                      chunks=len(result.get("chunks", [])) or 1, violators=len(result["violators"]),
+                      seconds=round(elapsed, 1),
+                      fps=round(result["frames"] / elapsed, 1) if elapsed else None)
+        except Exception as e:
+            log_event("ERROR", "video_job_failed", key=job_id, job=job_id, file=filename, error=e)
+            self.db.update_video_job(job_id, status="failed", error=str(e), finished_at=now_timestamp(),
+                                     elapsed_s=round(time.perf_counter() - started, 2))
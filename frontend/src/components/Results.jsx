@@ -4,6 +4,7 @@ import { CaretLeft, CheckCircle, WarningCircle, IdentificationCard, DownloadSimp
 import '../index.css';
 
 const API_URL = 'http://127.0.0.1:5000';
+const MAX_VIOLATORS = 200; // matches the backend's per-stream ring buffer
 
 function Results() {
     const location = useLocation();
@@ -20,7 +21,14 @@ function Results() {
             eventSource.onmessage = (event) => {
                 try {
                     const data = JSON.parse(event.data);
-                    setVideoStats(data);
+                    // Messages only carry violators added or updated since the last one,
+                    // unless `reset` marks a full snapshot
+                    setVideoStats(prev => {
+                        const byId = new Map((data.reset ? [] : prev.violators).map(v => [v.id, v]));
+                        data.violators.forEach(v => byId.set(v.id, v));
+                        const violators = Array.from(byId.values()).sort((a, b) => a.id - b.id).slice(-MAX_VIOLATORS);
+                        return { ...data, violators };
+                    });
                 } catch (e) {
                     console.error("Error parsing SSE video stats", e);
                 }